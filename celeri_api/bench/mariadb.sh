@@ -0,0 +1,32 @@
+#!/bin/bash
+# MariaDB jetable pour le banc de test : ./mariadb.sh start | stop
+set -e
+
+NAME=${BENCH_DB_CONTAINER:-celeri-bench-db}
+PORT=${BENCH_DB_PORT:-3307}
+PASSWORD=${BENCH_DB_PASSWORD:-bench}
+DATABASE=${BENCH_DB_NAME:-celeri_bench}
+IMAGE=${BENCH_DB_IMAGE:-mariadb:11}
+DIR=$(cd "$(dirname "$0")" && pwd)
+
+case "$1" in
+  start)
+    docker run --rm -d --name "$NAME" -p "$PORT:3306" \
+      -e MARIADB_ROOT_PASSWORD="$PASSWORD" -e MARIADB_DATABASE="$DATABASE" \
+      --tmpfs /var/lib/mysql "$IMAGE" > /dev/null
+    echo "⏳ Attente de MariaDB ($NAME, port $PORT)..."
+    until docker exec "$NAME" mariadb -uroot -p"$PASSWORD" -e "SELECT 1" "$DATABASE" > /dev/null 2>&1; do
+      sleep 1
+    done
+    docker exec -i "$NAME" mariadb -uroot -p"$PASSWORD" "$DATABASE" < "$DIR/schema.sql"
+    echo "✅ MariaDB prête : 127.0.0.1:$PORT, base $DATABASE, root / $PASSWORD"
+    ;;
+  stop)
+    docker rm -f "$NAME" > /dev/null
+    echo "🗑️ $NAME supprimé"
+    ;;
+  *)
+    echo "usage : $0 start|stop" >&2
+    exit 1
+    ;;
+esac
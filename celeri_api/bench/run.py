@@ -0,0 +1,284 @@
+"""Charge HTTP réaliste contre l'add-on et mesure débit et latences par route.
+
+Démarre main:app sous gunicorn (mêmes options que run.sh) avec un fichier d'options
+pointant vers la base du banc, joue un mélange de trafic Home Assistant pendant
+--duration secondes et écrit un résultat JSON (p50 / p95 / p99 par route).
+
+    python run.py --mix ha --duration 60 --concurrency 8 --output baseline.json
+    python run.py --compare baseline.json --output after.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import requests
+
+from seed import CAPTEURS, AUTOMATIONS
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ------------------------------------------------------
+# Scénarios : chaque appel renvoie une liste de (route, méthode, chemin, corps JSON)
+# ------------------------------------------------------
+
+def status_poll(ctx):
+    # tableau de bord HA : statut du jour + un jour au hasard
+    jour = date.today() - timedelta(days=random.randrange(365))
+    return [
+        ("GET /api/status_du_jour", "GET", "/api/status_du_jour", None),
+        ("GET /presence/{jour}", "GET", f"/presence/{jour}", None),
+        ("GET /loue/{jour}", "GET", f"/loue/{jour}", None),
+    ]
+
+
+def sensor_burst(ctx):
+    # relevé horaire : une écriture par capteur, puis le même relevé en lot
+    jour, heure = date.today().isoformat(), random.randrange(24)
+    calls = [
+        ("POST /capteurs/heure", "POST", "/capteurs/heure",
+         {"capteur": capteur, "jour": jour, "heure": heure, "valeur": round(random.uniform(15, 25), 2)})
+        for capteur in ctx["capteurs"]
+    ]
+    calls.append(("POST /capteurs/batch", "POST", "/capteurs/batch", {"lectures": [
+        {"capteur": capteur, "jour": jour, "heure": heure, "valeur": round(random.uniform(15, 25), 2)}
+        for capteur in ctx["capteurs"]
+    ]}))
+    return calls
+
+
+def trace_storm(ctx):
+    # rafale d'automatisations déclenchées en même temps
+    return [
+        ("POST /trace_automation", "POST", "/trace_automation",
+         {"automation_name": random.choice(AUTOMATIONS), "status": "ok"})
+        for _ in range(random.randint(5, 20))
+    ]
+
+
+def stats_dashboard(ctx):
+    capteurs = ",".join(ctx["capteurs"][:3])
+    return [
+        ("GET /stats/presence/annee", "GET", "/stats/presence/annee", None),
+        ("GET /stats/airbnb/mois", "GET", "/stats/airbnb/mois", None),
+        ("GET /stats/rapports/pratiques/annee", "GET", "/stats/rapports/pratiques/annee", None),
+        ("GET /stats/capteurs/mois", "GET", f"/stats/capteurs/mois?capteur={ctx['capteurs'][0]}", None),
+        ("GET /stats/capteurs", "GET", f"/stats/capteurs?capteurs={capteurs}&periode=mois", None),
+    ]
+
+
+def day_updates(ctx):
+    jour = date.today() - timedelta(days=random.randrange(30))
+    flag = random.choice(["presence", "teletravail", "cheminee"])
+    return [(f"PUT /{flag}/{{jour}}", "PUT", f"/{flag}/{jour}", {flag: random.random() < 0.5})]
+
+
+SCENARIOS = {
+    "status": status_poll,
+    "capteurs": sensor_burst,
+    "traces": trace_storm,
+    "stats": stats_dashboard,
+    "jours": day_updates,
+}
+
+# poids relatifs d'un Home Assistant typique
+MIXES = {
+    "ha": {"status": 50, "capteurs": 10, "traces": 15, "stats": 10, "jours": 15},
+    "lecture": {"status": 60, "stats": 40},
+    "ecriture": {"capteurs": 40, "traces": 40, "jours": 20},
+}
+
+
+# ------------------------------------------------------
+# Serveur
+# ------------------------------------------------------
+
+def start_server(args, workdir):
+    options = {
+        "DB_HOST": args.db_host,
+        "DB_USER": args.db_user,
+        "DB_PASSWORD": args.db_password,
+        "DB_NAME": args.db_name,
+        "DB_PORT": args.db_port,
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "SCHEDULER_ENABLED": False,
+    }
+    options.update(json.loads(args.options) if args.options else {})
+    options_path = os.path.join(workdir, "options.json")
+    with open(options_path, "w") as f:
+        json.dump(options, f)
+
+    env = dict(os.environ, CELERI_OPTIONS=options_path)
+    log = open(os.path.join(workdir, "server.log"), "w")
+    server = subprocess.Popen(
+        ["gunicorn", "main:app", "--bind", f"127.0.0.1:{args.port}", "-w", str(args.workers),
+         "-k", "uvicorn.workers.UvicornWorker"],
+        cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"❌ Le serveur s'est arrêté, voir {log.name}")
+        try:
+            requests.get(base_url + "/", timeout=1)
+            return server, base_url
+        except requests.RequestException:
+            time.sleep(0.5)
+    server.terminate()
+    sys.exit("❌ Le serveur n'a pas démarré en 60 s")
+
+
+# ------------------------------------------------------
+# Charge
+# ------------------------------------------------------
+
+def percentile(sorted_values, p):
+    # rang le plus proche
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def run_load(base_url, mix, duration, concurrency, warmup, ctx):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {}   # route -> [(durée s, ok)]
+    lock = threading.Lock()
+    stop_at = time.time() + warmup + duration
+    record_from = time.time() + warmup
+
+    def worker():
+        session = requests.Session()
+        while time.time() < stop_at:
+            scenario = SCENARIOS[random.choices(names, weights)[0]]
+            for route, method, path, body in scenario(ctx):
+                started = time.perf_counter()
+                try:
+                    response = session.request(method, base_url + path, json=body, timeout=30)
+                    ok = response.status_code < 400
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                if time.time() >= record_from:
+                    with lock:
+                        samples.setdefault(route, []).append((elapsed, ok))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    return samples
+
+
+def summarize(values, duration):
+    durations = sorted(d for d, _ in values)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "count": len(values),
+        "errors": sum(1 for _, ok in values if not ok),
+        "rps": round(len(values) / duration, 2),
+        "mean_ms": ms(sum(durations) / len(durations)) if durations else None,
+        "p50_ms": ms(percentile(durations, 50)),
+        "p95_ms": ms(percentile(durations, 95)),
+        "p99_ms": ms(percentile(durations, 99)),
+        "max_ms": ms(durations[-1]) if durations else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result, baseline=None):
+    print(f"{'route':40s} {'n':>7s} {'err':>5s} {'rps':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s}")
+    for route, stats in sorted(result["routes"].items()) + [("TOTAL", result["total"])]:
+        line = (f"{route:40s} {stats['count']:>7d} {stats['errors']:>5d} {stats['rps']:>8.1f} "
+                f"{stats['p50_ms'] or 0:>8.1f} {stats['p95_ms'] or 0:>8.1f} {stats['p99_ms'] or 0:>8.1f}")
+        before = (baseline or {}).get("routes", {}).get(route) if route != "TOTAL" else (baseline or {}).get("total")
+        if before and before.get("p95_ms") and stats["p95_ms"]:
+            line += f"   p95 {100 * (stats['p95_ms'] - before['p95_ms']) / before['p95_ms']:+.0f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", default="ha", help=f"{', '.join(MIXES)} ou scénario seul ({', '.join(SCENARIOS)})")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2, help="workers gunicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="serveur déjà démarré (sinon gunicorn est lancé)")
+    parser.add_argument("--db-host", default="127.0.0.1")
+    parser.add_argument("--db-port", type=int, default=3307)
+    parser.add_argument("--db-user", default="root")
+    parser.add_argument("--db-password", default="bench")
+    parser.add_argument("--db-name", default="celeri_bench")
+    parser.add_argument("--capteurs", type=int, default=12)
+    parser.add_argument("--options", help="options supplémentaires de l'add-on, en JSON")
+    parser.add_argument("--output", default="bench_result.json")
+    parser.add_argument("--compare", help="résultat JSON de référence")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.mix in MIXES:
+        mix = MIXES[args.mix]
+    elif args.mix in SCENARIOS:
+        mix = {args.mix: 1}
+    else:
+        parser.error(f"mix inconnu : {args.mix}")
+    random.seed(args.seed)
+    ctx = {"capteurs": CAPTEURS[:args.capteurs]}
+
+    server = None
+    with tempfile.TemporaryDirectory(prefix="celeri-bench-") as workdir:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            server, base_url = start_server(args, workdir)
+        try:
+            samples = run_load(base_url, mix, args.duration, args.concurrency, args.warmup, ctx)
+        finally:
+            if server:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=30)
+
+    result = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "mix": mix,
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+        },
+        "routes": {route: summarize(values, args.duration) for route, values in samples.items()},
+        "total": summarize([v for values in samples.values() for v in values], args.duration),
+    }
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    print(f"📄 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
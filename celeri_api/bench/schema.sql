@@ -0,0 +1,54 @@
+-- Schéma de la base Celeri pour le banc de test (MariaDB 10.6+).
+-- Les tables de l'add-on (stats_mois, index des traces...) sont créées par l'add-on au démarrage.
+
+CREATE TABLE IF NOT EXISTS presence (
+    jour DATE NOT NULL PRIMARY KEY,
+    presence BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS teletravail (
+    jour DATE NOT NULL PRIMARY KEY,
+    teletravail BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS cheminee (
+    jour DATE NOT NULL PRIMARY KEY,
+    cheminee BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS airbnb_loue (
+    jour DATE NOT NULL PRIMARY KEY,
+    loue BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS rapport (
+    jour DATE NOT NULL PRIMARY KEY,
+    lieu ENUM('chambre', 'salon', 'autre') NOT NULL DEFAULT 'chambre',
+    lingerie ENUM('nue', 'string', 'pj') NOT NULL DEFAULT 'pj',
+    ejac ENUM('corps', 'vagin', 'faciale', 'bouche', 'anale', 'aucune') NOT NULL DEFAULT 'aucune',
+    fellation BOOLEAN NOT NULL DEFAULT FALSE,
+    cunnilingus BOOLEAN NOT NULL DEFAULT FALSE,
+    levrette BOOLEAN NOT NULL DEFAULT FALSE,
+    missionnaire BOOLEAN NOT NULL DEFAULT FALSE,
+    andromaque BOOLEAN NOT NULL DEFAULT FALSE,
+    sodomie BOOLEAN NOT NULL DEFAULT FALSE,
+    fouet BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS capteurs (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    jour DATE NOT NULL,
+    capteur VARCHAR(64) NOT NULL,
+    h00 FLOAT NULL, h01 FLOAT NULL, h02 FLOAT NULL, h03 FLOAT NULL, h04 FLOAT NULL, h05 FLOAT NULL,
+    h06 FLOAT NULL, h07 FLOAT NULL, h08 FLOAT NULL, h09 FLOAT NULL, h10 FLOAT NULL, h11 FLOAT NULL,
+    h12 FLOAT NULL, h13 FLOAT NULL, h14 FLOAT NULL, h15 FLOAT NULL, h16 FLOAT NULL, h17 FLOAT NULL,
+    h18 FLOAT NULL, h19 FLOAT NULL, h20 FLOAT NULL, h21 FLOAT NULL, h22 FLOAT NULL, h23 FLOAT NULL,
+    UNIQUE KEY uq_capteurs_jour_capteur (jour, capteur)
+);
+
+CREATE TABLE IF NOT EXISTS automation_traces (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    automation_name VARCHAR(255) NOT NULL,
+    executed_at DATETIME NOT NULL,
+    status VARCHAR(64) NOT NULL
+);
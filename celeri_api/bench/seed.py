@@ -0,0 +1,145 @@
+"""Remplit la base du banc de test avec plusieurs années de données synthétiques.
+
+    python seed.py --years 5 --capteurs 12 --traces-per-day 150
+"""
+import argparse
+import math
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import mysql.connector
+
+CAPTEURS = ["salon", "chambre", "cuisine", "bureau", "sdb", "exterieur", "garage", "cave",
+            "grenier", "entree", "buanderie", "veranda", "chambre_amis", "cellier", "atelier", "serre"]
+AUTOMATIONS = ["volets_matin", "volets_soir", "chauffage_eco", "chauffage_confort", "lumiere_entree",
+               "alarme_on", "alarme_off", "arrosage", "notification_porte", "presence_update"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3307)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--database", default="celeri_bench")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--capteurs", type=int, default=12, help=f"nombre de capteurs (max {len(CAPTEURS)})")
+    parser.add_argument("--traces-per-day", type=int, default=150)
+    parser.add_argument("--batch", type=int, default=1000, help="lignes par INSERT multi-lignes")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def insert_rows(conn, table, columns, rows, batch):
+    cursor = conn.cursor()
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    for i in range(0, len(rows), batch):
+        chunk = rows[i:i + batch]
+        params = [value for row in chunk for value in row]
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([placeholders] * len(chunk))}",
+            params
+        )
+    conn.commit()
+    cursor.close()
+    return len(rows)
+
+
+def days(start, end):
+    jour = start
+    while jour <= end:
+        yield jour
+        jour += timedelta(days=1)
+
+
+def seed_day_flags(conn, start, end, batch):
+    # présence élevée, télétravail en semaine, cheminée l'hiver, location l'été
+    rows = {"presence": [], "teletravail": [], "cheminee": [], "airbnb_loue": []}
+    for jour in days(start, end):
+        hiver = jour.month in (11, 12, 1, 2, 3)
+        ete = jour.month in (6, 7, 8)
+        rows["presence"].append((jour, random.random() < 0.8))
+        rows["teletravail"].append((jour, jour.weekday() < 5 and random.random() < 0.4))
+        rows["cheminee"].append((jour, hiver and random.random() < 0.5))
+        rows["airbnb_loue"].append((jour, random.random() < (0.7 if ete else 0.2)))
+    columns = {"presence": "presence", "teletravail": "teletravail", "cheminee": "cheminee", "airbnb_loue": "loue"}
+    return {table: insert_rows(conn, table, ("jour", columns[table]), table_rows, batch) for table, table_rows in rows.items()}
+
+
+def seed_rapport(conn, start, end, batch):
+    rows = []
+    for jour in days(start, end):
+        if random.random() < 0.3:
+            rows.append((
+                jour,
+                random.choice(["chambre", "salon", "autre"]),
+                random.choice(["nue", "string", "pj"]),
+                random.choice(["corps", "vagin", "faciale", "bouche", "anale", "aucune"]),
+                *(random.random() < 0.5 for _ in range(7)),
+            ))
+    columns = ("jour", "lieu", "lingerie", "ejac", "fellation", "cunnilingus", "levrette",
+               "missionnaire", "andromaque", "sodomie", "fouet")
+    return insert_rows(conn, "rapport", columns, rows, batch)
+
+
+def seed_capteurs(conn, start, end, nb_capteurs, batch):
+    # températures : saison + cycle journalier + bruit, quelques heures manquantes
+    rows = []
+    for jour in days(start, end):
+        saison = 10 * math.cos((jour.timetuple().tm_yday - 200) / 365 * 2 * math.pi)
+        for i, capteur in enumerate(CAPTEURS[:nb_capteurs]):
+            base = 19 + i % 3 if capteur != "exterieur" else 12
+            valeurs = []
+            for heure in range(24):
+                if random.random() < 0.01:
+                    valeurs.append(None)
+                else:
+                    cycle = 2 * math.sin((heure - 9) / 24 * 2 * math.pi)
+                    valeurs.append(round(base + saison * (0.2 if capteur != "exterieur" else 1) + cycle + random.gauss(0, 0.3), 2))
+            rows.append((jour, capteur, *valeurs))
+    columns = ("jour", "capteur") + tuple(f"h{heure:02d}" for heure in range(24))
+    return insert_rows(conn, "capteurs", columns, rows, batch)
+
+
+def seed_traces(conn, start, end, per_day, batch):
+    total = 0
+    rows = []
+    for jour in days(start, end):
+        for _ in range(max(0, int(random.gauss(per_day, per_day / 5)))):
+            executed_at = datetime.combine(jour, datetime.min.time()) + timedelta(seconds=random.randrange(86400))
+            rows.append((random.choice(AUTOMATIONS), executed_at, "ok" if random.random() < 0.97 else "error"))
+        if len(rows) >= 50000:
+            total += insert_rows(conn, "automation_traces", ("automation_name", "executed_at", "status"), rows, batch)
+            rows = []
+    total += insert_rows(conn, "automation_traces", ("automation_name", "executed_at", "status"), rows, batch)
+    return total
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    conn = mysql.connector.connect(host=args.host, port=args.port, user=args.user,
+                                   password=args.password, database=args.database)
+    cursor = conn.cursor()
+    for table in ("presence", "teletravail", "cheminee", "airbnb_loue", "rapport", "capteurs", "automation_traces"):
+        cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("DROP TABLE IF EXISTS stats_mois")
+    cursor.close()
+
+    end = date.today() + timedelta(days=60)
+    start = date(end.year - args.years, 1, 1)
+    started = time.perf_counter()
+    counts = seed_day_flags(conn, start, end, args.batch)
+    counts["rapport"] = seed_rapport(conn, start, end, args.batch)
+    counts["capteurs"] = seed_capteurs(conn, start, end, min(args.capteurs, len(CAPTEURS)), args.batch)
+    counts["automation_traces"] = seed_traces(conn, start, end, args.traces_per_day, args.batch)
+    conn.close()
+
+    for table, count in counts.items():
+        print(f"{table:20s} {count:>10d} lignes")
+    print(f"✅ Base remplie du {start} au {end} en {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,915 @@
 import logging
-from fastapi import FastAPI, HTTPException
+from logging.handlers import QueueHandler, QueueListener
+from fastapi import FastAPI, HTTPException, BackgroundTasks
 from pydantic import BaseModel, Field
 from datetime import date, datetime, timedelta
-from fastapi.responses import JSONResponse
+from decimal import Decimal
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from icalendar import Calendar
 import requests
 from enum import Enum
 from typing import Optional
+from fastapi import Query
 import json
 import logging
 import mysql.connector
+import asyncio
 import time
-from threading import Lock
+from threading import Lock, Condition, Event, Thread, local
+from collections import OrderedDict, deque
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import copy
+import fcntl
+import hashlib
+import os
+import queue
+import random
+import re
+import sqlite3
+import uuid
+from urllib.parse import quote
+import warnings
 import zoneinfo
+import numpy as np
 
 
 # TODO
 # repo GitHub en privé
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
-logger = logging.getLogger(__name__)
-
 
 def load_config():
-    with open("/data/options.json") as f:
+    # CELERI_OPTIONS : autre fichier d'options (banc de test hors Home Assistant)
+    with open(os.environ.get("CELERI_OPTIONS", "/data/options.json")) as f:
         return json.load(f)
 
 config = load_config()
 
+
+# ======================================================
+# LOGS (file d'attente + thread d'écriture)
+# ======================================================
+
+LOG_LEVEL = str(config.get("LOG_LEVEL", "info")).upper()
+LOG_FORMAT = config.get("LOG_FORMAT", "text")  # text | json
+
+
+class JsonLogFormatter(logging.Formatter):
+    # Une ligne JSON par enregistrement, pour un collecteur de logs
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogQueueHandler(QueueHandler):
+    # QueueHandler.prepare formate le message sur le thread appelant et efface exc_info :
+    # l'enregistrement est copié tel quel (msg, args, exc_info), le thread d'écriture le formate.
+    def prepare(self, record):
+        return copy.copy(record)
+
+
+class LogWriter:
+    # Les appels logger.* ne font qu'empiler l'enregistrement ; un thread le formate et
+    # l'écrit sur stderr. Une sortie lente ne retarde plus les réponses HTTP.
+    def __init__(self, handler):
+        self.handler = handler
+        self.queue = queue.SimpleQueue()
+        self.queue_handler = LogQueueHandler(self.queue)
+        self._listener = None
+
+    def start(self):
+        self._listener = QueueListener(self.queue, self.handler)
+        self._listener.start()
+
+    def stop(self):
+        # vide la file avant de rendre la main (arrêt du worker)
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+
+    def after_fork(self):
+        # le thread d'écriture n'existe pas dans un process forké : nouvelle file, nouveau thread
+        self.queue = queue.SimpleQueue()
+        self.queue_handler.queue = self.queue
+        self.start()
+
+
+def setup_logging():
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+
+    writer = LogWriter(handler)
+    root = logging.getLogger()
+    root.handlers = [writer.queue_handler]
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    # httpx journalise chaque requête en INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    writer.start()
+    os.register_at_fork(after_in_child=writer.after_fork)
+    atexit.register(writer.stop)
+    return writer
+
+
+log_writer = setup_logging()
+logger = logging.getLogger(__name__)
+
 DB_CONFIG = {
     "host": config["DB_HOST"],
     "user": config["DB_USER"],
     "password": config["DB_PASSWORD"],
     "database": config["DB_NAME"],
+    "port": int(config.get("DB_PORT", 3306)),
+}
+
+
+CACHE_DIR = config.get("CACHE_DIR", "/data/cache")
+
+
+def write_json_atomic(path: str, data):
+    # écriture atomique : les autres workers ne lisent jamais un fichier à moitié écrit
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp, path)
+
+
+class InvalidationSignal:
+    # Signal inter-workers : chaque bump() remplace un petit fichier dans CACHE_DIR,
+    # un simple stat() (inode + mtime) suffit aux autres workers pour voir le changement.
+    def __init__(self, directory, prefix):
+        self.directory = directory
+        self.prefix = prefix
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{self.prefix}_{name}.gen")
+
+    def current(self, name):
+        try:
+            st = os.stat(self._path(name))
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def bump(self, name):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(name)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(f"{os.getpid()} {time.time()}")
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("⚠️ Invalidation %s/%s impossible : %s", self.prefix, name, e)
+        return self.current(name)
+
+
+# ======================================================
+# MÉTRIQUES (format Prometheus, agrégées entre workers)
+# ======================================================
+
+METRICS_INTERVAL = float(config.get("METRICS_INTERVAL", 10))  # écriture de l'instantané du worker (s)
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS_HELP = {
+    "celeri_http_requests_total": ("counter", "Requêtes HTTP traitées"),
+    "celeri_http_requests_in_flight": ("gauge", "Requêtes HTTP en cours"),
+    "celeri_http_request_duration_seconds": ("histogram", "Durée des requêtes HTTP par route"),
+    "celeri_db_connect_seconds": ("histogram", "Durée d'ouverture d'une connexion MariaDB"),
+    "celeri_db_pool_wait_seconds": ("histogram", "Attente d'une connexion libre dans le pool"),
+    "celeri_db_query_seconds": ("histogram", "Durée des execute() MariaDB par type de requête"),
+    "celeri_db_pool_connections": ("gauge", "Connexions du pool par état"),
+    "celeri_db_pool_timeouts_total": ("counter", "Attentes du pool terminées en 503"),
+    "celeri_db_async_pool_connections": ("gauge", "Connexions du pool aiomysql par état (mode asynchrone)"),
+    "celeri_db_async_pool_timeouts_total": ("counter", "Attentes du pool aiomysql terminées en 503"),
+    "celeri_cache_requests_total": ("counter", "Lectures du cache des statistiques par résultat"),
+    "celeri_cache_evictions_total": ("counter", "Entrées évincées du cache des statistiques"),
+    "celeri_cache_invalidations_total": ("counter", "Invalidations du cache des statistiques"),
+    "celeri_calendar_fetch_seconds": ("histogram", "Durée des téléchargements iCal par flux et résultat"),
 }
 
 
+class Metrics:
+    # Compteurs, jauges et histogrammes du worker. Chaque worker écrit régulièrement un
+    # instantané metrics_{pid}.json dans CACHE_DIR ; /metrics additionne ceux de tous les workers.
+    def __init__(self, directory, buckets):
+        self.directory = directory
+        self.buckets = buckets
+        self._lock = Lock()
+        self._values = {}      # (type, nom, labels) -> valeur (compteur, jauge)
+        self._histograms = {}  # (nom, labels) -> [compte par bucket + inf, somme]
+        self._collectors = []  # fonctions appelées à chaque instantané
+        self._sections = {}    # nom -> fonction : données libres ajoutées à l'instantané
+        self._stop = Event()
+        self._thread = None
+
+    def inc(self, name, labels=(), value=1):
+        key = ("counter", name, tuple(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def gauge_add(self, name, value, labels=()):
+        key = ("gauge", name, tuple(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=()):
+        key = (name, tuple(labels))
+        i = bisect_left(self.buckets, seconds)  # premier bucket tel que seconds <= le, sinon +Inf
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][i] += 1
+            histogram[1] += seconds
+
+    def add_collector(self, func):
+        # func() -> [(type, nom, labels, valeur)] : valeurs lues au moment de l'instantané
+        self._collectors.append(func)
+
+    def add_section(self, name, func):
+        self._sections[name] = func
+
+    def snapshot(self):
+        with self._lock:
+            values = [[kind, name, list(labels), value] for (kind, name, labels), value in self._values.items()]
+            histograms = [[name, list(labels), counts[:], total] for (name, labels), (counts, total) in self._histograms.items()]
+        for collector in self._collectors:
+            try:
+                values += [[kind, name, list(labels), value] for kind, name, labels, value in collector()]
+            except Exception as e:
+                logger.warning("⚠️ Collecte de métriques en échec : %s", e)
+        snapshot = {"pid": os.getpid(), "buckets": list(self.buckets), "values": values, "histograms": histograms}
+        for name, func in self._sections.items():
+            snapshot[name] = func()
+        return snapshot
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"metrics_{pid}.json")
+
+    def write_snapshot(self):
+        try:
+            write_json_atomic(self._path(os.getpid()), self.snapshot())
+        except OSError as e:
+            logger.warning("⚠️ Instantané des métriques non écrit : %s", e)
+
+    def snapshots(self):
+        # instantané frais pour ce worker, fichiers pour les autres ; ceux des workers morts sont supprimés
+        snapshots = [self.snapshot()]
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            if not name.startswith("metrics_") or not name.endswith(".json"):
+                continue
+            try:
+                pid = int(name[len("metrics_"):-len(".json")])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            if not _pid_alive(pid):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def collect(self):
+        snapshots = self.snapshots()
+        values, histograms = {}, {}
+        for snapshot in snapshots:
+            if snapshot.get("buckets") != list(self.buckets):
+                continue
+            for kind, name, labels, value in snapshot["values"]:
+                key = (kind, name, tuple(tuple(label) for label in labels))
+                values[key] = values.get(key, 0) + value
+            for name, labels, counts, total in snapshot["histograms"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return values, histograms, len(snapshots)
+
+    def render(self):
+        values, histograms, workers = self.collect()
+        families = {}  # nom -> [(labels, lignes)]
+        for (kind, name, labels), value in values.items():
+            families.setdefault(name, []).append((labels, [f"{name}{_format_labels(labels)} {value}"]))
+        for (name, labels), (counts, total) in histograms.items():
+            lines = []
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {round(total, 6)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+            families.setdefault(name, []).append((labels, lines))
+
+        out = [
+            "# HELP celeri_workers Workers gunicorn agrégés",
+            "# TYPE celeri_workers gauge",
+            f"celeri_workers {workers}",
+        ]
+        for name in sorted(families):
+            kind, help_text = METRICS_HELP.get(name, ("untyped", name))
+            out += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for _, lines in sorted(families[name]):
+                out += lines
+        return "\n".join(out) + "\n"
+
+    def start(self, interval):
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.write_snapshot()
+
+        self.write_snapshot()
+        self._thread = Thread(target=loop, name="metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        try:
+            os.remove(self._path(os.getpid()))
+        except OSError:
+            pass
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+metrics = Metrics(CACHE_DIR, METRICS_BUCKETS)
+
+
 def get_connection():
     logger.debug("Creating new database connection")
     return mysql.connector.connect(**DB_CONFIG)
 
 
+# ======================================================
+# POOL DE CONNEXIONS MARIADB (un pool par worker gunicorn)
+# ======================================================
+
+DB_POOL_SIZE = int(config.get("DB_POOL_SIZE", 4))
+DB_POOL_TIMEOUT = float(config.get("DB_POOL_TIMEOUT", 10))       # attente max d'une connexion libre (s)
+DB_POOL_PING_AFTER = float(config.get("DB_POOL_PING_AFTER", 30))  # ping si la connexion dort depuis plus de N s
+DB_POOL_RECYCLE = float(config.get("DB_POOL_RECYCLE", 3600))      # reconnexion forcée au-delà de N s
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, size, timeout, ping_after, recycle):
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.recycle = recycle
+        self.pid = os.getpid()
+
+        self._cond = Condition()
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._created_at = {}
+        self._open = 0
+
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.waiting = 0
+        self.created = 0
+        self.discarded = 0
+        self.reconnects = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+
+    def _connect(self):
+        started = time.perf_counter()
+        conn = get_connection()
+        metrics.observe("celeri_db_connect_seconds", time.perf_counter() - started)
+        self._created_at[id(conn)] = time.monotonic()
+        self.created += 1
+        return conn
+
+    def _close(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _check(self, conn, created_at, last_used):
+        now = time.monotonic()
+        if now - created_at > self.recycle:
+            logger.debug("♻️ Connexion recyclée (trop ancienne)")
+            self._close(conn)
+            self.reconnects += 1
+            return self._connect()
+        if now - last_used > self.ping_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception as e:
+                logger.warning("⚠️ Connexion MariaDB morte, reconnexion : %s", e)
+                self._close(conn)
+                self.reconnects += 1
+                return self._connect()
+        return conn
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        entry = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    # LIFO : on réutilise la connexion la plus chaude
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"Aucune connexion libre après {self.timeout}s (pool={self.size})")
+                self.waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            self.wait_time += time.monotonic() - start
+        metrics.observe("celeri_db_pool_wait_seconds", time.monotonic() - start)
+
+        try:
+            if entry is None:
+                return self._connect()
+            return self._check(*entry)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self.checked_out -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, broken=False):
+        if not broken:
+            try:
+                # jamais de transaction pendante dans le pool
+                if conn.in_transaction:
+                    conn.rollback()
+            except Exception:
+                broken = True
+
+        with self._cond:
+            self.checked_out -= 1
+            if broken:
+                self._open -= 1
+                self.discarded += 1
+            else:
+                self._idle.append((conn, self._created_at.get(id(conn), time.monotonic()), time.monotonic()))
+            self._cond.notify()
+
+        if broken:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pid": self.pid,
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "waiting": self.waiting,
+                "created": self.created,
+                "reconnects": self.reconnects,
+                "discarded": self.discarded,
+                "timeouts": self.timeouts,
+                "wait_time_ms": round(self.wait_time * 1000, 1),
+            }
+
+
+_pool = None
+_pool_lock = Lock()
+
+def get_pool():
+    global _pool
+    # un pool par process : gunicorn forke ses workers après l'import
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(SYNC_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER, DB_POOL_RECYCLE)
+    return _pool
+
+
+def _is_connection_error(e):
+    errors = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+    return isinstance(e, errors) or isinstance(e.__context__, errors)
+
+
+def _pool_metrics():
+    pool = get_pool().stats()
+    return [
+        ("gauge", "celeri_db_pool_connections", (("state", "checked_out"),), pool["checked_out"]),
+        ("gauge", "celeri_db_pool_connections", (("state", "idle"),), pool["idle"]),
+        ("gauge", "celeri_db_pool_connections", (("state", "waiting"),), pool["waiting"]),
+        ("counter", "celeri_db_pool_timeouts_total", (), pool["timeouts"]),
+    ]
+
+metrics.add_collector(_pool_metrics)
+
+
+def record_query(operation: str, params, seconds: float):
+    # type de requête : premier mot du SQL (select, insert, update...)
+    kind = operation.lstrip(" \n(").split(None, 1)[0].lower() if operation.strip() else "vide"
+    metrics.observe("celeri_db_query_seconds", seconds, (("operation", kind),))
+    query_profiler.record(operation, params, seconds)
+
+
+# ======================================================
+# PROFIL DES REQUÊTES SQL
+# ======================================================
+
+SLOW_QUERY_MS = float(config.get("SLOW_QUERY_MS", 500))              # seuil du journal des requêtes lentes
+SLOW_QUERY_EXPLAIN = bool(config.get("SLOW_QUERY_EXPLAIN", False))   # EXPLAIN automatique des SELECT lents
+SLOW_QUERY_EXPLAIN_EVERY = 3600       # au plus un EXPLAIN par empreinte et par heure
+QUERY_PROFILE_MAX_FINGERPRINTS = 500
+
+_FP_STRING = re.compile(r"'(?:[^'\\]|\\.)*'")
+_FP_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_FP_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_FP_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_FP_ROWS = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+
+
+def query_fingerprint(operation: str) -> str:
+    # SQL normalisé : valeurs et paramètres remplacés par ?, listes (IN, VALUES multi-lignes) réduites
+    sql = " ".join(operation.split())
+    sql = _FP_STRING.sub("?", sql)
+    sql = _FP_PLACEHOLDER.sub("?", sql)
+    sql = _FP_NUMBER.sub("?", sql)
+    sql = _FP_LIST.sub("(?+)", sql)
+    return _FP_ROWS.sub("(?+), ...", sql)
+
+
+def _short(value, limit=500) -> str:
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class QueryProfiler:
+    # Cumul par empreinte (nombre, temps total, max) dans le worker ; /debug/queries
+    # additionne les instantanés de tous les workers (comme /metrics).
+    def __init__(self, slow_ms, explain):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self._lock = Lock()
+        self._stats = {}      # empreinte -> {"count", "total", "max", "slow"}
+        self._plans = {}      # empreinte -> (horodatage, plan EXPLAIN)
+        self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+
+    def record(self, operation, params, seconds):
+        fingerprint = query_fingerprint(operation)
+        slow = seconds * 1000 >= self.slow_ms
+        with self._lock:
+            entry = self._stats.get(fingerprint)
+            if entry is None:
+                if len(self._stats) >= QUERY_PROFILE_MAX_FINGERPRINTS:
+                    fingerprint = "(autres)"
+                entry = self._stats.setdefault(fingerprint, {"count": 0, "total": 0.0, "max": 0.0, "slow": 0})
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["slow"] += slow
+        if not slow:
+            return
+
+        logger.warning("🐢 Requête lente (%.0f ms) : %s | params=%s", seconds * 1000, ' '.join(operation.split())[:1000], _short(params))
+        if self.explain and operation.lstrip(" \n(").lower().startswith("select"):
+            with self._lock:
+                last = self._plans.get(fingerprint)
+                if last and time.time() - last[0] < SLOW_QUERY_EXPLAIN_EVERY:
+                    return
+                self._plans[fingerprint] = (time.time(), None)
+            self._explainer.submit(self._explain, fingerprint, operation, params)
+
+    def _explain(self, fingerprint, operation, params):
+        # connexion dédiée, hors pool : le curseur d'origine peut avoir des lignes non lues
+        conn = None
+        try:
+            conn = get_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"EXPLAIN {operation}", params)
+            plan = cursor.fetchall()
+            cursor.close()
+        except Exception as e:
+            logger.warning("⚠️ EXPLAIN impossible : %s", e)
+            return
+        finally:
+            if conn is not None:
+                conn.close()
+        with self._lock:
+            self._plans[fingerprint] = (time.time(), plan)
+        logger.warning("🐢 EXPLAIN %s : %s", fingerprint[:200], json.dumps(plan, default=str))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                fingerprint: dict(entry, plan=self._plans.get(fingerprint, (None, None))[1])
+                for fingerprint, entry in self._stats.items()
+            }
+
+
+query_profiler = QueryProfiler(SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN)
+metrics.add_section("queries", query_profiler.snapshot)
+
+
+class InstrumentedCursor:
+    # Enveloppe fine d'un curseur mysql.connector : chronomètre execute() et executemany()
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            record_query(operation, params, time.perf_counter() - started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_query(operation, seq_params, time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    # Connexion du pool vue par les endpoints : seuls les curseurs sont enveloppés
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@contextmanager
+def db_connection():
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield InstrumentedConnection(conn)
+    except BaseException as e:
+        pool.release(conn, broken=_is_connection_error(e))
+        raise
+    else:
+        pool.release(conn)
+
+
+# ======================================================
+# MODE ASYNCHRONE : aiomysql + httpx sur la boucle du worker
+# ======================================================
+
+# Les endpoints de lecture les plus sollicités attendent la base et les calendriers
+# sans occuper de thread : la concurrence est bornée par le pool, plus par le threadpool.
+ASYNC_MODE = bool(config.get("ASYNC_MODE", False))
+DB_ASYNC_POOL_SIZE = int(config.get("DB_ASYNC_POOL_SIZE", 0))  # 0 : la moitié de DB_POOL_SIZE
+
+# Les écritures, la synchro calendrier, les tâches planifiées et les exports restent sur le pool
+# synchrone : les deux pools d'un worker se partagent DB_POOL_SIZE connexions.
+if ASYNC_MODE:
+    import aiomysql
+    import httpx
+
+    ASYNC_POOL_SIZE = max(min(DB_ASYNC_POOL_SIZE or DB_POOL_SIZE // 2, DB_POOL_SIZE - 1), 1)
+    SYNC_POOL_SIZE = max(DB_POOL_SIZE - ASYNC_POOL_SIZE, 1)
+else:
+    ASYNC_POOL_SIZE, SYNC_POOL_SIZE = 0, DB_POOL_SIZE
+
+
+class AsyncBackend:
+    # Pool aiomysql et client httpx d'un worker, créés dans le lifespan (boucle asyncio du worker)
+    def __init__(self, size, timeout, recycle):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pool = None
+        self.http = None
+        self.waiting = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+
+    async def start(self, http_timeout):
+        # autocommit : un SELECT ne laisse pas de transaction ouverte, que le pool fermerait au retour
+        self.pool = await aiomysql.create_pool(
+            host=DB_CONFIG["host"],
+            port=DB_CONFIG["port"],
+            user=DB_CONFIG["user"],
+            password=DB_CONFIG["password"],
+            db=DB_CONFIG["database"],
+            minsize=0,
+            maxsize=self.size,
+            pool_recycle=int(self.recycle),
+            autocommit=True,
+        )
+        self.http = httpx.AsyncClient(timeout=http_timeout, follow_redirects=True)
+        logger.info("⚡ Mode asynchrone : pool aiomysql de %s connexion(s), pool synchrone de %s", self.size, SYNC_POOL_SIZE)
+
+    async def stop(self):
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            conn = await asyncio.wait_for(self.pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeout(f"aucune connexion libre après {self.timeout}s ({self.size} en cours)")
+        finally:
+            self.waiting -= 1
+            self.wait_time += time.monotonic() - start
+        metrics.observe("celeri_db_pool_wait_seconds", time.monotonic() - start)
+        try:
+            yield conn
+        except BaseException:
+            # état inconnu (requête interrompue, connexion perdue) : jamais rendue au pool
+            await self._discard(conn)
+            raise
+        self.pool.release(conn)
+
+    async def _discard(self, conn):
+        # Pool.release d'une connexion fermée libère sa place sans réveiller les requêtes en attente :
+        # Pool.clear les prévient (il ne ferme que des connexions libres, il n'y en a pas si quelqu'un attend).
+        conn.close()
+        self.pool.release(conn)
+        if self.waiting:
+            await self.pool.clear()
+
+    def stats(self):
+        if self.pool is None:
+            return {"enabled": ASYNC_MODE}
+        return {
+            "enabled": ASYNC_MODE,
+            "pid": os.getpid(),
+            "size": self.pool.maxsize,
+            "open": self.pool.size,
+            "idle": self.pool.freesize,
+            "checked_out": self.pool.size - self.pool.freesize,
+            "waiting": self.waiting,
+            "timeouts": self.timeouts,
+            "wait_time_ms": round(self.wait_time * 1000, 1),
+        }
+
+
+async def aexecute(cursor, operation, params=None):
+    # équivalent d'InstrumentedCursor.execute pour un curseur aiomysql
+    started = time.perf_counter()
+    try:
+        return await cursor.execute(operation, params)
+    finally:
+        record_query(operation, params, time.perf_counter() - started)
+
+
+async_backend = AsyncBackend(ASYNC_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE)
+
+
+def _async_pool_metrics():
+    pool = async_backend.stats()
+    if "open" not in pool:
+        return []
+    return [
+        ("gauge", "celeri_db_async_pool_connections", (("state", "checked_out"),), pool["checked_out"]),
+        ("gauge", "celeri_db_async_pool_connections", (("state", "idle"),), pool["idle"]),
+        ("gauge", "celeri_db_async_pool_connections", (("state", "waiting"),), pool["waiting"]),
+        ("counter", "celeri_db_async_pool_timeouts_total", (), pool["timeouts"]),
+    ]
+
+metrics.add_collector(_async_pool_metrics)
+
+
+# ======================================================
+# SCHÉMA : index requis par les écritures groupées
+# ======================================================
+
+def find_index(cursor, table: str, columns: tuple, unique: bool = False) -> bool:
+    # Vrai si un index (unique si demandé) existe déjà sur ces colonnes ; lecture seule.
+    cursor.execute(
+        """
+        SELECT INDEX_NAME, NON_UNIQUE, GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX)
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        GROUP BY INDEX_NAME, NON_UNIQUE
+        """,
+        (table,)
+    )
+    for _, non_unique, index_columns in cursor.fetchall():
+        index_columns = tuple(index_columns.split(","))
+        if unique and not non_unique and set(index_columns) == set(columns):
+            return True
+        if not unique and index_columns[:len(columns)] == tuple(columns):
+            return True
+    return False
+
+
+def ensure_index(cursor, table: str, name: str, columns: tuple, unique: bool = False) -> bool:
+    # Vrai si l'index existe déjà, sinon tente de le créer (DDL : démarrage uniquement).
+    if find_index(cursor, table, columns, unique):
+        return True
+
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    logger.info("🛠️ Création de l'index %s sur %s (%s)", name, table, ', '.join(columns))
+    try:
+        cursor.execute(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})")
+        return True
+    except mysql.connector.Error as e:
+        logger.error("❌ Index %s impossible sur %s : %s", name, table, e)
+        return False
+
+
 AIRBNB_CAL_URL = "https://www.airbnb.fr/calendar/ical/32053854.ics?s=bee9bbc3a51315a4fa27ea2a09621aef"
 AIRBNB_CAL_URL2 = "https://www.airbnb.fr/calendar/ical/32057490.ics?s=0f91f1dc1e6c7f6ba3ddf82e0ca59c92"
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    metrics.start(METRICS_INTERVAL)
+    Thread(target=warm_calendar_cache, name="warmup", daemon=True).start()
+    Thread(target=init_rollups, name="rollups", daemon=True).start()
+    rollup_refresher.start()
+    Thread(target=ensure_schema, name="schema", daemon=True).start()
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+    if CAPTEURS_WRITE_BEHIND:
+        capteur_buffer.start()
+    if TRACES_QUEUE_ENABLED:
+        trace_writer.start()
+    if ASYNC_MODE:
+        await async_backend.start(CALENDAR_TIMEOUT)
+    yield
+    if ASYNC_MODE:
+        await async_backend.stop()
+    metrics.stop()
+    scheduler.stop()
+    rollup_refresher.stop()
+    if TRACES_QUEUE_ENABLED:
+        trace_writer.stop()
+    if CAPTEURS_WRITE_BEHIND:
+        capteur_buffer.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 from fastapi.requests import Request
 from fastapi.responses import PlainTextResponse
@@ -60,104 +921,689 @@ async def log_requests(request: Request, call_next):
     path = request.url.path
     method = request.method
 
-    logger.debug(f"🔹 {method} request to {path} from {ip}")
+    logger.debug("🔹 %s request to %s from %s", method, path, ip)
 
+    started = time.perf_counter()
+    status = 500
+    metrics.gauge_add("celeri_http_requests_in_flight", 1)
     try:
         response = await call_next(request)
+        status = response.status_code
         return response
     except Exception as e:
-        logger.error(f"❌ Error during {method} {path} from {ip}: {e}")
+        logger.error("❌ Error during %s %s from %s: %s", method, path, ip, e)
         raise
+    finally:
+        metrics.gauge_add("celeri_http_requests_in_flight", -1)
+        # gabarit de la route (/presence/{jour}) et non le chemin, pour borner le nombre de séries
+        route = request.scope.get("route")
+        route = getattr(route, "path", "inconnue")
+        metrics.observe("celeri_http_request_duration_seconds", time.perf_counter() - started, (("method", method), ("route", route)))
+        metrics.inc("celeri_http_requests_total", (("method", method), ("route", route), ("status", str(status))))
         
 
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    logger.error("⏳ Pool MariaDB saturé sur %s %s : %s", request.method, request.url.path, exc)
+    return JSONResponse(status_code=503, content={"detail": "Base de données saturée, réessayer plus tard"})
+
+
 @app.get("/")
 def read_root():
     logger.debug("GET / called")
     return {"message": "Hello from Celeri addon"}
 
 
-@app.post("/loue_sync_calendar")
-def loue_sync_calendar():
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-
+@app.get("/db/pool")
+def db_pool_stats():
+    # Statistiques du pool du worker qui répond (un pool par worker gunicorn)
+    stats = get_pool().stats()
+    if ASYNC_MODE:
+        stats["async"] = async_backend.stats()
+    return stats
+
+
+@app.get("/debug/queries")
+def debug_queries(limit: int = Query(default=20, ge=1, le=500), order: str = "total"):
+    # Requêtes SQL les plus coûteuses, tous workers confondus
+    if order not in ("total", "max", "count", "slow"):
+        raise HTTPException(status_code=400, detail="order : total, max, count ou slow")
+    merged = {}
+    snapshots = metrics.snapshots()
+    for snapshot in snapshots:
+        for fingerprint, entry in snapshot.get("queries", {}).items():
+            current = merged.setdefault(fingerprint, {"count": 0, "total": 0.0, "max": 0.0, "slow": 0, "plan": None})
+            current["count"] += entry["count"]
+            current["total"] += entry["total"]
+            current["max"] = max(current["max"], entry["max"])
+            current["slow"] += entry["slow"]
+            current["plan"] = current["plan"] or entry.get("plan")
+
+    top = sorted(merged.items(), key=lambda item: item[1][order], reverse=True)[:limit]
+    return {
+        "workers": len(snapshots),
+        "slow_query_ms": query_profiler.slow_ms,
+        "queries": [
+            {
+                "fingerprint": fingerprint,
+                "count": entry["count"],
+                "total_ms": round(entry["total"] * 1000, 1),
+                "avg_ms": round(entry["total"] * 1000 / entry["count"], 2),
+                "max_ms": round(entry["max"] * 1000, 1),
+                "slow": entry["slow"],
+                "plan": entry["plan"],
+            }
+            for fingerprint, entry in top
+        ],
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    # Format texte Prometheus, somme des instantanés de tous les workers
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+_sync_lock = Lock()
+
+def run_calendar_sync(horizon_days: int = 0):
+    # horizon_days = 0 : aujourd'hui et demain, on ne fait que marquer les jours réservés.
+    # horizon_days > 0 : réconciliation complète de [aujourd'hui, aujourd'hui + horizon_days],
+    #                    les jours libérés repassent à loue=0.
+    with _sync_lock:
         tz_paris = zoneinfo.ZoneInfo("Europe/Paris")
         today = datetime.now(tz_paris).date()
-        tomorrow = today + timedelta(days=1)
-        check_dates = [today, tomorrow]
-
-        for url in [AIRBNB_CAL_URL, AIRBNB_CAL_URL2]:
-            events = get_relevant_events(url, check_dates)
-            for check_date in check_dates:
-                is_res = any(e['start'] <= check_date < e['end'] and "Reserved" in e['summary'] 
-                             for e in events)
-                logger.info(f"Airbnb {url} - {check_date} - reserved: {is_res}")
-                if is_res:
-                    upsert_loue_date(cur, check_date, is_res)
+        last_day = today + timedelta(days=max(horizon_days, 1))
+
+        # Téléchargements en parallèle, avant d'ouvrir la connexion MariaDB
+        calendars = fetch_calendars(AIRBNB_CAL_URLS)
+        with _calendar_lock:
+            errors = {url: _calendar_errors[url] for url in AIRBNB_CAL_URLS if url in _calendar_errors}
+
+        index = get_reservation_index(calendars)
+        reserved = set(index.reserved_days(today, last_day))
+        logger.info("Airbnb - %s -> %s - %s jour(s) réservé(s)", today, last_day, len(reserved))
+
+        reconcile = horizon_days > 0
+        if reconcile and any(ics is None for ics, _ in calendars.values()):
+            # sans le contenu d'un flux, on ne sait pas quels jours sont vraiment libres
+            logger.warning("⚠️ Calendrier indisponible : seuls les jours réservés sont synchronisés")
+            reconcile = False
+
+        # valeurs actuelles lues dans les bitmaps : pas de connexion si rien ne change
+        current = day_flag_range(day_flag_years("loue"), today, last_day)
+        changes = []
+        jour = today
+        while jour <= last_day:
+            is_res = jour in reserved
+            if is_res and current.get(jour) is not True:
+                changes.append((jour, True))
+            elif reconcile and not is_res and current.get(jour) is True:
+                changes.append((jour, False))
+            jour += timedelta(days=1)
+
+        if changes:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                upsert_day_flags(cur, "airbnb_loue", "loue", changes)
+                conn.commit()
+                cur.close()
+            day_flags.write("loue", dict(changes))
+
+        for jour, loue in changes:
+            logger.debug("📅 Airbnb %s loué=%s", jour, loue)
 
-        conn.commit()
-        return {"status": "success", "message": "Synchronisation terminée."}
+        return {
+            "jours_verifies": (last_day - today).days + 1,
+            "jours_reserves": len(reserved),
+            "jours_modifies": len(changes),
+            "erreurs": errors,
+        }
+
+
+@app.post("/loue_sync_calendar")
+def loue_sync_calendar(horizon: int = Query(0, ge=0, le=3650)):
+    try:
+        result = run_calendar_sync(horizon)
+        return {"status": "success", "message": "Synchronisation terminée.", **result}
 
+    except PoolTimeout:
+        raise
     except Exception as e:
-        logger.error(f"❌ Erreur POST /loue_sync_calendar : {e}")
+        logger.error("❌ Erreur POST /loue_sync_calendar : %s", e)
         raise HTTPException(status_code=500, detail="Erreur base de données")
-    finally:
-        if conn:
-            conn.close()
 
 
-def get_relevant_events(cal_url: str, dates: list):
+# ======================================================
+# CALENDRIERS AIRBNB (téléchargement parallèle et conditionnel)
+# ======================================================
+
+AIRBNB_CAL_URLS = [AIRBNB_CAL_URL, AIRBNB_CAL_URL2]
+CALENDAR_TIMEOUT = float(config.get("CALENDAR_TIMEOUT", 7))
+CALENDAR_MAX_AGE = float(config.get("CALENDAR_MAX_AGE", 300))  # fraîcheur acceptée pour les lectures /loue/calendar
+_calendar_cache = {}   # url -> {"etag", "last_modified", "body", "fetched_at"}
+_calendar_indexes = {}  # empreinte sha256 du contenu -> ReservationIndex
+_calendar_errors = {}   # url -> dernière erreur de téléchargement
+_calendar_failures = {}  # url -> time.time() du dernier échec de téléchargement
+_calendar_lock = Lock()
+_calendar_executor = ThreadPoolExecutor(max_workers=len(AIRBNB_CAL_URLS), thread_name_prefix="calendar")
+
+
+def _calendar_cache_path(url: str) -> str:
+    return os.path.join(CACHE_DIR, f"calendar_{hashlib.sha1(url.encode()).hexdigest()[:16]}.json")
+
+
+def _load_calendar_entry(url: str):
+    with _calendar_lock:
+        entry = _calendar_cache.get(url)
+    if entry:
+        return entry
     try:
-        response = requests.get(cal_url, timeout=7)
-        response.raise_for_status()
-        cal = Calendar.from_ical(response.text)
-        
-        events = []
-        min_date, max_date = min(dates), max(dates)
- 
-        logger.info(f"🔍 Scan du calendrier : {cal_url} pour la période {min_date} à {max_date}")
+        with open(_calendar_cache_path(url)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _calendar_lock:
+        _calendar_cache[url] = entry
+    return entry
+
+
+def _store_calendar_entry(url: str, entry: dict):
+    with _calendar_lock:
+        _calendar_cache[url] = entry
+    try:
+        write_json_atomic(_calendar_cache_path(url), entry)
+    except OSError as e:
+        logger.warning("⚠️ Cache calendrier non écrit sur disque : %s", e)
+
+
+def _calendar_conditional(url: str, max_age: float):
+    # (entrée du cache disque, en-têtes conditionnels) ; en-têtes None si l'entrée est assez fraîche
+    entry = _load_calendar_entry(url)
+    if entry and time.time() - entry.get("fetched_at", 0) < max_age:
+        return entry, None
+    with _calendar_lock:
+        failed_at = _calendar_failures.get(url, 0)
+    if time.time() - failed_at < max_age:
+        # échec récent : pas de nouvel essai avant max_age, une panne Airbnb ne bloque pas chaque lecture
+        return entry, None
+
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return entry, headers
+
+
+def _calendar_feed(url: str) -> str:
+    return str(AIRBNB_CAL_URLS.index(url)) if url in AIRBNB_CAL_URLS else "autre"
+
+
+def _calendar_failed(url: str, entry, e):
+    logger.error("Erreur téléchargement %s: %s", url, e)
+    with _calendar_lock:
+        _calendar_errors[url] = str(e)
+        _calendar_failures[url] = time.time()
+    if entry:
+        logger.warning("⚠️ Utilisation de la dernière version connue de %s", url)
+        return entry["body"], False
+    return None, False
+
+
+def _calendar_fetched(url: str, entry, status: int, headers, body: str):
+    with _calendar_lock:
+        _calendar_errors.pop(url, None)
+        _calendar_failures.pop(url, None)
+    if status == 304 and entry:
+        logger.debug("📭 Calendrier inchangé (304) : %s", url)
+        entry["fetched_at"] = time.time()
+        return entry["body"], False
+
+    changed = not entry or entry["body"] != body
+    _store_calendar_entry(url, {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "body": body,
+        "fetched_at": time.time(),
+    })
+    return body, changed
+
+
+def fetch_calendar(url: str, max_age: float = 0):
+    # Renvoie (ics, modifié) ; ics vaut None si aucun contenu n'est disponible
+    entry, headers = _calendar_conditional(url, max_age)
+    if headers is None:
+        return (entry["body"] if entry else None), False
+
+    feed = _calendar_feed(url)
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, headers=headers, timeout=CALENDAR_TIMEOUT)
+        metrics.observe("celeri_calendar_fetch_seconds", time.perf_counter() - started, (("feed", feed), ("outcome", str(response.status_code))))
+        if response.status_code != 304 or not entry:
+            response.raise_for_status()
+    except Exception as e:
+        if not isinstance(e, requests.HTTPError):
+            metrics.observe("celeri_calendar_fetch_seconds", time.perf_counter() - started, (("feed", feed), ("outcome", "erreur")))
+        return _calendar_failed(url, entry, e)
+    return _calendar_fetched(url, entry, response.status_code, response.headers, response.text)
 
-        for component in cal.walk('VEVENT'):
-            
-            start_val = component.get('dtstart')
-            end_val = component.get('dtend')
 
-            if not start_val or not end_val:
-                continue
+def fetch_calendars(urls: list, max_age: float = 0) -> dict:
+    results = _calendar_executor.map(lambda url: fetch_calendar(url, max_age), urls)
+    return dict(zip(urls, results))
+
+
+async def fetch_calendar_async(url: str, max_age: float = 0):
+    # Même contrat que fetch_calendar, via le client httpx du worker : aucun thread bloqué
+    entry, headers = _calendar_conditional(url, max_age)
+    if headers is None:
+        return (entry["body"] if entry else None), False
 
-            dtstart = start_val.dt
-            dtend = end_val.dt
-            
-            if isinstance(dtstart, datetime): dtstart = dtstart.date()
-            if isinstance(dtend, datetime): dtend = dtend.date()
-
-            if dtstart <= max_date and dtend > min_date:
-                summary = str(component.get('summary', ''))
-                logger.info(f"✅ Événement trouvé : '{summary}' ({dtstart} -> {dtend})")
-                events.append({
-                    'start': dtstart,
-                    'end': dtend,
-                    'summary': summary
-                })
-                
-        return events
+    feed = _calendar_feed(url)
+    started = time.perf_counter()
+    try:
+        response = await async_backend.http.get(url, headers=headers)
+        metrics.observe("celeri_calendar_fetch_seconds", time.perf_counter() - started, (("feed", feed), ("outcome", str(response.status_code))))
+        if response.status_code != 304 or not entry:
+            response.raise_for_status()
     except Exception as e:
-        logger.error(f"Erreur téléchargement {cal_url}: {e}")
-        return []
+        if not isinstance(e, httpx.HTTPStatusError):
+            metrics.observe("celeri_calendar_fetch_seconds", time.perf_counter() - started, (("feed", feed), ("outcome", "erreur")))
+        return _calendar_failed(url, entry, e)
+    return _calendar_fetched(url, entry, response.status_code, response.headers, response.text)
+
+
+async def fetch_calendars_async(urls: list, max_age: float = 0) -> dict:
+    results = await asyncio.gather(*(fetch_calendar_async(url, max_age) for url in urls))
+    return dict(zip(urls, results))
+
+
+def parse_calendar_events(ics: str) -> list:
+    events = []
+    cal = Calendar.from_ical(ics)
+    for component in cal.walk('VEVENT'):
+
+        start_val = component.get('dtstart')
+        end_val = component.get('dtend')
+
+        if not start_val or not end_val:
+            continue
+
+        dtstart = start_val.dt
+        dtend = end_val.dt
+
+        if isinstance(dtstart, datetime): dtstart = dtstart.date()
+        if isinstance(dtend, datetime): dtend = dtend.date()
+
+        events.append({
+            'start': dtstart,
+            'end': dtend,
+            'summary': str(component.get('summary', ''))
+        })
+    return events
+
+
+class ReservationIndex:
+    # Intervalles [début, fin) des réservations, fusionnés et triés : recherche par bisection
+    def __init__(self, intervals):
+        merged = []
+        for start, end in sorted(i for i in intervals if i[1] > i[0]):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    @classmethod
+    def from_events(cls, events):
+        return cls((e['start'], e['end']) for e in events if "Reserved" in e['summary'])
+
+    def intervals(self):
+        return list(zip(self.starts, self.ends))
+
+    def is_reserved(self, jour: date) -> bool:
+        i = bisect_right(self.starts, jour) - 1
+        return i >= 0 and jour < self.ends[i]
+
+    def reserved_days(self, start: date, end: date) -> list:
+        # jours réservés dans [start, end] (bornes incluses)
+        days = []
+        i = max(bisect_right(self.starts, start) - 1, 0)
+        while i < len(self.starts) and self.starts[i] <= end:
+            current = max(self.starts[i], start)
+            last = min(self.ends[i] - timedelta(days=1), end)
+            while current <= last:
+                days.append(current)
+                current += timedelta(days=1)
+            i += 1
+        return days
+
+
+def _cache_calendar_index(key: str, index: ReservationIndex):
+    with _calendar_lock:
+        # seules les dernières versions des flux sont utiles
+        if len(_calendar_indexes) >= 4 * (len(AIRBNB_CAL_URLS) + 1):
+            _calendar_indexes.clear()
+        _calendar_indexes[key] = index
+
+
+def get_calendar_index(ics: str, key: str = None) -> ReservationIndex:
+    key = key or hashlib.sha256(ics.encode()).hexdigest()
+    with _calendar_lock:
+        index = _calendar_indexes.get(key)
+    if index is None:
+        index = ReservationIndex.from_events(parse_calendar_events(ics))
+        logger.info("🔍 Calendrier indexé : %s période(s) réservée(s)", len(index.starts))
+        _cache_calendar_index(key, index)
+    return index
+
+
+def get_reservation_index(calendars: dict) -> ReservationIndex:
+    # Index unique de tous les flux, mis en cache selon l'empreinte de chaque contenu
+    keys = {url: hashlib.sha256(ics.encode()).hexdigest()
+            for url, (ics, _) in calendars.items() if ics is not None}
+    combined_key = "+".join(keys[url] for url in sorted(keys))
+    with _calendar_lock:
+        index = _calendar_indexes.get(combined_key)
+    if index is not None:
+        return index
+
+    intervals = []
+    for url, key in keys.items():
+        try:
+            intervals.extend(get_calendar_index(calendars[url][0], key).intervals())
+        except Exception as e:
+            logger.error("Erreur lecture calendrier %s: %s", url, e)
+    index = ReservationIndex(intervals)
+    _cache_calendar_index(combined_key, index)
+    return index
+
+
+def warm_calendar_cache():
+    # Reconstruit l'index depuis le cache disque, sans appel réseau
+    calendars = {}
+    for url in AIRBNB_CAL_URLS:
+        entry = _load_calendar_entry(url)
+        calendars[url] = (entry["body"] if entry else None, False)
+    index = get_reservation_index(calendars)
+    logger.info("🔥 Cache calendrier préchauffé : %s période(s) réservée(s)", len(index.starts))
 
 
-def upsert_loue_date(cursor, jour: date, loue: bool):
-    logger.info(f"📅 Airbnb {jour.isoformat()} loué={loue}")
-    
-    cursor.execute(
-        """
-        INSERT INTO airbnb_loue (jour, loue)
-        VALUES (%s, %s)
-        ON DUPLICATE KEY UPDATE loue = VALUES(loue)
-        """,
-        (jour.isoformat(), loue)
-    )
+# ======================================================
+# PLANIFICATEUR (un seul worker gunicorn l'exécute)
+# ======================================================
+
+SCHEDULER_ENABLED = bool(config.get("SCHEDULER_ENABLED", True))
+SYNC_INTERVAL = float(config.get("SYNC_INTERVAL", 900))        # période de synchro calendrier (s)
+SYNC_JITTER = float(config.get("SYNC_JITTER", 60))             # +/- N s aléatoires à chaque planification
+SYNC_MAX_BACKOFF = float(config.get("SYNC_MAX_BACKOFF", 3600))  # délai max entre deux essais après échecs
+SYNC_HORIZON_DAYS = int(config.get("SYNC_HORIZON_DAYS", 0))     # 0 = aujourd'hui et demain, réservations seulement
+SCHEDULER_LOCK_PATH = os.path.join(CACHE_DIR, "scheduler.lock")
+SCHEDULER_STATUS_PATH = os.path.join(CACHE_DIR, "scheduler_status.json")
+
+
+class Job:
+    def __init__(self, name, func, interval, jitter=0, max_backoff=3600):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.next_run = time.time() + 5 + random.uniform(0, jitter)
+        self.status = {"last_run": None, "duration_ms": None, "outcome": None, "error": None}
+
+    def schedule_next(self):
+        if self.failures:
+            # backoff exponentiel : l'intervalle normal, doublé à chaque échec jusqu'à max_backoff
+            # (jamais plus tôt que l'intervalle normal, pour ne pas marteler une source en panne)
+            delay = min(self.interval * 2 ** (self.failures - 1), max(self.max_backoff, self.interval))
+        else:
+            delay = self.interval + random.uniform(-self.jitter, self.jitter)
+        self.next_run = time.time() + max(delay, 1)
+
+
+class Scheduler:
+    def __init__(self, lock_path, status_path):
+        self.lock_path = lock_path
+        self.status_path = status_path
+        self.jobs = []
+        self._lock_file = None
+        self._stop = Event()
+        self._thread = None
+
+    def add_job(self, job):
+        self.jobs.append(job)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @property
+    def is_leader(self):
+        return self._lock_file is not None
+
+    @property
+    def stopping(self):
+        # les tâches longues s'arrêtent entre deux lots quand l'add-on s'arrête
+        return self._stop.is_set()
+
+    def _try_lead(self):
+        # verrou fichier : relâché par l'OS si le worker leader meurt
+        try:
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            lock_file = open(self.lock_path, "a")
+        except OSError as e:
+            logger.warning("⚠️ Verrou du planificateur inaccessible : %s", e)
+            return False
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info("⏰ Planificateur actif dans le worker %s", os.getpid())
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self.is_leader and not self._try_lead():
+                self._stop.wait(30)
+                continue
+
+            for job in self.jobs:
+                if self._stop.is_set():
+                    break
+                if time.time() >= job.next_run:
+                    self._run_job(job)
+
+            next_run = min(job.next_run for job in self.jobs)
+            self._stop.wait(max(0.5, min(next_run - time.time(), 30)))
+
+    def _run_job(self, job):
+        started = time.time()
+        try:
+            job.func()
+            job.failures = 0
+            job.status.update(outcome="success", error=None)
+        except Exception as e:
+            job.failures += 1
+            job.status.update(outcome="error", error=str(e))
+            logger.error("❌ Tâche planifiée %s en échec (%s) : %s", job.name, job.failures, e)
+        job.status.update(
+            last_run=datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+            duration_ms=round((time.time() - started) * 1000, 1),
+        )
+        job.schedule_next()
+        self._write_status()
+
+    def _write_status(self):
+        status = {
+            "leader_pid": os.getpid(),
+            "jobs": {
+                job.name: dict(
+                    job.status,
+                    failures=job.failures,
+                    next_run=datetime.fromtimestamp(job.next_run).isoformat(timespec="seconds"),
+                )
+                for job in self.jobs
+            },
+        }
+        try:
+            write_json_atomic(self.status_path, status)
+        except OSError as e:
+            logger.warning("⚠️ Statut du planificateur non écrit : %s", e)
+
+    def read_status(self):
+        try:
+            with open(self.status_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"leader_pid": None, "jobs": {}}
+
+
+def scheduled_calendar_sync():
+    result = run_calendar_sync(SYNC_HORIZON_DAYS)
+    if result["erreurs"]:
+        raise RuntimeError(f"Calendrier(s) injoignable(s) : {', '.join(result['erreurs'])}")
+
+
+scheduler = Scheduler(SCHEDULER_LOCK_PATH, SCHEDULER_STATUS_PATH)
+scheduler.add_job(Job("calendar_sync", scheduled_calendar_sync, SYNC_INTERVAL, SYNC_JITTER, SYNC_MAX_BACKOFF))
+
+
+@app.get("/scheduler/status")
+def scheduler_status():
+    # Le statut est partagé via CACHE_DIR : n'importe quel worker peut répondre
+    status = scheduler.read_status()
+    status["enabled"] = SCHEDULER_ENABLED
+    status["worker_pid"] = os.getpid()
+    status["worker_is_leader"] = scheduler.is_leader
+    return status
+
+
+# ======================================================
+# TRACES D'AUTOMATISATIONS
+# ======================================================
+
+TRACES_QUEUE_ENABLED = bool(config.get("TRACES_QUEUE_ENABLED", True))
+TRACES_QUEUE_SIZE = int(config.get("TRACES_QUEUE_SIZE", 1000))      # traces en attente max par worker
+TRACES_BATCH_SIZE = int(config.get("TRACES_BATCH_SIZE", 200))       # écriture dès N traces...
+TRACES_FLUSH_MS = int(config.get("TRACES_FLUSH_MS", 500))           # ... ou au plus tard après N ms
+TRACES_PUT_TIMEOUT = float(config.get("TRACES_PUT_TIMEOUT", 0.5))   # attente max d'une place libre avant 503
+
+
+class TraceWriter:
+    # Les traces sont acquittées tout de suite et écrites en lot (executemany) par un thread.
+    # File bornée : quand la base ne suit plus, POST /trace_automation répond 503.
+    def __init__(self, maxsize, batch_size, flush_ms):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self._stop = Event()
+        self._thread = None
+        self.written = 0
+        self.rejected = 0
+        self.failures = 0
+
+    def submit(self, automation_name: str, status: str, timeout: float) -> bool:
+        # l'heure d'exécution est celle de la réception, pas celle de l'écriture
+        try:
+            self.queue.put((automation_name, datetime.now(), status), timeout=timeout)
+            return True
+        except queue.Full:
+            self.rejected += 1
+            return False
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_ms / 1000
+        while len(batch) < self.batch_size:
+            try:
+                if self._stop.is_set():
+                    batch.append(self.queue.get_nowait())
+                else:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(
+                    "INSERT INTO automation_traces (automation_name, executed_at, status) VALUES (%s, %s, %s)",
+                    batch
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def _loop(self):
+        batch, delay = [], 1
+        while True:
+            if not batch:
+                if self._stop.is_set() and self.queue.empty():
+                    break
+                batch = self._next_batch()
+                if not batch:
+                    continue
+            try:
+                self._write(batch)
+                logger.debug("📝 %s trace(s) écrite(s)", len(batch))
+                self.written += len(batch)
+                batch, delay = [], 1
+            except Exception as e:
+                # le lot est gardé et réessayé ; pendant ce temps la file se remplit
+                self.failures += 1
+                logger.error("❌ Écriture de %s trace(s) en échec : %s", len(batch), e)
+                if self._stop.is_set():
+                    logger.error("❌ %s trace(s) perdue(s) à l'arrêt", len(batch) + self.queue.qsize())
+                    break
+                self._stop.wait(delay)
+                delay = min(delay * 2, 60)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = Thread(target=self._loop, name="traces", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # vide la file avant de rendre la main
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+
+    def stats(self):
+        return {
+            "enabled": TRACES_QUEUE_ENABLED,
+            "worker_pid": os.getpid(),
+            "queued": self.queue.qsize(),
+            "maxsize": self.queue.maxsize,
+            "written": self.written,
+            "rejected": self.rejected,
+            "failures": self.failures,
+        }
+
+
+trace_writer = TraceWriter(TRACES_QUEUE_SIZE, TRACES_BATCH_SIZE, TRACES_FLUSH_MS)
 
 
 class Trace(BaseModel):
@@ -166,36 +1612,48 @@ class Trace(BaseModel):
 
 @app.post("/trace_automation")
 def trace_automation(trace: Trace):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO automation_traces (automation_name, executed_at, status) VALUES (%s, %s, %s)",
-        (trace.automation_name, datetime.now(), trace.status)
-    )
-    conn.commit()
-    cursor.close()
-    conn.close()
+    if TRACES_QUEUE_ENABLED:
+        if not trace_writer.submit(trace.automation_name, trace.status, TRACES_PUT_TIMEOUT):
+            logger.warning("⚠️ File des traces pleine, trace refusée : %s", trace.automation_name)
+            raise HTTPException(status_code=503, detail="File des traces pleine", headers={"Retry-After": "1"})
+        return JSONResponse(status_code=202, content={"message": "Trace Automatisation mise en file"})
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO automation_traces (automation_name, executed_at, status) VALUES (%s, %s, %s)",
+            (trace.automation_name, datetime.now(), trace.status)
+        )
+        conn.commit()
+        cursor.close()
     return {"message": "Trace Automatisation enregistrée"}
 
 
+@app.get("/trace_automation/queue")
+def trace_automation_queue():
+    # Compteurs de la file du worker qui répond
+    return trace_writer.stats()
+
+
 @app.get("/trace_automation_daily_report", response_class=PlainTextResponse)
 def trace_automation_daily_report():
-    conn = get_connection()
-    cursor = conn.cursor()
-
     today = date.today()
+    # intervalle semi-ouvert [aujourd'hui 00:00, demain 00:00) : l'index sur executed_at est utilisable
+    start = datetime.combine(today, datetime.min.time())
     query = """
     SELECT automation_name,
            status,
            executed_at
     FROM automation_traces
-    WHERE DATE(executed_at) = %s
+    WHERE executed_at >= %s AND executed_at < %s
     ORDER BY executed_at ASC
     """
 
-    cursor.execute(query, (today,))
-    rows = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, (start, start + timedelta(days=1)))
+        rows = cursor.fetchall()
+        cursor.close()
 
     if not rows:
         return "Aucune automatisation exécutée aujourd'hui."
@@ -209,322 +1667,545 @@ def trace_automation_daily_report():
     return "\n".join(report_lines)
 
 
-def execute_get_presence(cursor, conn, jour: str) -> bool:
-    cursor.execute("SELECT presence FROM presence WHERE jour = %s", (jour,))
-    row = cursor.fetchone()
-    if row:
-        logger.debug(f"✔️ Date trouvée: {jour} => presence={bool(row[0])}")
-        return bool(row[0])
-    else:
-        logger.info(f"❗ Date {jour} absente — ajout avec presence=False")
-        cursor.execute("INSERT INTO presence (jour, presence) VALUES (%s, %s)", (jour, False))
-        conn.commit()
-        return False
+TRACE_REPORT_MAX_LIMIT = 1000
 
-def execute_get_teletravail(cursor, conn, jour: str) -> bool:
-    cursor.execute("SELECT teletravail FROM teletravail WHERE jour = %s", (jour,))
-    row = cursor.fetchone()
-    if row:
-        logger.debug(f"✔️ Date trouvée: {jour} => teletravail={bool(row[0])}")
-        return bool(row[0])
-    else:
-        logger.info(f"❗ Date {jour} absente — ajout avec teletravail=False")
-        cursor.execute("INSERT INTO teletravail (jour, teletravail) VALUES (%s, %s)", (jour, False))
-        conn.commit()
-        return False
+# index utilisés par les rapports : plage sur executed_at, éventuellement pour une automatisation
+TRACE_INDEXES = [
+    ("idx_traces_executed_at", ("executed_at",)),
+    ("idx_traces_automation_executed_at", ("automation_name", "executed_at")),
+]
+SCHEMA_LOCK_PATH = os.path.join(CACHE_DIR, "schema.lock")
 
-def execute_get_cheminee(cursor, conn, jour: str) -> bool:
-    cursor.execute("SELECT cheminee FROM cheminee WHERE jour = %s", (jour,))
-    row = cursor.fetchone()
-    if row:
-        logger.debug(f"✔️ Date trouvée: {jour} => cheminee={bool(row[0])}")
-        return bool(row[0])
-    else:
-        logger.info(f"❗ Date {jour} absente — ajout avec cheminee=False")
-        cursor.execute("INSERT INTO cheminee (jour, cheminee) VALUES (%s, %s)", (jour, False))
-        conn.commit()
-        return False
 
-def execute_get_loue(cursor, conn, jour: str) -> bool:
-    cursor.execute("SELECT loue FROM airbnb_loue WHERE jour = %s", (jour,))
-    row = cursor.fetchone()
-    if row:
-        logger.debug(f"✔️ Date trouvée: {jour} => loue={bool(row[0])}")
-        return bool(row[0])
-    else:
-        logger.info(f"❗ Date {jour} absente — ajout avec loue=False")
-        cursor.execute("INSERT INTO airbnb_loue (jour, loue) VALUES (%s, %s)", (jour, False))
-        conn.commit()
-        return False
+def ensure_schema():
+    # Au démarrage, en tâche de fond : crée les index manquants (un worker à la fois).
+    # Jamais dans une requête : un CREATE INDEX sur une grosse table bloquerait une connexion du pool.
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(SCHEMA_LOCK_PATH, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                for name, columns in TRACE_INDEXES:
+                    ensure_index(cursor, "automation_traces", name, columns)
+                ensure_capteurs_unique_key(cursor)
+                cursor.close()
+    except Exception as e:
+        logger.error("❌ Vérification des index impossible : %s", e)
 
 
-@app.get("/api/status_du_jour")
-def get_status_du_jour():
-    logger.debug("📊 GET /api/status_du_jour (appel unifié)")
-    
-    today = date.today()
-    jour_str = today.isoformat()
-    hier_str = (today - timedelta(days=1)).isoformat()
-    demain_str = (today + timedelta(days=1)).isoformat()
+def _naive_local(value: datetime) -> datetime:
+    # executed_at est stocké en heure locale, sans fuseau
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
 
-    conn = get_connection()
-    cursor = conn.cursor()
 
+def _parse_trace_cursor(after: str):
+    # curseur de pagination : "<executed_at ISO>,<id>" de la dernière ligne reçue
     try:
-        # On enchaîne les fonctions sur la même connexion
-        presence = execute_get_presence(cursor, conn, jour_str)
-        teletravail = execute_get_teletravail(cursor, conn, jour_str)
-        cheminee = execute_get_cheminee(cursor, conn, jour_str)
-        airbnb_hier = execute_get_loue(cursor, conn, hier_str)
-        airbnb_aujourdhui = execute_get_loue(cursor, conn, jour_str)
-        airbnb_demain = execute_get_loue(cursor, conn, demain_str)
+        executed_at, trace_id = after.rsplit(",", 1)
+        return datetime.fromisoformat(executed_at), int(trace_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="after : curseur invalide")
+
+
+@app.get("/trace_automation/report")
+def trace_automation_report(
+    from_: datetime = Query(alias="from"),
+    to: datetime = Query(),
+    automation: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=TRACE_REPORT_MAX_LIMIT),
+    after: Optional[str] = None,
+):
+    # Traces de [from, to), triées par (executed_at, id) ; pagination par curseur (keyset) :
+    # la page suivante repart de la dernière ligne, sans OFFSET.
+    start, end = _naive_local(from_), _naive_local(to)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="to must be after from")
+
+    filtres = ["executed_at >= %s", "executed_at < %s"]
+    params = [start, end]
+    if automation:
+        filtres.append("automation_name = %s")
+        params.append(automation)
+    if after:
+        last_at, last_id = _parse_trace_cursor(after)
+        filtres.append("(executed_at > %s OR (executed_at = %s AND id > %s))")
+        params += [last_at, last_at, last_id]
+
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            f"""
+            SELECT id, automation_name, status, executed_at
+            FROM automation_traces
+            WHERE {' AND '.join(filtres)}
+            ORDER BY executed_at, id
+            LIMIT %s
+            """,
+            params + [limit + 1]
+        )
+        rows = cursor.fetchall()
+        cursor.close()
 
-        logger.info(f"📊 {jour_str} : Présence {presence} - Teletravail {teletravail} - Airbnb {airbnb_aujourdhui} - Airbnb demain {airbnb_demain}")
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['executed_at'].isoformat()},{rows[-1]['id']}"
+    return {"from": start, "to": end, "automation": automation, "traces": rows, "next": next_cursor}
 
-        return {
-            "jour": jour_str,
-            "presence": presence,
-            "teletravail": teletravail,
-            "cheminee": cheminee,
-            "airbnb_hier": airbnb_hier,
-            "airbnb_aujourdhui": airbnb_aujourdhui,
-            "airbnb_demain": airbnb_demain
-        }
 
-    except Exception as e:
-        logger.error(f"❌ Erreur /api/status_du_jour : {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+# ======================================================
+# JOURS : présence, télétravail, cheminée, loué
+# ======================================================
 
+# flag -> (table, colonne) : une ligne par jour, un booléen par ligne
+DAY_FLAGS = {
+    "presence": ("presence", "presence"),
+    "teletravail": ("teletravail", "teletravail"),
+    "cheminee": ("cheminee", "cheminee"),
+    "loue": ("airbnb_loue", "loue"),
+}
+
+BULK_CHUNK_SIZE = int(config.get("BULK_CHUNK_SIZE", 500))  # lignes par INSERT multi-lignes
+BULK_CHUNK_MAX = 10000  # même borne que l'option BULK_CHUNK_SIZE dans config.json
+INIT_MAX_DAYS = 3660  # période max d'un /*/init (une dizaine d'années)
+
+
+def upsert_day_flags(cursor, table: str, column: str, rows: list, chunk_size: int = None):
+    # INSERT multi-lignes : une requête par paquet de chunk_size jours, dans la transaction de l'appelant.
+    # table et column viennent toujours du code, jamais de la requête HTTP.
+    # Renvoie le nombre de lignes affectées selon MariaDB : 1 par insertion, 2 par modification, 0 si inchangée.
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    affected = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        placeholders = ", ".join(["(%s, %s)"] * len(chunk))
+        params = [value for jour, flag in chunk for value in (jour, flag)]
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (jour, {column})
+            VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE {column} = VALUES({column})
+            """,
+            params
+        )
+        affected += cursor.rowcount
+    return affected
 
 
+# ======================================================
+# BITMAPS DES JOURS (en mémoire, write-through, un par worker)
+# ======================================================
 
-@app.get("/presence/{jour}")
-def get_presence(jour: str):
-    logger.debug(f"🔎 GET /presence/{jour}")
-    conn = get_connection()
-    cursor = conn.cursor()
+DAY_FLAGS_MAX_AGE = float(config.get("DAY_FLAGS_MAX_AGE", 3600))  # rechargement de sécurité (s), 0 = jamais
+
+
+def _day_bit(jour: date) -> int:
+    return 1 << (jour.timetuple().tm_yday - 1)
+
+
+def _month_spans(annee: int) -> list:
+    # (premier bit, nombre de jours) de chaque mois de l'année
+    spans = []
+    for mois in range(1, 13):
+        start = date(annee, mois, 1)
+        spans.append((start.timetuple().tm_yday - 1, (_next_month(start) - start).days))
+    return spans
+
+
+def _with_days(years: dict, values: dict) -> dict:
+    # copie des bitmaps avec les jours donnés : valeur None = jour présent en base, valeur inchangée
+    years = dict(years)
+    for jour, value in values.items():
+        jour = _as_date(jour)
+        bit = _day_bit(jour)
+        known, ones = years.get(jour.year, (0, 0))
+        if value is not None:
+            ones = ones | bit if value else ones & ~bit
+        years[jour.year] = (known | bit, ones)
+    return years
+
+
+class DayFlagStore:
+    # Les quatre tables "un booléen par jour" en mémoire, par flag et par année :
+    # (jours présents en base, jours à 1), bit n = n-ième jour de l'année.
+    # Une table est chargée en une requête au premier accès puis tenue à jour après chaque
+    # commit ; une écriture d'un autre worker (signal par flag) la fait recharger.
+    # Les bitmaps d'un flag sont remplacés en bloc : un lecteur garde une copie cohérente.
+    def __init__(self, directory, max_age):
+        self.signal = InvalidationSignal(directory, "day_flags")
+        self.max_age = max_age
+        self._lock = Lock()
+        self._years = {}      # flag -> {annee: (connus, valeurs)}
+        self._loaded_at = {}  # flag -> time.monotonic() du chargement
+        self._seen = {}       # flag -> génération déjà prise en compte
+
+    def _check(self, flag):
+        generation = self.signal.current(flag)
+        expired = self.max_age and time.monotonic() - self._loaded_at.get(flag, 0) > self.max_age
+        if generation != self._seen.get(flag) or expired:
+            self._years.pop(flag, None)
+            self._seen[flag] = generation
+        return generation
+
+    def snapshot(self, flag):
+        # (bitmaps du flag ou None s'il faut les charger, jeton à repasser à install())
+        with self._lock:
+            generation = self._check(flag)
+            return self._years.get(flag), generation
+
+    def install(self, flag, rows, token) -> dict:
+        # rows : (jour, valeur) de toute la table ; ignoré si une écriture a eu lieu entre-temps
+        years = _with_days({}, {jour: bool(value) for jour, value in rows})
+        with self._lock:
+            if self._check(flag) == token:
+                self._years[flag] = years
+                self._loaded_at[flag] = time.monotonic()
+        return years
+
+    def write(self, flag, values: dict):
+        # à appeler après le commit : met à jour ce worker et invalide les autres
+        with self._lock:
+            self._check(flag)
+            # notre propre écriture : pas besoin de recharger ce worker
+            self._seen[flag] = self.signal.bump(flag)
+            years = self._years.get(flag)
+            if years is None:
+                return
+            try:
+                self._years[flag] = _with_days(years, {jour: to_bool(value) for jour, value in values.items()})
+            except ValueError:
+                # jour non ISO passé tel quel à MariaDB : on recharge plutôt que de deviner
+                self._years.pop(flag, None)
+
+    def mark_known(self, flag, jours):
+        # jours ajoutés à False par backfill : INSERT IGNORE, la valeur en mémoire ne change pas
+        with self._lock:
+            self._check(flag)
+            years = self._years.get(flag)
+            if years is not None:
+                self._years[flag] = _with_days(years, {jour: None for jour in jours})
+
+day_flags = DayFlagStore(CACHE_DIR, DAY_FLAGS_MAX_AGE)
+
+
+def day_flag_value(years: dict, jour: date):
+    # True / False, ou None si le jour n'a pas de ligne en base
+    known, ones = years.get(jour.year, (0, 0))
+    bit = _day_bit(jour)
+    if not known & bit:
+        return None
+    return bool(ones & bit)
+
+
+def day_flag_range(years: dict, start: date, end: date) -> dict:
+    # jours présents en base dans [start, end] -> valeur
+    result = {}
+    for annee in range(start.year, end.year + 1):
+        known, ones = years.get(annee, (0, 0))
+        first = start.timetuple().tm_yday - 1 if annee == start.year else 0
+        last = end.timetuple().tm_yday - 1 if annee == end.year else 365
+        known &= ((1 << (last + 1)) - 1) & ~((1 << first) - 1)
+        origin = date(annee, 1, 1)
+        while known:
+            bit = known & -known
+            result[origin + timedelta(days=bit.bit_length() - 1)] = bool(ones & bit)
+            known ^= bit
+    return result
+
+
+def day_flag_counts(years: dict) -> dict:
+    # (annee, mois) -> nombre de jours à 1, mois vides omis
+    counts = {}
+    for annee in sorted(years):
+        ones = years[annee][1]
+        if not ones:
+            continue
+        for mois, (first, length) in enumerate(_month_spans(annee), 1):
+            nb = ((ones >> first) & ((1 << length) - 1)).bit_count()
+            if nb:
+                counts[(annee, mois)] = nb
+    return counts
+
+
+def day_flag_years(flag: str) -> dict:
+    years, token = day_flags.snapshot(flag)
+    if years is None:
+        table, column = DAY_FLAGS[flag]
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT jour, {column} FROM {table}")
+            rows = cursor.fetchall()
+            cursor.close()
+        years = day_flags.install(flag, rows, token)
+    return years
+
+
+async def day_flag_years_async(flag: str) -> dict:
+    years, token = day_flags.snapshot(flag)
+    if years is not None:
+        return years
+    if not ASYNC_MODE:
+        return await run_in_threadpool(day_flag_years, flag)
+    table, column = DAY_FLAGS[flag]
+    async with async_backend.connection() as conn:
+        async with conn.cursor() as cursor:
+            await aexecute(cursor, f"SELECT jour, {column} FROM {table}")
+            rows = await cursor.fetchall()
+    return day_flags.install(flag, rows, token)
+
+
+def _backfill_statements(missing: list):
+    # INSERT IGNORE : une écriture concurrente entre-temps n'est jamais écrasée
+    by_flag = {}
+    for flag, jour in missing:
+        by_flag.setdefault(flag, []).append(jour)
+    for flag, jours in by_flag.items():
+        table, column = DAY_FLAGS[flag]
+        placeholders = ", ".join(["(%s, FALSE)"] * len(jours))
+        yield f"INSERT IGNORE INTO {table} (jour, {column}) VALUES {placeholders}", flag, jours, table, column
+
+
+def backfill_day_flags(missing: list):
+    # Ajoute les jours absents avec la valeur False, après la réponse HTTP.
     try:
-        presence = execute_get_presence(cursor, conn, jour)
-        return {"jour": jour, "presence": presence}
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            statements = list(_backfill_statements(missing))
+            for sql, flag, jours, table, column in statements:
+                cursor.execute(sql, jours)
+                logger.info("❗ %s : %s jour(s) absent(s) ajouté(s) avec %s=False", table, len(jours), column)
+            conn.commit()
+            cursor.close()
+        for _, flag, jours, _, _ in statements:
+            day_flags.mark_known(flag, jours)
     except Exception as e:
-        logger.error(f"❌ Erreur GET /presence/{jour}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+        logger.error("❌ Erreur ajout des jours absents %s : %s", missing, e)
 
-@app.put("/presence/{jour}")
-def update_presence(jour: str, payload: dict):
-    logger.debug(f"🛠️ PUT /presence/{jour} : {payload}")
-    presence = payload.get("presence", False)
-    conn = get_connection()
-    cursor = conn.cursor()
 
+async def backfill_day_flags_async(missing: list):
     try:
-        cursor.execute("SELECT COUNT(*) FROM presence WHERE jour = %s", (jour,))
-        exists = cursor.fetchone()[0] > 0
-
-        if exists:
-            cursor.execute(
-                "UPDATE presence SET presence = %s WHERE jour = %s",
-                (presence, jour)
-            )
-            logger.info(f"✔️ Date mise à jour : {jour} => presence={presence}")
-        else:
-            cursor.execute(
-                "INSERT INTO presence (jour, presence) VALUES (%s, %s)",
-                (jour, presence)
-            )
-            logger.info(f"➕ Date absente: {jour} => presence={presence}")
-
-        conn.commit()
-        return {"message": "Mise à jour effectuée", "jour": jour, "presence": presence}
+        async with async_backend.connection() as conn:
+            async with conn.cursor() as cursor:
+                for sql, flag, jours, table, column in _backfill_statements(missing):
+                    await aexecute(cursor, sql, jours)
+                    day_flags.mark_known(flag, jours)
+                    logger.info("❗ %s : %s jour(s) absent(s) ajouté(s) avec %s=False", table, len(jours), column)
     except Exception as e:
-        conn.rollback()
-        logger.error(f"❌ Erreur PUT /presence/{jour} : {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
-
-@app.get("/teletravail/{jour}")
-def get_teletravail(jour: str):
-    logger.debug(f"🔎 GET /teletravail/{jour}")
-    conn = get_connection()
-    cursor = conn.cursor()
+        logger.error("❌ Erreur ajout des jours absents %s : %s", missing, e)
+
+
+async def read_day_flags(wanted: dict, background_tasks: BackgroundTasks) -> dict:
+    # wanted : flag -> liste de jours. Lecture en mémoire ; les jours sans ligne valent False
+    # et sont ajoutés en base en tâche de fond.
+    values = {}
+    missing = []
+    for flag, jours in wanted.items():
+        years = await day_flag_years_async(flag)
+        for jour in jours:
+            value = day_flag_value(years, jour)
+            if value is None:
+                missing.append((flag, jour))
+            values[(flag, jour)] = bool(value)
+    if missing:
+        background_tasks.add_task(backfill_day_flags_async if ASYNC_MODE else backfill_day_flags, missing)
+    return values
+
+
+async def get_day_flag(flag: str, jour: str, background_tasks: BackgroundTasks) -> dict:
+    logger.debug("🔎 GET /%s/%s", flag, jour)
+    try:
+        day = date.fromisoformat(jour)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Date invalide : {jour}")
     try:
-        teletravail = execute_get_teletravail(cursor, conn, jour)
-        return {"jour": jour, "teletravail": teletravail}
+        values = await read_day_flags({flag: [day]}, background_tasks)
+    except PoolTimeout:
+        raise
     except Exception as e:
-        logger.error(f"❌ Erreur GET /teletravail/{jour}: {e}")
+        logger.error("❌ Erreur GET /%s/%s: %s", flag, jour, e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+    return {"jour": jour, DAY_FLAGS[flag][1]: values[(flag, day)]}
 
-@app.put("/teletravail/{jour}")
-def update_teletravail(jour: str, payload: dict):
-    logger.debug(f"🛠️ PUT /teletravail/{jour} : {payload}")
-    teletravail = payload.get("teletravail", False)
-    conn = get_connection()
-    cursor = conn.cursor()
 
-    try:
-        cursor.execute("SELECT COUNT(*) FROM teletravail WHERE jour = %s", (jour,))
-        exists = cursor.fetchone()[0] > 0
+def update_day_flag(flag: str, jour: str, payload: dict):
+    table, column = DAY_FLAGS[flag]
+    logger.debug("🛠️ PUT /%s/%s : %s", flag, jour, payload)
+    day = parse_jour(jour)
+    valeur = payload.get(column, False)
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-        if exists:
-            cursor.execute(
-                "UPDATE teletravail SET teletravail = %s WHERE jour = %s",
-                (teletravail, jour)
-            )
-            logger.info(f"✔️ Date mise à jour : {jour} => teletravail={teletravail}")
-        else:
-            cursor.execute(
-                "INSERT INTO teletravail (jour, teletravail) VALUES (%s, %s)",
-                (jour, teletravail)
-            )
-            logger.info(f"➕ Date absente: {jour} => teletravail={teletravail}")
+        try:
+            cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE jour = %s", (day,))
+            exists = cursor.fetchone()[0] > 0
+
+            if exists:
+                cursor.execute(f"UPDATE {table} SET {column} = %s WHERE jour = %s", (valeur, day))
+                logger.info("✔️ Date mise à jour : %s => %s=%s", day, column, valeur)
+            else:
+                cursor.execute(f"INSERT INTO {table} (jour, {column}) VALUES (%s, %s)", (day, valeur))
+                logger.info("➕ Date absente: %s => %s=%s", day, column, valeur)
+
+            conn.commit()
+            day_flags.write(flag, {day: valeur})
+            return {"message": "Mise à jour effectuée", "jour": jour, column: valeur}
+        except Exception as e:
+            conn.rollback()
+            logger.error("❌ Erreur PUT /%s/%s : %s", flag, jour, e)
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            cursor.close()
+
+
+def day_flag_stats(flag: str, key: str, par_mois: bool) -> dict:
+    # /stats/<flag>/annee|mois : popcount des bitmaps, sans requête SQL une fois la table chargée
+    counts = day_flag_counts(day_flag_years(flag))
+    if par_mois:
+        return {"data": [{"annee": annee, "mois": mois, key: nb} for (annee, mois), nb in counts.items()]}
+    par_annee = {}
+    for (annee, _), nb in counts.items():
+        par_annee[annee] = par_annee.get(annee, 0) + nb
+    return {"data": [{"annee": annee, key: nb} for annee, nb in par_annee.items()]}
 
-        conn.commit()
-        return {"message": "Mise à jour effectuée", "jour": jour, "teletravail": teletravail}
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"❌ Erreur PUT /teletravail/{jour} : {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
 
-@app.get("/cheminee/{jour}")
-def get_cheminee(jour: str):
-    logger.debug(f"🔎 GET /cheminee/{jour}")
-    conn = get_connection()
-    cursor = conn.cursor()
+@app.get("/api/status_du_jour")
+async def get_status_du_jour(background_tasks: BackgroundTasks):
+    logger.debug("📊 GET /api/status_du_jour (appel unifié)")
+
+    today = date.today()
+    hier = today - timedelta(days=1)
+    demain = today + timedelta(days=1)
+    wanted = {
+        "presence": [today],
+        "teletravail": [today],
+        "cheminee": [today],
+        "loue": [hier, today, demain],
+    }
+
     try:
-        cheminee = execute_get_cheminee(cursor, conn, jour)
-        return {"jour": jour, "cheminee": cheminee}
+        values = await read_day_flags(wanted, background_tasks)
+    except PoolTimeout:
+        raise
     except Exception as e:
-        logger.error(f"❌ Erreur GET /cheminee/{jour}: {e}")
+        logger.error("❌ Erreur /api/status_du_jour : %s", e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
 
-@app.put("/cheminee/{jour}")
-def update_cheminee(jour: str, payload: dict):
-    logger.debug(f"🛠️ PUT /cheminee/{jour} : {payload}")
-    cheminee = payload.get("cheminee", False)
-    conn = get_connection()
-    cursor = conn.cursor()
+    presence = values.get(("presence", today), False)
+    teletravail = values.get(("teletravail", today), False)
+    cheminee = values.get(("cheminee", today), False)
+    airbnb_hier = values.get(("loue", hier), False)
+    airbnb_aujourdhui = values.get(("loue", today), False)
+    airbnb_demain = values.get(("loue", demain), False)
 
-    try:
-        cursor.execute("SELECT COUNT(*) FROM cheminee WHERE jour = %s", (jour,))
-        exists = cursor.fetchone()[0] > 0
+    jour_str = today.isoformat()
+    logger.debug("📊 %s : Présence %s - Teletravail %s - Airbnb %s - Airbnb demain %s", jour_str, presence, teletravail, airbnb_aujourdhui, airbnb_demain)
 
-        if exists:
-            cursor.execute(
-                "UPDATE cheminee SET cheminee = %s WHERE jour = %s",
-                (cheminee, jour)
-            )
-            logger.info(f"✔️ Date mise à jour : {jour} => cheminee={cheminee}")
-        else:
-            cursor.execute(
-                "INSERT INTO cheminee (jour, cheminee) VALUES (%s, %s)",
-                (jour, cheminee)
-            )
-            logger.info(f"➕ Date absente: {jour} => cheminee={cheminee}")
+    return {
+        "jour": jour_str,
+        "presence": presence,
+        "teletravail": teletravail,
+        "cheminee": cheminee,
+        "airbnb_hier": airbnb_hier,
+        "airbnb_aujourdhui": airbnb_aujourdhui,
+        "airbnb_demain": airbnb_demain
+    }
 
-        conn.commit()
-        return {"message": "Mise à jour effectuée", "jour": jour, "cheminee": cheminee}
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"❌ Erreur PUT /cheminee/{jour} : {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+
+@app.get("/presence/{jour}")
+async def get_presence(jour: str, background_tasks: BackgroundTasks):
+    return await get_day_flag("presence", jour, background_tasks)
+
+@app.put("/presence/{jour}")
+def update_presence(jour: str, payload: dict):
+    return update_day_flag("presence", jour, payload)
+
+@app.get("/teletravail/{jour}")
+async def get_teletravail(jour: str, background_tasks: BackgroundTasks):
+    return await get_day_flag("teletravail", jour, background_tasks)
+
+@app.put("/teletravail/{jour}")
+def update_teletravail(jour: str, payload: dict):
+    return update_day_flag("teletravail", jour, payload)
+
+@app.get("/cheminee/{jour}")
+async def get_cheminee(jour: str, background_tasks: BackgroundTasks):
+    return await get_day_flag("cheminee", jour, background_tasks)
+
+@app.put("/cheminee/{jour}")
+def update_cheminee(jour: str, payload: dict):
+    return update_day_flag("cheminee", jour, payload)
 
 
 class LoueEntry(BaseModel):
     jour: date
     loue: bool
 
+async def current_reservation_index() -> ReservationIndex:
+    if ASYNC_MODE:
+        calendars = await fetch_calendars_async(AIRBNB_CAL_URLS, max_age=CALENDAR_MAX_AGE)
+    else:
+        calendars = await run_in_threadpool(fetch_calendars, AIRBNB_CAL_URLS, CALENDAR_MAX_AGE)
+    if all(ics is None for ics, _ in calendars.values()):
+        raise HTTPException(status_code=503, detail="Calendriers Airbnb indisponibles")
+    # l'analyse iCal (si l'index n'est pas en cache) reste hors de la boucle
+    return await run_in_threadpool(get_reservation_index, calendars)
+
+
+@app.get("/loue/calendar")
+async def get_loue_calendar_range(from_: date = Query(alias="from"), to: date = Query()):
+    logger.debug("🔎 GET /loue/calendar %s -> %s", from_, to)
+    if to < from_:
+        raise HTTPException(status_code=400, detail="to date must be after from date")
+    jours = (await current_reservation_index()).reserved_days(from_, to)
+    return {"from": from_, "to": to, "nb_jours": len(jours), "jours": jours}
+
+
+@app.get("/loue/calendar/{jour}")
+async def get_loue_calendar(jour: date):
+    logger.debug("🔎 GET /loue/calendar/%s", jour)
+    return {"jour": jour, "loue": (await current_reservation_index()).is_reserved(jour)}
+
+
 @app.get("/loue/{jour}")
-def get_loue(jour: str):
-    logger.debug(f"🔎 GET /loue/{jour}")
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        loue = execute_get_loue(cursor, conn, jour)
-        return {"jour": jour, "loue": loue}
-    except Exception as e:
-        logger.error(f"❌ Erreur GET /loue/{jour}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+async def get_loue(jour: str, background_tasks: BackgroundTasks):
+    return await get_day_flag("loue", jour, background_tasks)
 
 @app.post("/loue")
 def add_loue(entry: LoueEntry):
-    logger.debug(f"➕ POST /loue : {entry}")
-    conn = get_connection()
-    cursor = conn.cursor()
+    logger.debug("➕ POST /loue : %s", entry)
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        cursor.execute(
-            "INSERT INTO airbnb_loue (jour, loue) VALUES (%s, %s)",
-            (entry.jour, entry.loue)
-        )
-        conn.commit()
-        logger.info(f"➕ Date absente: {entry.jour} => loue={entry.loue}")
-        return {"message": "Ajouté"}
-    except mysql.connector.IntegrityError:
-        logger.warning("⚠️ Date déjà existante")
-        raise HTTPException(status_code=409, detail="Date déjà existante")
-    except Exception as e:
-        logger.error(f"❌ Erreur POST /loue : {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+        try:
+            cursor.execute(
+                "INSERT INTO airbnb_loue (jour, loue) VALUES (%s, %s)",
+                (entry.jour, entry.loue)
+            )
+            conn.commit()
+            day_flags.write("loue", {entry.jour: entry.loue})
+            logger.info("➕ Date absente: %s => loue=%s", entry.jour, entry.loue)
+            return {"message": "Ajouté"}
+        except mysql.connector.IntegrityError:
+            logger.warning("⚠️ Date déjà existante")
+            raise HTTPException(status_code=409, detail="Date déjà existante")
+        except Exception as e:
+            logger.error("❌ Erreur POST /loue : %s", e)
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            cursor.close()
 
 @app.put("/loue/{jour}")
 def update_loue(jour: str, payload: dict):
-    logger.debug(f"🛠️ PUT /loue/{jour} : {payload}")
-    loue = payload.get("loue", False)
-    conn = get_connection()
-    cursor = conn.cursor()
+    return update_day_flag("loue", jour, payload)
 
-    try:
-        cursor.execute("SELECT COUNT(*) FROM airbnb_loue WHERE jour = %s", (jour,))
-        exists = cursor.fetchone()[0] > 0
 
-        if exists:
-            cursor.execute(
-                "UPDATE airbnb_loue SET loue = %s WHERE jour = %s",
-                (loue, jour)
-            )
-            logger.info(f"✔️ Date mise à jour : {jour} => loue={loue}")
-        else:
-            cursor.execute(
-                "INSERT INTO airbnb_loue (jour, loue) VALUES (%s, %s)",
-                (jour, loue)
-            )
-            logger.info(f"➕ Date absente: {jour} => loue={loue}")
-
-        conn.commit()
-        return {"message": "Mise à jour effectuée", "jour": jour, "loue": loue}
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"❌ Erreur PUT /loue/{jour} : {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+def parse_jour(jour: str) -> date:
+    # AAAA-MM-JJ ; mois et jour sur un chiffre acceptés, comme MariaDB le faisait
+    try:
+        return datetime.strptime(jour, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Date invalide : {jour}")
 
 
 def to_bool(value):
@@ -537,49 +2218,82 @@ def to_bool(value):
     return bool(value)
 
 
-@app.post("/loue/init")
-def init_dates(payload: dict):
-    logger.info(f"📅 POST /loue/init : {payload}")
+def init_day_flag(flag: str, payload: dict):
+    table, column = DAY_FLAGS[flag]
+    logger.info("📅 POST /%s/init : %s", flag, payload)
     try:
         start = datetime.strptime(payload["start"], "%Y-%m-%d").date()
         end = datetime.strptime(payload["end"], "%Y-%m-%d").date()
-        resa = to_bool(payload.get("resa", False))
+        # "resa" est l'ancien nom de la valeur pour /loue/init
+        valeur = to_bool(payload.get("valeur", payload.get("resa", False)))
         weekend = to_bool(payload.get("weekend", False))
+        chunk_size = int(payload.get("chunk_size", BULK_CHUNK_SIZE))
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning("⛔ Paramètres invalides pour /%s/init : %s", flag, e)
+        raise HTTPException(status_code=400, detail=f"Paramètre invalide : {e}")
+
+    logger.info("%s init dates %s entre %s et %s (weekend %s)", table, valeur, start, end, weekend)
+
+    if end < start:
+        logger.warning("⛔ Date de fin antérieure à la date de début")
+        raise HTTPException(status_code=400, detail="end date must be after start date")
+    if (end - start).days + 1 > INIT_MAX_DAYS:
+        logger.warning("⛔ Période trop longue pour /%s/init : %s -> %s", flag, start, end)
+        raise HTTPException(status_code=400, detail=f"period must not exceed {INIT_MAX_DAYS} days")
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    chunk_size = min(chunk_size, BULK_CHUNK_MAX)
+
+    rows = []
+    current = start
+    while current <= end:
+        is_weekend = current.weekday() >= 5  # 5 = Saturday, 6 = Sunday
+        rows.append((current, weekend if is_weekend else valeur))
+        current += timedelta(days=1)
+
+    try:
+        started = time.perf_counter()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            affected = upsert_day_flags(cursor, table, column, rows, chunk_size)
+            conn.commit()
+            cursor.close()
+        day_flags.write(flag, dict(rows))
+        duree_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        logger.info("✅ %s jours %s entre %s et %s (weekend %s) en %s ms", len(rows), valeur, start, end, weekend, duree_ms)
+        return {
+            "status": "ok",
+            "message": f"{len(rows)} jours traités",
+            "jours": len(rows),
+            "lignes_affectees": affected,
+            "duree_ms": duree_ms,
+        }
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error("❌ Erreur dans /%s/init : %s", flag, e)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        logger.info(f"Airbnb init dates {resa} entre {start} et {end} (weekend {weekend})")
 
-        if end < start:
-            logger.warning("⛔ Date de fin antérieure à la date de début")
-            raise HTTPException(status_code=400, detail="end date must be after start date")
+@app.post("/presence/init")
+def init_presence(payload: dict):
+    return init_day_flag("presence", payload)
 
-        conn = get_connection()
-        cursor = conn.cursor()
 
-        current = start
-        count = 0
-        while current <= end:
-            is_weekend = current.weekday() >= 5  # 5 = Saturday, 6 = Sunday
-            statut = weekend if is_weekend else resa
-            cursor.execute(
-                """
-                INSERT INTO airbnb_loue (jour, loue)
-                VALUES (%s, %s)
-                ON DUPLICATE KEY UPDATE loue = VALUES(loue)
-                """,
-                (current, statut)
-            )
-            current += timedelta(days=1)
-            count += 1
+@app.post("/teletravail/init")
+def init_teletravail(payload: dict):
+    return init_day_flag("teletravail", payload)
 
-        conn.commit()
-        logger.info(f"✅ {count} jours {resa} entre {start} et {end} (weekend {weekend})")
-        return {"status": "ok", "message": f"{count} jours traités"}
-    except Exception as e:
-        logger.error(f"❌ Erreur dans /loue/init : {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+
+@app.post("/cheminee/init")
+def init_cheminee(payload: dict):
+    return init_day_flag("cheminee", payload)
+
+
+@app.post("/loue/init")
+def init_dates(payload: dict):
+    return init_day_flag("loue", payload)
 
 
 
@@ -592,43 +2306,510 @@ class CapteurHeureUpdate(BaseModel):
 
 @app.post("/capteurs/heure")
 def update_capteur_heure(payload: CapteurHeureUpdate):
-    logger.debug(f"🌡️ POST /capteurs/heure : {payload}")
+    logger.debug("🌡️ POST /capteurs/heure : %s", payload)
     heure_colonne = f"h{payload.heure:02d}"
 
     if payload.heure < 0 or payload.heure > 23:
         raise HTTPException(status_code=400, detail="Heure invalide (doit être entre 0 et 23)")
+    if capteurs_frozen(payload.jour):
+        raise HTTPException(status_code=400, detail=f"Jour purgé par la maintenance (conservés à partir du {capteurs_cutoff()})")
+
+    if CAPTEURS_WRITE_BEHIND:
+        capteur_buffer.add([payload])
+        return JSONResponse(
+            status_code=202,
+            content={"message": "Capteur mis en attente", "capteur": payload.capteur, "heure": payload.heure}
+        )
 
-    conn = get_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Vérifie si une ligne existe déjà
+            cursor.execute(
+                "SELECT COUNT(*) FROM capteurs WHERE jour = %s AND capteur = %s",
+                (payload.jour, payload.capteur)
+            )
+            exists = cursor.fetchone()[0] > 0
+
+            if exists:
+                query = f"UPDATE capteurs SET {heure_colonne} = %s WHERE jour = %s AND capteur = %s"
+                cursor.execute(query, (payload.valeur, payload.jour, payload.capteur))
+            else:
+                colonnes = ['jour', 'capteur', heure_colonne]
+                valeurs = [payload.jour, payload.capteur, payload.valeur]
+                placeholders = ', '.join(['%s'] * len(valeurs))
+                colonnes_sql = ', '.join(colonnes)
+                query = f"INSERT INTO capteurs ({colonnes_sql}) VALUES ({placeholders})"
+                cursor.execute(query, valeurs)
+
+            mark_rollups(cursor, "capteurs", [payload.jour], [payload.capteur])
+            conn.commit()
+            rollup_refresher.wake()
+            stats_cache.invalidate("capteurs")
+            return {"message": "Capteur enregistré", "capteur": payload.capteur, "heure": payload.heure}
+        except Exception as e:
+            conn.rollback()
+            logger.error("❌ Erreur /capteurs/heure : %s", e)
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            cursor.close()
+
+
+class CapteurBatch(BaseModel):
+    lectures: list[CapteurHeureUpdate]
+
+
+CAPTEURS_UNIQUE_KEY_RECHECK = 3600  # après un échec, relecture de information_schema au plus toutes les N s
+_capteurs_unique_key = None  # None : pas encore vérifiée par ensure_schema dans ce worker
+_capteurs_unique_key_checked = 0.0
+
+
+def ensure_capteurs_unique_key(cursor):
+    # Au démarrage (ensure_schema) : ON DUPLICATE KEY a besoin d'une clé unique (jour, capteur).
+    global _capteurs_unique_key, _capteurs_unique_key_checked
+    _capteurs_unique_key = ensure_index(cursor, "capteurs", "uq_capteurs_jour_capteur", ("jour", "capteur"), unique=True)
+    _capteurs_unique_key_checked = time.monotonic()
+    if not _capteurs_unique_key:
+        logger.error("❌ Écritures capteurs refusées sans clé unique (jour, capteur) : supprimer les doublons puis redémarrer l'add-on")
+
+
+def capteurs_unique_key(cursor) -> bool:
+    # Chemin d'écriture : jamais de DDL, seulement une lecture de information_schema tant que
+    # ensure_schema n'a pas conclu, puis au plus une par CAPTEURS_UNIQUE_KEY_RECHECK après un échec
+    # (clé créée à la main entre-temps).
+    global _capteurs_unique_key, _capteurs_unique_key_checked
+    if _capteurs_unique_key:
+        return True
+    if _capteurs_unique_key is False and time.monotonic() - _capteurs_unique_key_checked < CAPTEURS_UNIQUE_KEY_RECHECK:
+        return False
+    found = find_index(cursor, "capteurs", ("jour", "capteur"), unique=True)
+    if found:
+        _capteurs_unique_key = True
+    elif _capteurs_unique_key is False:
+        _capteurs_unique_key_checked = time.monotonic()
+    return found
+
+
+def upsert_capteur_rows(cursor, rows: dict, chunk_size: int = None) -> int:
+    # rows : (jour, capteur) -> {heure: valeur}.
+    # Les lignes sont regroupées par ensemble d'heures (mêmes colonnes), puis écrites
+    # par INSERT multi-lignes de chunk_size lignes. Renvoie le nombre de requêtes.
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    by_hours = {}
+    for (jour, capteur), heures in rows.items():
+        by_hours.setdefault(tuple(sorted(heures)), []).append((jour, capteur, heures))
+
+    statements = 0
+    for hours, group in by_hours.items():
+        colonnes = [f"h{heure:02d}" for heure in hours]
+        placeholders = "(" + ", ".join(["%s"] * (len(colonnes) + 2)) + ")"
+        updates = ", ".join(f"{colonne} = VALUES({colonne})" for colonne in colonnes)
+        for i in range(0, len(group), chunk_size):
+            chunk = group[i:i + chunk_size]
+            params = []
+            for jour, capteur, heures in chunk:
+                params += [jour, capteur] + [heures[heure] for heure in hours]
+            cursor.execute(
+                f"""
+                INSERT INTO capteurs (jour, capteur, {', '.join(colonnes)})
+                VALUES {', '.join([placeholders] * len(chunk))}
+                ON DUPLICATE KEY UPDATE {updates}
+                """,
+                params
+            )
+            statements += 1
+    return statements
+
+
+@app.post("/capteurs/batch")
+def update_capteurs_batch(payload: CapteurBatch):
+    logger.debug("🌡️ POST /capteurs/batch : %s lecture(s)", len(payload.lectures))
+
+    invalides = [l.heure for l in payload.lectures if l.heure < 0 or l.heure > 23]
+    if invalides:
+        raise HTTPException(status_code=400, detail=f"Heure(s) invalide(s) (doit être entre 0 et 23) : {invalides}")
+    purges = sorted({l.jour.isoformat() for l in payload.lectures if capteurs_frozen(l.jour)})
+    if purges:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Jour(s) purgé(s) par la maintenance (conservés à partir du {capteurs_cutoff()}) : {purges}"
+        )
+
+    # une ligne par (jour, capteur) ; pour une même heure, la dernière lecture gagne
+    rows = {}
+    for lecture in payload.lectures:
+        rows.setdefault((lecture.jour, lecture.capteur), {})[lecture.heure] = lecture.valeur
+
+    started = time.perf_counter()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if not capteurs_unique_key(cursor):
+                raise HTTPException(status_code=503, detail="Clé unique (jour, capteur) absente sur la table capteurs")
+            statements = upsert_capteur_rows(cursor, rows) if rows else 0
+            mark_rollups(cursor, "capteurs", [jour for jour, _ in rows], {capteur for _, capteur in rows})
+            conn.commit()
+            rollup_refresher.wake()
+        except HTTPException:
+            raise
+        except Exception as e:
+            conn.rollback()
+            logger.error("❌ Erreur /capteurs/batch : %s", e)
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            cursor.close()
+
+    if rows:
+        stats_cache.invalidate("capteurs")
+    duree_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.debug("🌡️ %s lecture(s) capteurs, %s ligne(s), %s requête(s) en %s ms", len(payload.lectures), len(rows), statements, duree_ms)
+    return {
+        "message": "Capteurs enregistrés",
+        "lectures": len(payload.lectures),
+        "lignes": len(rows),
+        "requetes": statements,
+        "duree_ms": duree_ms,
+    }
+
+
+# ======================================================
+# CAPTEURS : écriture différée (write-behind)
+# ======================================================
+
+CAPTEURS_WRITE_BEHIND = bool(config.get("CAPTEURS_WRITE_BEHIND", False))
+CAPTEURS_FLUSH_INTERVAL = float(config.get("CAPTEURS_FLUSH_INTERVAL", 30))  # écriture au moins toutes les N s
+CAPTEURS_FLUSH_SIZE = int(config.get("CAPTEURS_FLUSH_SIZE", 500))          # ou dès N lectures en attente
+
+
+class CapteurBuffer:
+    # Les lectures sont acquittées tout de suite, regroupées par ligne (jour, capteur)
+    # et écrites en lot par upsert_capteur_rows() sur un seuil de taille ou de temps.
+    # Chaque lecture est d'abord ajoutée à un journal local (un fichier par worker) :
+    # ce qui n'a pas pu être écrit est rejoué au prochain démarrage.
+    def __init__(self, directory, flush_interval, flush_size):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._rows = {}        # (jour, capteur) -> {heure: valeur}
+        self._pending = 0
+        self._journal = None
+        self._segments = []    # journaux déjà basculés, supprimés après une écriture réussie
+        self._sequence = 0
+        self._token = None     # pid + aléa : propre à ce process, même si le pid est réutilisé
+        self._wakeup = Event()
+        self._stop = Event()
+        self._thread = None
+
+    def _journal_path(self, suffix=""):
+        # un conteneur redémarré retrouve souvent les mêmes pids : le jeton aléatoire évite
+        # d'écraser les journaux (et segments) non rejoués d'un ancien process
+        if self._token is None or not self._token.startswith(f"{os.getpid()}-"):
+            self._token = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        return os.path.join(self.directory, f"capteurs_journal_{self._token}{suffix}.jsonl")
+
+    def add(self, lectures):
+        with self._lock:
+            if self._journal is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._journal = open(self._journal_path(), "a")
+            for lecture in lectures:
+                self._journal.write(json.dumps({
+                    "jour": lecture.jour.isoformat(), "capteur": lecture.capteur,
+                    "heure": lecture.heure, "valeur": lecture.valeur,
+                }) + "\n")
+                self._rows.setdefault((lecture.jour, lecture.capteur), {})[lecture.heure] = lecture.valeur
+                self._pending += 1
+            self._journal.flush()
+            if self._pending >= self.flush_size:
+                self._wakeup.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._rows:
+                    return 0
+                rows, pending = self._rows, self._pending
+                self._rows, self._pending = {}, 0
+                # bascule du journal : les lectures suivantes vont dans un nouveau fichier
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                    self._sequence += 1
+                    segment = self._journal_path(f".{self._sequence}")
+                    os.replace(self._journal_path(), segment)
+                    self._segments.append(segment)
+
+            try:
+                self._write(rows)
+            except Exception as e:
+                logger.error("❌ Écriture différée des capteurs en échec (%s lecture(s)) : %s", pending, e)
+                with self._lock:
+                    # les lectures arrivées entre-temps sont plus récentes : elles gardent la priorité
+                    for key, heures in self._rows.items():
+                        rows.setdefault(key, {}).update(heures)
+                    self._rows = rows
+                    self._pending += pending
+                return 0
+
+            with self._lock:
+                segments, self._segments = self._segments, []
+            for segment in segments:
+                os.remove(segment)
+            logger.debug("🌡️ %s lecture(s) capteurs écrites (%s ligne(s))", pending, len(rows))
+            return pending
+
+    def _write(self, rows):
+        # lectures acceptées avant que leur mois ne soit purgé (journal rejoué tard, bascule
+        # du mois de rétention) : l'agrégat de ce mois est figé, elles sont abandonnées
+        frozen = [key for key in rows if capteurs_frozen(key[0])]
+        if frozen:
+            logger.warning("⚠️ %s ligne(s) capteurs abandonnée(s), jours purgés : %s", len(frozen), frozen)
+            rows = {key: heures for key, heures in rows.items() if key not in frozen}
+            if not rows:
+                return
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if not capteurs_unique_key(cursor):
+                    raise RuntimeError("Clé unique (jour, capteur) absente sur la table capteurs")
+                upsert_capteur_rows(cursor, rows)
+                mark_rollups(cursor, "capteurs", [jour for jour, _ in rows], {capteur for _, capteur in rows})
+                conn.commit()
+                rollup_refresher.wake()
+            finally:
+                cursor.close()
+        stats_cache.invalidate("capteurs")
+
+    def replay_journals(self):
+        # journaux laissés par un worker arrêté (ou par un ancien process de même pid)
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        own = os.path.basename(self._journal_path())[:-len(".jsonl")]
+        for name in sorted(names):
+            if not name.startswith("capteurs_journal_") or not name.endswith(".jsonl"):
+                continue
+            if name[:-len(".jsonl")].split(".")[0] == own:
+                continue
+            pid = int(name[len("capteurs_journal_"):].split(".")[0].split("-")[0])
+            path = os.path.join(self.directory, name)
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            rows = {}
+            try:
+                f = open(path)
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    # l'autre worker peut rejouer le même journal au même moment
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+                if not os.path.exists(path):
+                    continue
+                for line in f:
+                    try:
+                        r = json.loads(line)
+                    except ValueError:
+                        continue  # dernière ligne tronquée par un arrêt brutal
+                    rows.setdefault((date.fromisoformat(r["jour"]), r["capteur"]), {})[r["heure"]] = r["valeur"]
+                if rows:
+                    self._write(rows)
+                os.remove(path)
+            logger.info("🌡️ Journal capteurs rejoué : %s (%s ligne(s))", name, len(rows))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = Thread(target=self._loop, name="capteurs-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+        self.flush()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if not self._rows and os.path.exists(self._journal_path()):
+                os.remove(self._journal_path())
+
+    def _loop(self):
+        replayed = False
+        while not self._stop.is_set():
+            if not replayed:
+                try:
+                    self.replay_journals()
+                    replayed = True
+                except Exception as e:
+                    logger.error("❌ Rejeu des journaux capteurs en échec : %s", e)
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+capteur_buffer = CapteurBuffer(CACHE_DIR, CAPTEURS_FLUSH_INTERVAL, CAPTEURS_FLUSH_SIZE)
+
+
+# ======================================================
+# CAPTEURS : EXPORT DE SÉRIES HORAIRES
+# ======================================================
+
+SERIES_FETCH_SIZE = 500  # jours lus par aller-retour sur le curseur
+TZ_PARIS = zoneinfo.ZoneInfo("Europe/Paris")
 
+
+class SeriesFormatEnum(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+class SeriesResampleEnum(str, Enum):
+    raw = "raw"
+    day = "day"
+    week = "week"
+
+
+def iter_capteur_rows(capteur: str, start: date, end: date):
+    # Curseur non bufferisé : les lignes arrivent par paquets de SERIES_FETCH_SIZE.
+    # La connexion est prise et la requête lancée avant la réponse (PoolTimeout -> 503,
+    # erreur SQL -> 500) ; seule la lecture des paquets se fait pendant le flux.
+    pool = get_pool()
+    conn = pool.acquire()
     try:
-        # Vérifie si une ligne existe déjà
+        cursor = InstrumentedCursor(conn.cursor(buffered=False))
         cursor.execute(
-            "SELECT COUNT(*) FROM capteurs WHERE jour = %s AND capteur = %s",
-            (payload.jour, payload.capteur)
+            f"""
+            SELECT jour, {', '.join(f'h{heure:02d}' for heure in range(24))}
+            FROM capteurs
+            WHERE jour >= %s AND jour <= %s AND capteur = %s
+            ORDER BY jour
+            """,
+            (start, end, capteur)
         )
-        exists = cursor.fetchone()[0] > 0
+        rows = cursor.fetchmany(SERIES_FETCH_SIZE)
+    except BaseException:
+        pool.release(conn, broken=True)
+        raise
+    return _fetch_capteur_rows(pool, conn, cursor, rows)
+
 
-        if exists:
-            query = f"UPDATE capteurs SET {heure_colonne} = %s WHERE jour = %s AND capteur = %s"
-            cursor.execute(query, (payload.valeur, payload.jour, payload.capteur))
+def _fetch_capteur_rows(pool, conn, cursor, rows):
+    # Rend la connexion à la fin du flux ; si le client coupe avant la fin ou si la
+    # lecture échoue, le résultat n'est pas lu jusqu'au bout et la connexion est jetée.
+    complete = False
+    try:
+        while rows:
+            yield from rows
+            rows = cursor.fetchmany(SERIES_FETCH_SIZE)
+        cursor.close()
+        complete = True
+    finally:
+        pool.release(conn, broken=not complete)
+
+
+def series_points(rows, resample: SeriesResampleEnum):
+    # raw : un point par heure renseignée ; day / week : moyenne, min, max et nombre
+    # de valeurs horaires par jour ou par semaine (lundi 00:00, heure de Paris)
+    bucket, valeurs = None, []
+    for jour, *heures in rows:
+        if resample is SeriesResampleEnum.raw:
+            for heure, valeur in enumerate(heures):
+                if valeur is not None:
+                    t = datetime(jour.year, jour.month, jour.day, heure, tzinfo=TZ_PARIS)
+                    yield {"t": t.isoformat(), "valeur": float(valeur)}
+            continue
+
+        key = jour if resample is SeriesResampleEnum.day else jour - timedelta(days=jour.weekday())
+        if key != bucket:
+            if valeurs:
+                yield _series_bucket(bucket, valeurs)
+            bucket, valeurs = key, []
+        valeurs += [float(valeur) for valeur in heures if valeur is not None]
+
+    if valeurs:
+        yield _series_bucket(bucket, valeurs)
+
+
+def _series_bucket(jour: date, valeurs: list) -> dict:
+    t = datetime(jour.year, jour.month, jour.day, tzinfo=TZ_PARIS)
+    return {
+        "t": t.isoformat(),
+        "valeur": round(sum(valeurs) / len(valeurs), 3),
+        "min": min(valeurs),
+        "max": max(valeurs),
+        "n": len(valeurs),
+    }
+
+
+def render_series(points, fmt: SeriesFormatEnum, resample: SeriesResampleEnum, chunk_points: int = 1000):
+    # Regroupe les lignes de sortie par paquets pour limiter le nombre d'écritures réseau
+    fields = ["t", "valeur"] if resample is SeriesResampleEnum.raw else ["t", "valeur", "min", "max", "n"]
+    lines = [",".join(fields)] if fmt is SeriesFormatEnum.csv else []
+    for point in points:
+        if fmt is SeriesFormatEnum.csv:
+            lines.append(",".join(str(point[field]) for field in fields))
         else:
-            colonnes = ['jour', 'capteur', heure_colonne]
-            valeurs = [payload.jour, payload.capteur, payload.valeur]
-            placeholders = ', '.join(['%s'] * len(valeurs))
-            colonnes_sql = ', '.join(colonnes)
-            query = f"INSERT INTO capteurs ({colonnes_sql}) VALUES ({placeholders})"
-            cursor.execute(query, valeurs)
+            lines.append(json.dumps(point))
+        if len(lines) >= chunk_points:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+@app.get("/capteurs/{capteur}/series")
+def capteur_series(
+    capteur: str,
+    from_: date = Query(alias="from"),
+    to: date = Query(),
+    format: SeriesFormatEnum = SeriesFormatEnum.ndjson,
+    resample: SeriesResampleEnum = SeriesResampleEnum.raw,
+):
+    logger.debug("📈 GET /capteurs/%s/series %s -> %s (%s, %s)", capteur, from_, to, format.value, resample.value)
+    if to < from_:
+        raise HTTPException(status_code=400, detail="to date must be after from date")
 
-        conn.commit()
-        return {"message": "Capteur enregistré", "capteur": payload.capteur, "heure": payload.heure}
+    try:
+        rows = iter_capteur_rows(capteur, from_, to)
+    except PoolTimeout:
+        raise
     except Exception as e:
-        conn.rollback()
-        logger.error(f"❌ Erreur /capteurs/heure : {e}")
+        logger.error("❌ Erreur série %s : %s", capteur, e)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
+
+    # Une erreur pendant le flux (en-têtes déjà partis) coupe la connexion HTTP :
+    # le client voit une réponse incomplète, jamais un 200 tronqué silencieusement.
+    points = series_points(rows, resample)
+    media_type = "text/csv" if format is SeriesFormatEnum.csv else "application/x-ndjson"
+    return StreamingResponse(
+        render_series(points, format, resample),
+        media_type=media_type,
+        headers={"Content-Disposition": series_disposition(capteur, from_, to, format)},
+    )
+
+
+def series_disposition(capteur: str, start: date, end: date, fmt: SeriesFormatEnum) -> str:
+    # capteur vient de l'URL : nom ASCII nettoyé pour filename, nom exact encodé (RFC 6266)
+    filename = f"{capteur}_{start}_{end}.{fmt.value}"
+    ascii_name = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
+    return f"inline; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename, safe='')}"
 
 
 class LieuEnum(str, Enum):
@@ -665,75 +2846,1086 @@ class RapportEntry(BaseModel):
 
 @app.post("/rapport")
 def upsert_rapport(entry: RapportEntry):
-    logger.info(f"📘 POST /rapport : {entry}")
-    conn = get_connection()
-    cursor = conn.cursor()
+    logger.debug("📘 POST /rapport : %s", entry)
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
+        try:
+            cursor.execute(
+                """
+                INSERT INTO rapport (
+                    jour, lieu, lingerie, ejac,
+                    fellation, cunnilingus, levrette,
+                    missionnaire, andromaque, sodomie, fouet
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    lieu = VALUES(lieu),
+                    lingerie = VALUES(lingerie),
+                    ejac = VALUES(ejac),
+                    fellation = VALUES(fellation),
+                    cunnilingus = VALUES(cunnilingus),
+                    levrette = VALUES(levrette),
+                    missionnaire = VALUES(missionnaire),
+                    andromaque = VALUES(andromaque),
+                    sodomie = VALUES(sodomie),
+                    fouet = VALUES(fouet)
+                """,
+                (
+                    entry.jour,
+                    entry.lieu.value,
+                    entry.lingerie.value,
+                    entry.ejac.value,
+                    entry.fellation,
+                    entry.cunnilingus,
+                    entry.levrette,
+                    entry.missionnaire,
+                    entry.andromaque,
+                    entry.sodomie,
+                    entry.fouet
+                )
+            )
+            mark_rollups(cursor, "rapport", [entry.jour])
+            conn.commit()
+            rollup_refresher.wake()
+            stats_cache.invalidate("rapport")
+            return {"status": "ok", "message": f"Rapport enregistré pour {entry.jour}"}
+        except Exception as e:
+            conn.rollback()
+            logger.error("❌ Erreur POST /rapport : %s", e)
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            cursor.close()
+
+
+
+
+# ======================================================
+# CACHE MÉMOIRE (Home Assistant friendly)
+# ======================================================
+
+CACHE_TTL = 7200  # 2h
+CACHE_STALE_TTL = float(config.get("CACHE_STALE_TTL", 86400))  # une valeur expirée reste servie pendant son recalcul
+CACHE_COMPUTE_TIMEOUT = 60
+CACHE_BACKEND = config.get("CACHE_BACKEND", "sqlite")  # "sqlite" : partagé entre workers, "memory" : un cache par worker
+CACHE_MAX_BYTES = int(config.get("CACHE_MAX_BYTES", 4 * 1024 * 1024))  # budget mémoire total (taille JSON des entrées)
+# limites par namespace (préfixe de la clé) : les clés capteurs viennent de la requête HTTP
+CACHE_NAMESPACE_LIMITS = {
+    "capteurs": {
+        "max_entries": int(config.get("CACHE_CAPTEURS_MAX_ENTRIES", 32)),
+        "max_bytes": int(config.get("CACHE_CAPTEURS_MAX_BYTES", 1024 * 1024)),
+    },
+}
+
+
+class MemoryCacheStore:
+    # Entrées du worker, dans un OrderedDict du moins au plus récemment utilisé
+    shared = False
+
+    def __init__(self, max_bytes, namespace_limits):
+        self.max_bytes = max_bytes
+        self.namespace_limits = namespace_limits
+        self._entries = OrderedDict()  # key -> {"time", "data", "tags", "generations", "namespace", "size"}
+        self._lru = {}                 # namespace -> OrderedDict des clés, du moins au plus récemment utilisé
+        self._created = OrderedDict()  # key -> time, dans l'ordre d'écriture (donc de "time")
+        self._usage = {}               # namespace -> [entries, bytes]
+        self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        namespace = entry["namespace"]
+        del self._lru[namespace][key]
+        del self._created[key]
+        usage = self._usage[namespace]
+        usage[0] -= 1
+        usage[1] -= entry["size"]
+        self._bytes -= entry["size"]
+        return namespace
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry:
+            self._entries.move_to_end(key)
+            self._lru[entry["namespace"]].move_to_end(key)
+        return entry
+
+    def delete(self, key):
+        if key in self._entries:
+            self._remove(key)
+
+    def put(self, key, entry, expire_before):
+        # renvoie les namespaces des entrées évincées
+        self.delete(key)
+        # entrées trop vieilles même pour stale-while-revalidate, comme SQLiteCacheStore.put
+        # (expirées, pas évincées : non comptées)
+        while self._created and next(iter(self._created.values())) < expire_before:
+            self._remove(next(iter(self._created)))
+
+        namespace = entry["namespace"]
+        limits = self.namespace_limits.get(namespace, {})
+        self._entries[key] = entry
+        lru = self._lru.setdefault(namespace, OrderedDict())
+        lru[key] = None
+        self._created[key] = entry["time"]
+        usage = self._usage.setdefault(namespace, [0, 0])
+        usage[0] += 1
+        usage[1] += entry["size"]
+        self._bytes += entry["size"]
+
+        # éviction LRU : d'abord dans le namespace s'il dépasse ses limites, puis globalement
+        evicted = []
+        while (usage[0] > limits.get("max_entries", float("inf"))
+               or usage[1] > limits.get("max_bytes", float("inf"))):
+            evicted.append(self._remove(next(iter(lru))))
+        while self._bytes > self.max_bytes:
+            evicted.append(self._remove(next(iter(self._entries))))
+        return evicted
+
+    def delete_tags(self, tags):
+        keys = [key for key, entry in self._entries.items() if set(entry["tags"]) & set(tags)]
+        return [self._remove(key) for key in keys]
+
+    def usage(self):
+        return {namespace: {"entries": u[0], "bytes": u[1]} for namespace, u in self._usage.items()}
+
+
+class SQLiteCacheStore:
+    # Entrées partagées par tous les workers gunicorn dans un fichier SQLite de CACHE_DIR.
+    # Chaque valeur est sérialisée une seule fois en JSON, par le worker qui la calcule.
+    shared = True
+
+    def __init__(self, path, max_bytes, namespace_limits):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.namespace_limits = namespace_limits
+        self._local = local()
+        db = self._connect()
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                tags TEXT NOT NULL,
+                generations TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS cache_namespace_access ON cache (namespace, last_access)")
+        db.execute("CREATE INDEX IF NOT EXISTS cache_access ON cache (last_access)")
+
+    def _connect(self):
+        # une connexion par thread et par process
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, key):
+        db = self._connect()
+        row = db.execute(
+            "SELECT created, data, tags, generations, namespace, size, last_access FROM cache WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        created, data, tags, generations, namespace, size, last_access = row
+        now = time.time()
+        if now - last_access > 60:
+            # l'ordre LRU n'a pas besoin d'être plus précis qu'à la minute
+            db.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+        return {
+            "time": created, "data": json.loads(data), "tags": tuple(tags.strip(",").split(",")),
+            "generations": generations, "namespace": namespace, "size": size,
+        }
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict_oldest(self, db, namespace=None):
+        where = "WHERE namespace = ?" if namespace else ""
+        params = (namespace,) if namespace else ()
+        row = db.execute(f"SELECT key, namespace FROM cache {where} ORDER BY last_access LIMIT 1", params).fetchone()
+        db.execute("DELETE FROM cache WHERE key = ?", (row[0],))
+        return row[1]
+
+    def put(self, key, entry, expire_before):
+        namespace = entry["namespace"]
+        limits = self.namespace_limits.get(namespace, {})
+        evicted = []
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM cache WHERE created < ?", (expire_before,))
+            db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, namespace, "," + ",".join(entry["tags"]) + ",", entry["generations"],
+                 entry["time"], entry["time"], entry["size"], entry["serialized"])
+            )
+            while True:
+                count, size = db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?", (namespace,)
+                ).fetchone()
+                if count <= limits.get("max_entries", float("inf")) and size <= limits.get("max_bytes", float("inf")):
+                    break
+                evicted.append(self._evict_oldest(db, namespace))
+            while db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0] > self.max_bytes:
+                evicted.append(self._evict_oldest(db))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def delete_tags(self, tags):
+        db = self._connect()
+        removed = []
+        for tag in tags:
+            pattern = f"%,{tag},%"
+            removed += [row[0] for row in db.execute("SELECT namespace FROM cache WHERE tags LIKE ?", (pattern,))]
+            db.execute("DELETE FROM cache WHERE tags LIKE ?", (pattern,))
+        return removed
+
+    def usage(self):
+        rows = self._connect().execute("SELECT namespace, COUNT(*), SUM(size) FROM cache GROUP BY namespace")
+        return {namespace: {"entries": count, "bytes": size} for namespace, count, size in rows}
+
+
+def _json_default(value):
+    # types renvoyés par mysql.connector : DECIMAL (SUM, AVG) en nombre, dates en ISO comme FastAPI
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Type non sérialisable : {type(value).__name__}")
+
+
+class StatsCache:
+    # - un seul calcul à la fois par clé dans un worker, les autres requêtes attendent son résultat
+    # - une entrée expirée est servie telle quelle pendant qu'un thread la recalcule
+    # - invalidation par tag (nom de table), propagée aux autres workers par InvalidationSignal
+    # - stockage borné (LRU) : en mémoire du worker, ou partagé entre workers dans SQLite
+    def __init__(self, ttl, stale_ttl, directory, store):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.store = store
+        self.signal = InvalidationSignal(directory, "stats")
+        self._lock = Lock()
+        self._inflight = {}    # key -> Event
+        self._counters = {}    # namespace -> {"hits", "stale_hits", "misses", "evictions", "invalidations"}
+
+    @staticmethod
+    def namespace_of(key):
+        return key.split("_", 1)[0]
+
+    def _count(self, namespace, counter, n=1):
+        counters = self._counters.get(namespace)
+        if counters is None:
+            counters = self._counters[namespace] = {
+                "hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0,
+            }
+        counters[counter] += n
+
+    def _generations(self, tags):
+        return "|".join(f"{g[0]}:{g[1]}" if g else "-" for g in map(self.signal.current, tags))
+
+    def get(self, key, compute, tags=(), namespace=None):
+        namespace = namespace or self.namespace_of(key)
+        generations = self._generations(tags)
+        now = time.time()
+        with self._lock:
+            entry = self.store.get(key)
+            if entry and entry["generations"] != generations:
+                # une table de ce tag a été modifiée : jamais servi, même périmé
+                self.store.delete(key)
+                self._count(namespace, "invalidations")
+                entry = None
+            if entry:
+                age = now - entry["time"]
+                if age < self.ttl:
+                    self._count(namespace, "hits")
+                    return entry["data"]
+                if age < self.ttl + self.stale_ttl:
+                    self._count(namespace, "stale_hits")
+                    if key not in self._inflight:
+                        self._inflight[key] = Event()
+                        Thread(target=self._refresh, args=(key, compute, tags, namespace), daemon=True).start()
+                    return entry["data"]
+            self._count(namespace, "misses")
+            event = self._inflight.get(key)
+            if event is None:
+                self._inflight[key] = Event()
+
+        if event is None:
+            return self._refresh(key, compute, tags, namespace)
+
+        # calcul déjà en cours dans un autre thread : on attend son résultat
+        event.wait(CACHE_COMPUTE_TIMEOUT)
+        with self._lock:
+            entry = self.store.get(key)
+        if entry and entry["generations"] == self._generations(tags):
+            return entry["data"]
+        return compute()
+
+    def _refresh(self, key, compute, tags, namespace):
+        try:
+            generations = self._generations(tags)
+            # relu depuis le JSON : un calcul et une lecture du cache renvoient exactement les mêmes types
+            serialized = json.dumps(compute(), default=_json_default)
+            data = json.loads(serialized)
+            # une invalidation pendant le calcul : le résultat est renvoyé mais pas gardé
+            if self._generations(tags) == generations:
+                limits = self.store.namespace_limits.get(namespace, {})
+                if len(serialized) > min(self.store.max_bytes, limits.get("max_bytes", self.store.max_bytes)):
+                    logger.warning("⚠️ Entrée de cache %s trop grosse (%s octets), non gardée", key, len(serialized))
+                    return data
+                now = time.time()
+                with self._lock:
+                    evicted = self.store.put(key, {
+                        "time": now, "data": data, "serialized": serialized, "tags": tags,
+                        "generations": generations, "namespace": namespace, "size": len(serialized),
+                    }, expire_before=now - self.ttl - self.stale_ttl)
+                    for evicted_namespace in evicted:
+                        self._count(evicted_namespace, "evictions")
+            return data
+        except Exception as e:
+            logger.error("❌ Erreur calcul cache %s : %s", key, e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.signal.bump(tag)
+        with self._lock:
+            for namespace in self.store.delete_tags(tags):
+                self._count(namespace, "invalidations")
+
+    def stats(self):
+        with self._lock:
+            usage = self.store.usage()
+            namespaces = set(usage) | set(self._counters)
+            return {
+                "pid": os.getpid(),
+                "backend": "sqlite" if self.store.shared else "memory",
+                "entries": sum(u["entries"] for u in usage.values()),
+                "bytes": sum(u["bytes"] for u in usage.values()),
+                "max_bytes": self.store.max_bytes,
+                "namespaces": {
+                    name: dict(
+                        usage.get(name, {"entries": 0, "bytes": 0}),
+                        **self._counters.get(name, {}),
+                        limits=self.store.namespace_limits.get(name, {}),
+                    )
+                    for name in sorted(namespaces)
+                },
+            }
+
+
+def make_cache_store():
+    if CACHE_BACKEND == "sqlite":
+        try:
+            return SQLiteCacheStore(os.path.join(CACHE_DIR, "stats_cache.sqlite"), CACHE_MAX_BYTES, CACHE_NAMESPACE_LIMITS)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("⚠️ Cache partagé SQLite indisponible, cache mémoire par worker : %s", e)
+    return MemoryCacheStore(CACHE_MAX_BYTES, CACHE_NAMESPACE_LIMITS)
+
+
+def _cache_metrics():
+    rows = []
+    for namespace, values in stats_cache.stats()["namespaces"].items():
+        for counter, result in (("hits", "hit"), ("stale_hits", "stale"), ("misses", "miss")):
+            rows.append(("counter", "celeri_cache_requests_total", (("namespace", namespace), ("result", result)), values.get(counter, 0)))
+        rows.append(("counter", "celeri_cache_evictions_total", (("namespace", namespace),), values.get("evictions", 0)))
+        rows.append(("counter", "celeri_cache_invalidations_total", (("namespace", namespace),), values.get("invalidations", 0)))
+    return rows
+
+
+stats_cache = StatsCache(CACHE_TTL, CACHE_STALE_TTL, CACHE_DIR, make_cache_store())
+metrics.add_collector(_cache_metrics)
+
+
+def cached(key: str, compute_func, tags=()):
+    return stats_cache.get(key, compute_func, tags)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    # Compteurs du worker qui répond
+    return stats_cache.stats()
+
+
+# ======================================================
+# AGRÉGATS MENSUELS (table stats_mois)
+# ======================================================
+
+# Une ligne par (source, métrique, année, mois) : somme et nombre de valeurs.
+# Chaque écriture marque les mois touchés dans stats_mois_dirty, dans sa propre transaction
+# (une ligne par mois, pas de relecture du mois sur le chemin d'écriture). Le RollupRefresher
+# de chaque worker recalcule ensuite ces mois en tâche de fond, un à la fois sous un verrou
+# nommé MariaDB. Les /stats ne lisent que stats_mois.
+ROLLUP_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS stats_mois (
+        source VARCHAR(32) NOT NULL,
+        metrique VARCHAR(191) NOT NULL,
+        annee SMALLINT NOT NULL,
+        mois TINYINT NOT NULL,
+        somme DOUBLE NOT NULL DEFAULT 0,
+        nb INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (source, metrique, annee, mois)
+    )
+"""
+
+# Mois à recalculer ; metrique vide = toutes les métriques de la source. version change à chaque
+# nouvelle écriture : une ligne n'est effacée que si personne ne l'a remarquée pendant le recalcul.
+ROLLUP_DIRTY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS stats_mois_dirty (
+        source VARCHAR(32) NOT NULL,
+        metrique VARCHAR(191) NOT NULL,
+        annee SMALLINT NOT NULL,
+        mois TINYINT NOT NULL,
+        version INT UNSIGNED NOT NULL DEFAULT 1,
+        PRIMARY KEY (source, metrique, annee, mois)
+    )
+"""
+
+# Les tables de jours (airbnb_loue, presence, ...) ne sont pas agrégées ici : leurs /stats
+# comptent les bitmaps en mémoire (voir BITMAPS DES JOURS), qui font foi.
+ROLLUP_SOURCES = ("rapport", "capteurs")
+
+# colonnes de /stats/rapports/pratiques/annee, dans l'ordre de la réponse
+RAPPORT_METRIQUES = [
+    ("fellation", "fellation"),
+    ("cunnilingus", "cunnilingus"),
+    ("levrette", "levrette"),
+    ("missionnaire", "missionnaire"),
+    ("andromaque", "andromaque"),
+    ("sodomie", "sodomie"),
+    ("fouet", "fouet"),
+    ("ejac_corps", "ejac = 'corps'"),
+    ("ejac_vagin", "ejac = 'vagin'"),
+    ("ejac_bouche", "ejac = 'bouche'"),
+    ("ejac_faciale", "ejac = 'faciale'"),
+    ("ejac_anale", "ejac = 'anale'"),
+    ("ejac_aucune", "ejac = 'aucune'"),
+    ("lingerie_nue", "lingerie = 'nue'"),
+    ("lingerie_string", "lingerie = 'string'"),
+    ("lingerie_pj", "lingerie = 'pj'"),
+    ("lieu_chambre", "lieu = 'chambre'"),
+    ("lieu_salon", "lieu = 'salon'"),
+    ("lieu_autre", "lieu = 'autre'"),
+]
+
+# moyenne journalière d'un capteur (NULL si une heure manque, comme l'ancien AVG)
+CAPTEUR_MOYENNE_JOUR = "(" + "+".join(f"h{heure:02d}" for heure in range(24)) + ") / 24"
+
+ROLLUP_LOCK_PATH = os.path.join(CACHE_DIR, "rollup.lock")
+ROLLUP_LOCK_TIMEOUT = 10  # attente max du verrou nommé d'un mois (s)
+ROLLUP_REFRESH_INTERVAL = float(config.get("ROLLUP_REFRESH_INTERVAL", 10))  # relecture de stats_mois_dirty (s)
+ROLLUP_REFRESH_BATCH = 200  # lignes de stats_mois_dirty traitées par passage
+
+_rollup_lock = Lock()
+_rollup_ready = False
+_rollup_pending = set()  # (source, metrique, annee, mois) écrits avant la création des tables
+
+
+def _as_date(jour) -> date:
+    return jour if isinstance(jour, date) else date.fromisoformat(str(jour))
+
+
+def _next_month(jour: date) -> date:
+    return date(jour.year + 1, 1, 1) if jour.month == 12 else date(jour.year, jour.month + 1, 1)
+
+
+def _rollup_rows(cursor, source: str, start: date, end: date, metriques=None) -> list:
+    # (metrique, annee, mois, somme, nb) pour les jours de [start, end)
+    if source == "rapport":
+        sommes = ", ".join(f"COALESCE(SUM({expression}), 0)" for _, expression in RAPPORT_METRIQUES)
+        cursor.execute(
+            f"""
+            SELECT YEAR(jour), MONTH(jour), COUNT(*), {sommes}
+            FROM rapport
+            WHERE jour >= %s AND jour < %s
+            GROUP BY YEAR(jour), MONTH(jour)
+            """,
+            (start, end)
+        )
+        rows = []
+        for annee, mois, nb, *valeurs in cursor.fetchall():
+            rows.append(("rapports", annee, mois, nb, nb))
+            rows += [(metrique, annee, mois, valeur, nb) for (metrique, _), valeur in zip(RAPPORT_METRIQUES, valeurs)]
+        return rows
+
+    if source == "capteurs":
+        # somme des moyennes journalières et nombre de jours complets, par capteur
+        filtre, params = "", [start, end]
+        if metriques:
+            filtre = f"AND capteur IN ({', '.join(['%s'] * len(metriques))})"
+            params += list(metriques)
         cursor.execute(
-            """
-            INSERT INTO rapport (
-                jour, lieu, lingerie, ejac,
-                fellation, cunnilingus, levrette,
-                missionnaire, andromaque, sodomie, fouet
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                lieu = VALUES(lieu),
-                lingerie = VALUES(lingerie),
-                ejac = VALUES(ejac),
-                fellation = VALUES(fellation),
-                cunnilingus = VALUES(cunnilingus),
-                levrette = VALUES(levrette),
-                missionnaire = VALUES(missionnaire),
-                andromaque = VALUES(andromaque),
-                sodomie = VALUES(sodomie),
-                fouet = VALUES(fouet)
+            f"""
+            SELECT capteur, YEAR(jour), MONTH(jour),
+                   COALESCE(SUM({CAPTEUR_MOYENNE_JOUR}), 0), COUNT({CAPTEUR_MOYENNE_JOUR})
+            FROM capteurs
+            WHERE jour >= %s AND jour < %s {filtre}
+            GROUP BY capteur, YEAR(jour), MONTH(jour)
             """,
-            (
-                entry.jour,
-                entry.lieu.value,
-                entry.lingerie.value,
-                entry.ejac.value,
-                entry.fellation,
-                entry.cunnilingus,
-                entry.levrette,
-                entry.missionnaire,
-                entry.andromaque,
-                entry.sodomie,
-                entry.fouet
-            )
+            params
         )
-        conn.commit()
-        return {"status": "ok", "message": f"Rapport enregistré pour {entry.jour}"}
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"❌ Erreur POST /rapport : {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        return cursor.fetchall()
+
+    raise ValueError(f"Source d'agrégat inconnue : {source}")
+
+
+def refresh_rollup(cursor, source: str, start: date, end: date, metriques=None) -> int:
+    # Remplace les agrégats des mois de [start, end) ; start et end sont des débuts de mois.
+    # Par plage et sans verrou nommé : réservé aux reconstructions et à la maintenance des mois purgés.
+    rows = _rollup_rows(cursor, source, start, end, metriques)
+
+    where = "source = %s AND (annee, mois) >= (%s, %s) AND (annee, mois) < (%s, %s)"
+    params = [source, start.year, start.month, end.year, end.month]
+    if metriques:
+        where += f" AND metrique IN ({', '.join(['%s'] * len(metriques))})"
+        params += list(metriques)
+    cursor.execute(f"DELETE FROM stats_mois WHERE {where}", params)
+
+    for i in range(0, len(rows), BULK_CHUNK_SIZE):
+        chunk = rows[i:i + BULK_CHUNK_SIZE]
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(chunk))
+        params = []
+        for metrique, annee, mois, somme, nb in chunk:
+            params += [source, metrique, annee, mois, float(somme), nb]
+        cursor.execute(
+            f"INSERT INTO stats_mois (source, metrique, annee, mois, somme, nb) VALUES {placeholders}",
+            params
+        )
+    return len(rows)
+
+
+def _rollup_metriques(source: str, metriques=None):
+    # métriques d'un mois pour une source, None si l'ensemble n'est pas connu d'avance
+    if source == "rapport":
+        return ["rapports"] + [metrique for metrique, _ in RAPPORT_METRIQUES]
+    return sorted(metriques) if metriques else None
+
+
+def refresh_rollup_month(cursor, source: str, month: date, metriques=None) -> int:
+    # Un mois, par clés exactes : upsert des métriques calculées, suppression des autres.
+    # Pas de DELETE par plage, donc pas de verrous de plage sur stats_mois.
+    expected = _rollup_metriques(source, metriques)
+    if expected is None:
+        return refresh_rollup(cursor, source, month, _next_month(month))
+    rows = _rollup_rows(cursor, source, month, _next_month(month), metriques)
+    if rows:
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+        params = []
+        for metrique, annee, mois, somme, nb in rows:
+            params += [source, metrique, annee, mois, float(somme), nb]
+        cursor.execute(
+            f"""
+            INSERT INTO stats_mois (source, metrique, annee, mois, somme, nb) VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE somme = VALUES(somme), nb = VALUES(nb)
+            """,
+            params
+        )
+    absent = sorted(set(expected) - {row[0] for row in rows})
+    if absent:
+        cursor.execute(
+            f"""
+            DELETE FROM stats_mois
+            WHERE source = %s AND metrique IN ({', '.join(['%s'] * len(absent))}) AND annee = %s AND mois = %s
+            """,
+            [source] + absent + [month.year, month.month]
+        )
+    return len(rows)
+
+
+def refresh_rollup_months(conn, source: str, months, metriques=None):
+    # Hors de toute transaction d'écriture : un verrou nommé par (source, mois), pris dans l'ordre.
+    cursor = conn.cursor()
+    try:
+        for annee, mois in sorted(months):
+            name = f"celeri_rollup:{source}:{annee}-{mois:02d}"
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (name, ROLLUP_LOCK_TIMEOUT))
+            if cursor.fetchone()[0] != 1:
+                raise RuntimeError(f"verrou {name} indisponible")
+            try:
+                # nouvelle transaction après le verrou : les écritures déjà validées sont visibles
+                conn.commit()
+                refresh_rollup_month(cursor, source, date(annee, mois, 1), metriques)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                cursor.fetchone()
     finally:
         cursor.close()
-        conn.close()
 
 
+def _months_between(first: date, last: date) -> list:
+    months = []
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        months.append((month.year, month.month))
+        month = _next_month(month)
+    return months
+
+
+def _dirty_keys(source: str, jours, metriques=None) -> list:
+    # (source, metrique, annee, mois) triés : les verrous de ligne sont toujours pris dans le même ordre
+    jours = list(map(_as_date, jours))
+    if not jours:
+        return []
+    months = _months_between(min(jours), max(jours))
+    cutoff = capteurs_cutoff() if source == "capteurs" else None
+    if cutoff:
+        # mois purgés par la maintenance : l'agrégat est définitif
+        months = [month for month in months if month >= (cutoff.year, cutoff.month)]
+    return sorted((source, metrique, annee, mois) for annee, mois in months for metrique in (metriques or [""]))
+
+
+def _insert_dirty(cursor, keys):
+    placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(keys))
+    cursor.execute(
+        f"""
+        INSERT INTO stats_mois_dirty (source, metrique, annee, mois) VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE version = version + 1
+        """,
+        [value for key in keys for value in key]
+    )
+
+
+def mark_rollups(cursor, source: str, jours, metriques=None):
+    # Dans la transaction de l'écriture, juste avant son commit : les mois touchés seront recalculés
+    # par le RollupRefresher (réveillé par l'appelant après le commit). Écriture et marque sont atomiques.
+    keys = _dirty_keys(source, jours, metriques)
+    if not keys:
+        return
+    with _rollup_lock:
+        if not _rollup_ready:
+            # tables pas encore créées par init_rollups : marqué au démarrage
+            _rollup_pending.update(keys)
+            return
+    _insert_dirty(cursor, keys)
+
+
+def refresh_dirty_rollups(limit: int = ROLLUP_REFRESH_BATCH) -> int:
+    # Recalcule les mois marqués ; renvoie le nombre de lignes de stats_mois_dirty consommées.
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT source, metrique, annee, mois, version FROM stats_mois_dirty ORDER BY source, annee, mois LIMIT %s",
+                (limit,)
+            )
+            dirty = cursor.fetchall()
+            conn.commit()
+            by_month = {}
+            for source, metrique, annee, mois, version in dirty:
+                by_month.setdefault((source, annee, mois), []).append((metrique, version))
+
+            done = 0
+            refreshed = set()
+            for (source, annee, mois), items in sorted(by_month.items()):
+                metriques = None if any(metrique == "" for metrique, _ in items) else {metrique for metrique, _ in items}
+                if source == "capteurs" and capteurs_frozen(date(annee, mois, 1)):
+                    # marqué avant la purge du mois : son agrégat est figé, la marque est seulement consommée
+                    logger.warning("⚠️ Agrégats capteurs %s-%02d figés (mois purgé), non recalculés", annee, mois)
+                else:
+                    try:
+                        refresh_rollup_months(conn, source, [(annee, mois)], metriques)
+                    except Exception as e:
+                        logger.error("❌ Agrégats %s non recalculés %s-%02d : %s", source, annee, mois, e)
+                        continue
+                for metrique, version in items:
+                    cursor.execute(
+                        """
+                        DELETE FROM stats_mois_dirty
+                        WHERE source = %s AND metrique = %s AND annee = %s AND mois = %s AND version = %s
+                        """,
+                        (source, metrique, annee, mois, version)
+                    )
+                conn.commit()
+                done += len(items)
+                refreshed.add(source)
+        finally:
+            cursor.close()
+    if refreshed:
+        stats_cache.invalidate(*refreshed)
+    return done
+
+
+class RollupRefresher:
+    # Thread du worker qui vide stats_mois_dirty : réveillé après chaque écriture locale,
+    # et au moins toutes les ROLLUP_REFRESH_INTERVAL s pour les écritures des autres workers.
+    def __init__(self, interval):
+        self.interval = interval
+        self._wakeup = Event()
+        self._stop = Event()
+        self._thread = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = Thread(target=self._loop, name="rollups-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stop.is_set() or not _rollup_ready:
+                continue
+            try:
+                # un passage plein : il en reste probablement
+                while refresh_dirty_rollups() >= ROLLUP_REFRESH_BATCH and not self._stop.is_set():
+                    pass
+            except Exception as e:
+                logger.error("❌ Recalcul des agrégats en échec : %s", e)
+
+
+rollup_refresher = RollupRefresher(ROLLUP_REFRESH_INTERVAL)
+
+
+def rebuild_rollups(sources=ROLLUP_SOURCES) -> dict:
+    # Reconstruit tout l'historique, une transaction par année
+    result = {}
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            for source in sources:
+                cursor.execute(f"SELECT MIN(jour), MAX(jour) FROM {source}")
+                first, last = cursor.fetchone()
+                if first is None:
+                    if source != "capteurs":
+                        cursor.execute("DELETE FROM stats_mois WHERE source = %s", (source,))
+                        conn.commit()
+                    result[source] = 0
+                    continue
+                # capteurs : les mois antérieurs à la première ligne ont pu être purgés
+                # par la maintenance, leurs agrégats sont conservés ; ceux d'avant l'horizon
+                # de rétention aussi, même si une ligne tardive y est restée
+                keep_history = source == "capteurs"
+                cutoff = capteurs_cutoff() if keep_history else None
+                if cutoff and first < cutoff:
+                    first = cutoff
+                    if first > last:
+                        cursor.execute(
+                            "DELETE FROM stats_mois WHERE source = %s AND (annee, mois) >= (%s, %s)",
+                            (source, first.year, first.month)
+                        )
+                        conn.commit()
+                        result[source] = 0
+                        continue
+                if keep_history:
+                    cursor.execute("DELETE FROM stats_mois WHERE source = %s AND annee > %s", (source, last.year))
+                else:
+                    cursor.execute(
+                        "DELETE FROM stats_mois WHERE source = %s AND (annee < %s OR annee > %s)",
+                        (source, first.year, last.year)
+                    )
+                lignes = 0
+                for annee in range(first.year, last.year + 1):
+                    start = date(annee, 1, 1)
+                    if keep_history and annee == first.year:
+                        start = date(annee, first.month, 1)
+                    lignes += refresh_rollup(cursor, source, start, date(annee + 1, 1, 1))
+                    conn.commit()
+                result[source] = lignes
+                logger.info("📊 Agrégats %s reconstruits : %s ligne(s) (%s-%s)", source, lignes, first.year, last.year)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    stats_cache.invalidate(*sources)
+    return result
+
+
+def init_rollups():
+    # Au démarrage : crée stats_mois et stats_mois_dirty, reconstruit les sources jamais agrégées
+    # (un seul worker à la fois grâce au verrou fichier) et marque les écritures faites avant.
+    global _rollup_ready, _rollup_pending
+    delay = 5
+    while True:
+        try:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(ROLLUP_TABLE_SQL)
+                cursor.execute(ROLLUP_DIRTY_TABLE_SQL)
+                cursor.close()
+            break
+        except Exception as e:
+            logger.error("❌ Table stats_mois indisponible, nouvel essai dans %ss : %s", delay, e)
+            time.sleep(delay)
+            delay = min(delay * 2, 300)
+
+    with _rollup_lock:
+        _rollup_ready = True
+        pending, _rollup_pending = _rollup_pending, set()
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(ROLLUP_LOCK_PATH, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                # lignes des tables de jours laissées par les versions précédentes, plus maintenues
+                cursor.execute(
+                    f"DELETE FROM stats_mois WHERE source NOT IN ({', '.join(['%s'] * len(ROLLUP_SOURCES))})",
+                    ROLLUP_SOURCES
+                )
+                conn.commit()
+                cursor.execute("SELECT DISTINCT source FROM stats_mois")
+                present = {row[0] for row in cursor.fetchall()}
+                cursor.close()
+            missing = [source for source in ROLLUP_SOURCES if source not in present]
+            if missing:
+                rebuild_rollups(missing)
+    except Exception as e:
+        logger.error("❌ Reconstruction des agrégats impossible : %s", e)
+        missing = []
+
+    pending = sorted(item for item in pending if item[0] not in missing)
+    if pending:
+        try:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                _insert_dirty(cursor, pending)
+                conn.commit()
+                cursor.close()
+            rollup_refresher.wake()
+        except Exception as e:
+            logger.error("❌ Agrégats en attente non marqués %s : %s", pending, e)
+
+
+@app.post("/stats/rollup/rebuild")
+def stats_rollup_rebuild(source: Optional[str] = None):
+    if source is not None and source not in ROLLUP_SOURCES:
+        raise HTTPException(status_code=400, detail=f"Source inconnue (attendu : {', '.join(ROLLUP_SOURCES)})")
+    started = time.perf_counter()
+    try:
+        lignes = rebuild_rollups([source] if source else ROLLUP_SOURCES)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error("❌ Erreur reconstruction des agrégats : %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "ok",
+        "lignes": lignes,
+        "duree_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
 
 
 # ======================================================
-# CACHE MÉMOIRE (Home Assistant friendly)
+# MAINTENANCE : RÉTENTION ET ARCHIVAGE
 # ======================================================
 
-CACHE = {}
-CACHE_TTL = 7200  # 2h
+# Les lignes plus anciennes que l'horizon sont déplacées dans <table>_archive (ou supprimées),
+# par petits lots d'une transaction chacun, avec une pause entre deux lots.
+MAINTENANCE_ENABLED = bool(config.get("MAINTENANCE_ENABLED", False))
+MAINTENANCE_INTERVAL = float(config.get("MAINTENANCE_INTERVAL", 86400))
+MAINTENANCE_ARCHIVE = bool(config.get("MAINTENANCE_ARCHIVE", True))     # False : suppression sans archive
+MAINTENANCE_BATCH_SIZE = int(config.get("MAINTENANCE_BATCH_SIZE", 500))
+MAINTENANCE_PAUSE_MS = int(config.get("MAINTENANCE_PAUSE_MS", 200))
+MAINTENANCE_MAX_BATCHES = int(config.get("MAINTENANCE_MAX_BATCHES", 200))  # par table et par passage
+TRACES_RETENTION_DAYS = int(config.get("TRACES_RETENTION_DAYS", 365))    # 0 : pas de purge
+CAPTEURS_RETENTION_DAYS = int(config.get("CAPTEURS_RETENTION_DAYS", 730))
 
-def cached(key: str, compute_func):
-    now = time.time()
+MAINTENANCE_LOCK_PATH = os.path.join(CACHE_DIR, "maintenance.lock")
+MAINTENANCE_STATE_PATH = os.path.join(CACHE_DIR, "maintenance_state.json")
+
+
+def capteurs_cutoff() -> Optional[date]:
+    # Premier jour conservé dans capteurs : toujours un début de mois, pour que
+    # les agrégats mensuels des mois purgés restent complets.
+    if not MAINTENANCE_ENABLED or CAPTEURS_RETENTION_DAYS <= 0:
+        return None
+    horizon = date.today() - timedelta(days=CAPTEURS_RETENTION_DAYS)
+    return date(horizon.year, horizon.month, 1)
+
+
+def capteurs_frozen(jour: date) -> bool:
+    # Jour d'un mois purgé (ou en cours de purge) : son agrégat stats_mois est définitif,
+    # plus aucune écriture ni aucun recalcul pour ce mois.
+    cutoff = capteurs_cutoff()
+    return cutoff is not None and _as_date(jour) < cutoff
+
+
+def _read_maintenance_state() -> dict:
+    try:
+        with open(MAINTENANCE_STATE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    if key in CACHE:
-        entry = CACHE[key]
-        if now - entry["time"] < CACHE_TTL:
-            return entry["data"]
 
-    data = compute_func()
-    CACHE[key] = {"time": now, "data": data}
-    return data
+def _ensure_archive_table(cursor, table: str):
+    if MAINTENANCE_ARCHIVE:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_archive LIKE {table}")
+
+
+def _pause():
+    time.sleep(MAINTENANCE_PAUSE_MS / 1000)
+
+
+def purge_traces(cutoff: datetime) -> int:
+    moved = 0
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            _ensure_archive_table(cursor, "automation_traces")
+            for _ in range(MAINTENANCE_MAX_BATCHES):
+                if scheduler.stopping:
+                    break
+                cursor.execute(
+                    "SELECT id FROM automation_traces WHERE executed_at < %s ORDER BY executed_at LIMIT %s",
+                    (cutoff, MAINTENANCE_BATCH_SIZE)
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    break
+                placeholders = ", ".join(["%s"] * len(ids))
+                if MAINTENANCE_ARCHIVE:
+                    cursor.execute(
+                        f"INSERT IGNORE INTO automation_traces_archive SELECT * FROM automation_traces WHERE id IN ({placeholders})",
+                        ids
+                    )
+                cursor.execute(f"DELETE FROM automation_traces WHERE id IN ({placeholders})", ids)
+                conn.commit()
+                moved += len(ids)
+                if len(ids) < MAINTENANCE_BATCH_SIZE:
+                    break
+                _pause()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    return moved
+
+
+def purge_capteurs(cutoff: date) -> int:
+    # Mois par mois : l'agrégat stats_mois du mois est recalculé une dernière fois,
+    # puis les lignes horaires sont déplacées par lots (ordre de la clé unique jour, capteur).
+    state = _read_maintenance_state()
+    moved = 0
+    batches = 0
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if not capteurs_unique_key(cursor):
+                raise RuntimeError("Clé unique (jour, capteur) absente sur la table capteurs")
+            _ensure_archive_table(cursor, "capteurs")
+            while batches < MAINTENANCE_MAX_BATCHES and not scheduler.stopping:
+                cursor.execute("SELECT MIN(jour) FROM capteurs")
+                first = cursor.fetchone()[0]
+                if first is None or first >= cutoff:
+                    break
+                month = date(first.year, first.month, 1)
+                month_end = _next_month(month)
+
+                # un mois déjà entamé par un passage précédent garde son agrégat, de même qu'un
+                # mois plus ancien (ligne tardive restée dans un mois déjà purgé) : seule la ligne part
+                aggregated = state.get("capteurs_aggregated")
+                if aggregated is None or month.isoformat() > aggregated:
+                    refresh_rollup(cursor, "capteurs", month, month_end)
+                    conn.commit()
+                    state["capteurs_aggregated"] = month.isoformat()
+                    write_json_atomic(MAINTENANCE_STATE_PATH, state)
+
+                while batches < MAINTENANCE_MAX_BATCHES and not scheduler.stopping:
+                    cursor.execute(
+                        """
+                        SELECT jour, capteur FROM capteurs
+                        WHERE jour >= %s AND jour < %s
+                        ORDER BY jour, capteur
+                        LIMIT %s
+                        """,
+                        (month, month_end, MAINTENANCE_BATCH_SIZE)
+                    )
+                    keys = cursor.fetchall()
+                    if not keys:
+                        break
+                    # toutes les lignes du mois jusqu'à la dernière clé du lot (incluse)
+                    last_jour, last_capteur = keys[-1]
+                    where = "jour >= %s AND (jour < %s OR (jour = %s AND capteur <= %s))"
+                    params = (month, last_jour, last_jour, last_capteur)
+                    if MAINTENANCE_ARCHIVE:
+                        cursor.execute(f"INSERT IGNORE INTO capteurs_archive SELECT * FROM capteurs WHERE {where}", params)
+                    cursor.execute(f"DELETE FROM capteurs WHERE {where}", params)
+                    conn.commit()
+                    moved += len(keys)
+                    batches += 1
+                    _pause()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    return moved
+
+
+_maintenance_lock = Lock()
+
+def run_maintenance() -> dict:
+    # Un seul passage à la fois, tous workers confondus
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with _maintenance_lock, open(MAINTENANCE_LOCK_PATH, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise RuntimeError("Maintenance déjà en cours")
+        started = time.perf_counter()
+        result = {"traces": 0, "capteurs": 0}
+        if TRACES_RETENTION_DAYS > 0:
+            cutoff = datetime.combine(date.today() - timedelta(days=TRACES_RETENTION_DAYS), datetime.min.time())
+            result["traces"] = purge_traces(cutoff)
+        cutoff = capteurs_cutoff()
+        if cutoff:
+            result["capteurs"] = purge_capteurs(cutoff)
+        if result["capteurs"]:
+            stats_cache.invalidate("capteurs")
+        result["duree_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        action = "archivée(s)" if MAINTENANCE_ARCHIVE else "supprimée(s)"
+        logger.info("🧹 Maintenance : %s trace(s) et %s ligne(s) capteurs %s", result['traces'], result['capteurs'], action)
+        return result
+
+
+if MAINTENANCE_ENABLED:
+    scheduler.add_job(Job("maintenance", run_maintenance, MAINTENANCE_INTERVAL, 600, SYNC_MAX_BACKOFF))
+
+
+@app.post("/maintenance/run")
+def maintenance_run():
+    if not MAINTENANCE_ENABLED:
+        raise HTTPException(status_code=400, detail="Maintenance désactivée (MAINTENANCE_ENABLED)")
+    try:
+        return run_maintenance()
+    except PoolTimeout:
+        raise
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error("❌ Erreur maintenance : %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 # ======================================================
@@ -742,43 +3934,12 @@ def cached(key: str, compute_func):
 
 @app.get("/stats/airbnb/annee")
 def airbnb_par_annee():
-    def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT YEAR(jour) AS annee, COUNT(*) AS nb_jours_loues
-            FROM airbnb_loue
-            WHERE loue = 1
-            GROUP BY YEAR(jour)
-            ORDER BY annee
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"data": rows}
-
-    return cached("airbnb_annee", compute)
+    return day_flag_stats("loue", "nb_jours_loues", par_mois=False)
 
 
 @app.get("/stats/airbnb/mois")
 def airbnb_par_mois_et_annee():
-    def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT
-                YEAR(jour) AS annee,
-                MONTH(jour) AS mois,
-                COUNT(*) AS nb_jours_loues
-            FROM airbnb_loue
-            WHERE loue = 1
-            GROUP BY YEAR(jour), MONTH(jour)
-            ORDER BY annee, mois
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"data": rows}
-
-    return cached("airbnb_mois", compute)
+    return day_flag_stats("loue", "nb_jours_loues", par_mois=True)
 
 
 # ======================================================
@@ -787,43 +3948,12 @@ def airbnb_par_mois_et_annee():
 
 @app.get("/stats/presence/annee")
 def presence_par_annee():
-    def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT YEAR(jour) AS annee, COUNT(*) AS nb_jours
-            FROM presence
-            WHERE presence = 1
-            GROUP BY YEAR(jour)
-            ORDER BY annee
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"data": rows}
-
-    return cached("presence_annee", compute)
+    return day_flag_stats("presence", "nb_jours", par_mois=False)
 
 
 @app.get("/stats/presence/mois")
 def presence_par_mois_et_annee():
-    def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT
-                YEAR(jour) AS annee,
-                MONTH(jour) AS mois,
-                COUNT(*) AS nb_jours
-            FROM presence
-            WHERE presence = 1
-            GROUP BY YEAR(jour), MONTH(jour)
-            ORDER BY annee, mois
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"data": rows}
-
-    return cached("presence_mois", compute)
+    return day_flag_stats("presence", "nb_jours", par_mois=True)
 
 
 # ======================================================
@@ -832,43 +3962,12 @@ def presence_par_mois_et_annee():
 
 @app.get("/stats/teletravail/annee")
 def teletravail_par_annee():
-    def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT YEAR(jour) AS annee, COUNT(*) AS nb_jours
-            FROM teletravail
-            WHERE teletravail = 1
-            GROUP BY YEAR(jour)
-            ORDER BY annee
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"data": rows}
-
-    return cached("teletravail_annee", compute)
+    return day_flag_stats("teletravail", "nb_jours", par_mois=False)
 
 
 @app.get("/stats/teletravail/mois")
 def teletravail_par_mois_et_annee():
-    def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT
-                YEAR(jour) AS annee,
-                MONTH(jour) AS mois,
-                COUNT(*) AS nb_jours
-            FROM teletravail
-            WHERE teletravail = 1
-            GROUP BY YEAR(jour), MONTH(jour)
-            ORDER BY annee, mois
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"data": rows}
-
-    return cached("teletravail_mois", compute)
+    return day_flag_stats("teletravail", "nb_jours", par_mois=True)
 
 
 # ======================================================
@@ -877,43 +3976,12 @@ def teletravail_par_mois_et_annee():
 
 @app.get("/stats/cheminee/annee")
 def cheminee_par_annee():
-    def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT YEAR(jour) AS annee, COUNT(*) AS nb_jours
-            FROM cheminee
-            WHERE cheminee = 1
-            GROUP BY YEAR(jour)
-            ORDER BY annee
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"data": rows}
-
-    return cached("cheminee_annee", compute)
+    return day_flag_stats("cheminee", "nb_jours", par_mois=False)
 
 
 @app.get("/stats/cheminee/mois")
 def cheminee_par_mois_et_annee():
-    def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT
-                YEAR(jour) AS annee,
-                MONTH(jour) AS mois,
-                COUNT(*) AS nb_jours
-            FROM cheminee
-            WHERE cheminee = 1
-            GROUP BY YEAR(jour), MONTH(jour)
-            ORDER BY annee, mois
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        return {"data": rows}
-
-    return cached("cheminee_mois", compute)
+    return day_flag_stats("cheminee", "nb_jours", par_mois=True)
 
 
 # ======================================================
@@ -923,78 +3991,59 @@ def cheminee_par_mois_et_annee():
 @app.get("/stats/rapports/annee")
 def rapports_par_annee():
     def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT YEAR(jour) AS annee, COUNT(*) AS nb_rapports
-            FROM rapport
-            GROUP BY YEAR(jour)
-            ORDER BY annee
-        """)
-        rows = cur.fetchall()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor(dictionary=True)
+            cur.execute("""
+                SELECT annee, CAST(SUM(somme) AS SIGNED) AS nb_rapports
+                FROM stats_mois
+                WHERE source = 'rapport' AND metrique = 'rapports'
+                GROUP BY annee
+                ORDER BY annee
+            """)
+            rows = cur.fetchall()
         return {"data": rows}
 
-    return cached("rapports_annee", compute)
+    return cached("rapports_annee", compute, tags=("rapport",))
 
 
 @app.get("/stats/rapports/mois")
 def rapports_par_mois_et_annee():
     def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT
-                YEAR(jour) AS annee,
-                MONTH(jour) AS mois,
-                COUNT(*) AS nb_rapports
-            FROM rapport
-            GROUP BY YEAR(jour), MONTH(jour)
-            ORDER BY annee, mois
-        """)
-        rows = cur.fetchall()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor(dictionary=True)
+            cur.execute("""
+                SELECT annee, mois, CAST(somme AS SIGNED) AS nb_rapports
+                FROM stats_mois
+                WHERE source = 'rapport' AND metrique = 'rapports'
+                ORDER BY annee, mois
+            """)
+            rows = cur.fetchall()
         return {"data": rows}
 
-    return cached("rapports_mois", compute)
+    return cached("rapports_mois", compute, tags=("rapport",))
 
 
 @app.get("/stats/rapports/pratiques/annee")
 def rapports_pratiques_par_annee():
     def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT
-                YEAR(jour) AS annee,
-                SUM(fellation) AS fellation,
-                SUM(cunnilingus) AS cunnilingus,
-                SUM(levrette) AS levrette,
-                SUM(missionnaire) AS missionnaire,
-                SUM(andromaque) AS andromaque,
-                SUM(sodomie) AS sodomie,
-                SUM(fouet) AS fouet,
-                sum(ejac = 'corps') as ejac_corps,
-                sum(ejac = 'vagin') as ejac_vagin,
-                sum(ejac = 'bouche') as ejac_bouche,
-                sum(ejac = 'faciale') as ejac_faciale,
-                sum(ejac = 'anale') as ejac_anale,
-                sum(ejac = 'aucune') as ejac_aucune,
-                sum(lingerie = 'nue') as lingerie_nue,
-                sum(lingerie = 'string') as lingerie_string,
-                sum(lingerie = 'pj') as lingerie_pj,
-                sum(lieu = 'chambre') as lieu_chambre,
-                sum(lieu = 'salon') as lieu_salon,
-                sum(lieu = 'autre') as lieu_autre
-            FROM rapport
-            GROUP BY YEAR(jour)
-            ORDER BY annee
-        """)
-        rows = cur.fetchall()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT annee, metrique, CAST(SUM(somme) AS SIGNED)
+                FROM stats_mois
+                WHERE source = 'rapport'
+                GROUP BY annee, metrique
+            """)
+            totaux = {}
+            for annee, metrique, total in cur.fetchall():
+                totaux.setdefault(annee, {})[metrique] = total
+            cur.close()
+        rows = []
+        for annee in sorted(totaux):
+            rows.append({"annee": annee, **{metrique: totaux[annee].get(metrique, 0) for metrique, _ in RAPPORT_METRIQUES}})
         return {"data": rows}
 
-    return cached("rapports_pratiques_annee", compute)
+    return cached("rapports_pratiques_annee", compute, tags=("rapport",))
 
 
 # ======================================================
@@ -1006,23 +4055,160 @@ def capteurs_moyenne_mois(capteur: str):
     cache_key = f"capteurs_{capteur}_mois"
 
     def compute():
-        conn = get_connection()
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-            SELECT
-                YEAR(jour) AS annee,
-                MONTH(jour) AS mois,
-                ROUND(AVG(
-                    (h00+h01+h02+h03+h04+h05+h06+h07+h08+h09+h10+h11+
-                     h12+h13+h14+h15+h16+h17+h18+h19+h20+h21+h22+h23) / 24
-                ), 2) AS moyenne
-            FROM capteurs
-            WHERE capteur = %s
-            GROUP BY YEAR(jour), MONTH(jour)
-            ORDER BY annee, mois
-        """, (capteur,))
-        rows = cur.fetchall()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor(dictionary=True)
+            # moyenne des moyennes journalières = somme / nombre de jours complets
+            cur.execute("""
+                SELECT
+                    annee,
+                    mois,
+                    CASE WHEN nb > 0 THEN ROUND(somme / nb, 2) END AS moyenne
+                FROM stats_mois
+                WHERE source = 'capteurs' AND metrique = %s
+                ORDER BY annee, mois
+            """, (capteur,))
+            rows = cur.fetchall()
         return {"data": rows}
 
-    return cached(cache_key, compute)
+    return cached(cache_key, compute, tags=("capteurs",))
+
+
+# ======================================================
+# CAPTEURS : STATISTIQUES MULTI-CAPTEURS (NumPy)
+# ======================================================
+
+CAPTEURS_PERCENTILES = (10, 50, 90)
+
+
+def _parse_list(value: str) -> list:
+    return list(dict.fromkeys(item.strip() for item in value.split(",") if item.strip()))
+
+
+def _nan_to_none(values, digits: int = 2) -> list:
+    return [None if np.isnan(value) else round(float(value), digits) for value in values]
+
+
+def capteurs_statistiques(rows: list, periode: str, percentiles=CAPTEURS_PERCENTILES) -> dict:
+    # rows : (capteur, jour, h00..h23) triées par capteur puis jour.
+    # Les heures absentes sont des NaN : elles sont ignorées, au lieu de rendre la journée NULL.
+    if not rows:
+        return {}
+    capteurs = [row[0] for row in rows]
+    jours = [row[1] for row in rows]
+    valeurs = np.array([row[2:] for row in rows], dtype=float)  # (jours, 24), None -> NaN
+
+    annees = np.fromiter((jour.year for jour in jours), dtype=np.int32, count=len(jours))
+    if periode == "mois":
+        periodes = annees * 100 + np.fromiter((jour.month for jour in jours), dtype=np.int32, count=len(jours))
+    else:
+        periodes = annees
+    _, capteur_ids = np.unique(np.array(capteurs, dtype=object), return_inverse=True)
+
+    # début de chaque groupe (capteur, période) : les lignes sont déjà triées
+    change = np.flatnonzero((np.diff(capteur_ids) != 0) | (np.diff(periodes) != 0)) + 1
+    starts = np.concatenate(([0], change))
+
+    present = ~np.isnan(valeurs)
+    sommes = np.add.reduceat(np.where(present, valeurs, 0.0), starts, axis=0)   # (groupes, 24)
+    nombres = np.add.reduceat(present, starts, axis=0)
+    minimums = np.fmin.reduceat(valeurs, starts, axis=0)
+    maximums = np.fmax.reduceat(valeurs, starts, axis=0)
+    jours_par_groupe = np.diff(np.append(starts, len(rows)))
+
+    # percentiles : groupes recopiés dans une matrice (groupes, jours max x 24) complétée de NaN,
+    # puis un seul nanpercentile par ligne
+    groupes = np.repeat(np.arange(len(starts)), jours_par_groupe)
+    rangs = np.arange(len(rows)) - starts[groupes]
+    matrice = np.full((len(starts), int(jours_par_groupe.max()), 24), np.nan)
+    matrice[groupes, rangs] = valeurs
+
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # groupe sans aucune valeur : NaN
+        profils = sommes / nombres
+        moyennes = sommes.sum(axis=1) / nombres.sum(axis=1)
+        minimums = np.fmin.reduce(minimums, axis=1)
+        maximums = np.fmax.reduce(maximums, axis=1)
+        quantiles = np.nanpercentile(matrice.reshape(len(starts), -1), percentiles, axis=1).T  # (groupes, percentiles)
+
+    result = {}
+    for g, start in enumerate(starts):
+        periode_value = int(periodes[start])
+        entry = {"annee": periode_value // 100} if periode == "mois" else {"annee": periode_value}
+        if periode == "mois":
+            entry["mois"] = periode_value % 100
+        entry.update({
+            "moyenne": _nan_to_none([moyennes[g]])[0],
+            "min": _nan_to_none([minimums[g]])[0],
+            "max": _nan_to_none([maximums[g]])[0],
+            **{f"p{p}": value for p, value in zip(percentiles, _nan_to_none(quantiles[g]))},
+            "nb_valeurs": int(nombres[g].sum()),
+            "nb_jours": int(jours_par_groupe[g]),
+            "profil": _nan_to_none(profils[g]),
+        })
+        result.setdefault(capteurs[start], []).append(entry)
+    return result
+
+
+@app.get("/stats/capteurs")
+def capteurs_statistiques_multi(
+    capteurs: str,
+    periode: str = "mois",
+    percentiles: str = ",".join(str(p) for p in CAPTEURS_PERCENTILES),
+    from_: Optional[date] = Query(default=None, alias="from"),
+    to: Optional[date] = None,
+):
+    noms = _parse_list(capteurs)
+    if not noms:
+        raise HTTPException(status_code=400, detail="capteurs : au moins un nom attendu (a,b,c)")
+    if periode not in ("mois", "annee"):
+        raise HTTPException(status_code=400, detail="periode : mois ou annee")
+    try:
+        quantiles = tuple(sorted({float(p) for p in _parse_list(percentiles)}))
+    except ValueError:
+        quantiles = ()
+    if not quantiles or not all(0 <= p <= 100 for p in quantiles):
+        raise HTTPException(status_code=400, detail="percentiles : liste de nombres entre 0 et 100")
+    quantiles = tuple(int(p) if p.is_integer() else p for p in quantiles)
+
+    cache_key = f"capteurs_multi_{periode}_{'|'.join(sorted(noms))}_{','.join(map(str, quantiles))}_{from_}_{to}"
+
+    def compute():
+        # un seul parcours pour tous les capteurs demandés
+        filtres, params = [f"capteur IN ({', '.join(['%s'] * len(noms))})"], list(noms)
+        if from_:
+            filtres.append("jour >= %s")
+            params.append(from_)
+        if to:
+            filtres.append("jour <= %s")
+            params.append(to)
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT capteur, jour, {', '.join(f'h{heure:02d}' for heure in range(24))}
+                FROM capteurs
+                WHERE {' AND '.join(filtres)}
+                ORDER BY capteur, jour
+                """,
+                params
+            )
+            rows = cur.fetchall()
+            cur.close()
+        data = capteurs_statistiques(rows, periode, quantiles)
+        return {"periode": periode, "percentiles": list(quantiles), "data": {nom: data.get(nom, []) for nom in noms}}
+
+    return cached(cache_key, compute, tags=("capteurs",))
+
+
+if __name__ == "__main__":
+    # python main.py rebuild-rollups [source ...] : reconstruit stats_mois hors du serveur
+    import sys
+
+    sources = sys.argv[2:] or ROLLUP_SOURCES
+    if sys.argv[1:2] != ["rebuild-rollups"] or not set(sources) <= set(ROLLUP_SOURCES):
+        sys.exit(f"usage : python main.py rebuild-rollups [{' | '.join(ROLLUP_SOURCES)} ...]")
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(ROLLUP_TABLE_SQL)
+        cursor.close()
+    print(json.dumps(rebuild_rollups(sources)))
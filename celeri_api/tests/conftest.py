@@ -0,0 +1,135 @@
+# Tests unitaires de main.py, sans MariaDB.
+# main.py lit ses options à l'import : un fichier d'options temporaire (comme bench/run.py)
+# est écrit avant, avec un CACHE_DIR jetable.
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="celeri_tests_")
+_options_path = os.path.join(_workdir, "options.json")
+with open(_options_path, "w") as f:
+    json.dump({
+        "DB_HOST": "127.0.0.1",
+        "DB_USER": "celeri",
+        "DB_PASSWORD": "celeri",
+        "DB_NAME": "celeri",
+        "CACHE_DIR": os.path.join(_workdir, "cache"),
+        "SCHEDULER_ENABLED": False,
+    }, f)
+os.environ["CELERI_OPTIONS"] = _options_path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+class FakeCursor:
+    # curseur mysql.connector minimal : garde les requêtes exécutées,
+    # les lignes renvoyées viennent de la FakeDatabase (aucune sans base)
+    def __init__(self, database=None):
+        self.database = database
+        self.executed = []
+        self.rowcount = 0
+        self._rows = []
+
+    def execute(self, operation, params=None):
+        sql = " ".join(operation.split())
+        self.executed.append((sql, params))
+        self._rows = []
+        self.rowcount = 1
+        if self.database is not None:
+            self.database.executed.append((sql, params))
+            self._rows = list(self.database.rows(sql, params))
+            self.rowcount = len(self._rows) or 1
+
+    def executemany(self, operation, seq_params):
+        for params in seq_params:
+            self.execute(operation, params)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    in_transaction = False
+
+    def __init__(self, database):
+        self.database = database
+        self.closed = False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.database)
+
+    def commit(self):
+        self.database.executed.append(("COMMIT", None))
+
+    def rollback(self):
+        self.database.executed.append(("ROLLBACK", None))
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDatabase:
+    # Remplace MariaDB derrière le pool de main.py : réponses par fragment de SQL
+    def __init__(self):
+        self.executed = []
+        self.connections = 0
+        self._answers = []  # (fragment, lignes ou fonction (sql, params) -> lignes)
+        self.fail = None    # exception levée à la prochaine requête
+
+    def answer(self, fragment, rows):
+        self._answers.insert(0, (fragment, rows))
+
+    def rows(self, sql, params):
+        if self.fail is not None:
+            error, self.fail = self.fail, None
+            raise error
+        for fragment, rows in self._answers:
+            if fragment in sql:
+                return rows(sql, params) if callable(rows) else rows
+        return []
+
+    def connect(self):
+        self.connections += 1
+        return FakeConnection(self)
+
+    def statements(self, fragment):
+        return [(sql, params) for sql, params in self.executed if fragment in sql]
+
+
+@pytest.fixture
+def fake_db(monkeypatch, tmp_path):
+    # pool neuf sur une base factice, caches du worker vidés
+    database = FakeDatabase()
+    monkeypatch.setattr(main, "get_connection", database.connect)
+    monkeypatch.setattr(main, "_pool", main.ConnectionPool(2, 0.2, 30, 3600))
+    monkeypatch.setattr(main, "day_flags", main.DayFlagStore(str(tmp_path), 0))
+    monkeypatch.setattr(main, "stats_cache", main.StatsCache(60, 60, str(tmp_path), main.MemoryCacheStore(1 << 20, {})))
+    monkeypatch.setattr(main, "_rollup_pending", set())
+    return database
+
+
+@pytest.fixture
+def client(fake_db):
+    from fastapi.testclient import TestClient
+    return TestClient(main.app)
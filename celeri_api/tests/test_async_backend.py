@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+import main
+
+aiomysql = pytest.importorskip("aiomysql")
+
+
+class _Reader:
+    eof_received = False
+
+    def at_eof(self):
+        return False
+
+    def exception(self):
+        return None
+
+
+class _Connection:
+    # connexion aiomysql minimale, telle que la voit aiomysql.Pool
+    def __init__(self, loop):
+        self.closed = False
+        self.last_usage = loop.time()
+        self._reader = _Reader()
+
+    def get_transaction_status(self):
+        return False
+
+    def close(self):
+        self.closed = True
+
+    async def ensure_closed(self):
+        self.closed = True
+
+
+async def _backend(monkeypatch, size):
+    opened = []
+
+    async def connect(**kwargs):
+        opened.append(_Connection(asyncio.get_running_loop()))
+        return opened[-1]
+
+    monkeypatch.setattr(aiomysql.pool, "connect", connect)
+    backend = main.AsyncBackend(size, 1.0, 3600)
+    backend.pool = await aiomysql.create_pool(minsize=0, maxsize=size)
+    return backend, opened
+
+
+def test_broken_connection_is_dropped_and_wakes_waiters(monkeypatch):
+    async def scenario():
+        backend, opened = await _backend(monkeypatch, 1)
+        held = asyncio.Event()
+
+        async def failing():
+            with pytest.raises(RuntimeError):
+                async with backend.connection():
+                    held.set()
+                    await asyncio.sleep(0.05)
+                    raise RuntimeError("connexion perdue")
+
+        async def waiting():
+            await held.wait()
+            async with backend.connection() as conn:
+                return conn
+
+        _, conn = await asyncio.wait_for(asyncio.gather(failing(), waiting()), 0.5)
+        assert opened[0].closed and conn is opened[1]
+        assert backend.pool.freesize == 1 and backend.pool.size == 1
+
+    asyncio.run(scenario())
+
+
+def test_healthy_connection_is_reused(monkeypatch):
+    async def scenario():
+        backend, opened = await _backend(monkeypatch, 1)
+        async with backend.connection():
+            pass
+        async with backend.connection() as conn:
+            assert conn is opened[0]
+        assert len(opened) == 1
+
+    asyncio.run(scenario())
+
+
+def test_sync_and_async_pools_share_db_pool_size():
+    if main.ASYNC_MODE:
+        assert main.SYNC_POOL_SIZE + main.ASYNC_POOL_SIZE == max(main.DB_POOL_SIZE, 2)
+    else:
+        assert (main.SYNC_POOL_SIZE, main.ASYNC_POOL_SIZE) == (main.DB_POOL_SIZE, 0)
@@ -0,0 +1,92 @@
+from decimal import Decimal
+from datetime import date
+
+import pytest
+
+import main
+
+
+def _entry(time, namespace, size=10, tags=("capteurs",)):
+    return {
+        "time": time, "data": {"n": 1}, "serialized": '{"n": 1}', "tags": tags,
+        "generations": "", "namespace": namespace, "size": size,
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(max_bytes, namespace_limits):
+        if request.param == "memory":
+            return main.MemoryCacheStore(max_bytes, namespace_limits)
+        return main.SQLiteCacheStore(str(tmp_path / "cache.sqlite"), max_bytes, namespace_limits)
+    return make
+
+
+def test_store_get_put_delete(make_store):
+    store = make_store(1000, {})
+    assert store.put("a", _entry(100, "stats"), expire_before=0) == []
+    entry = store.get("a")
+    assert entry["data"] == {"n": 1}
+    assert entry["namespace"] == "stats" and entry["size"] == 10
+    store.delete("a")
+    assert store.get("a") is None
+
+
+def test_store_namespace_limit_evicts_oldest_of_namespace(make_store):
+    store = make_store(1000, {"capteurs": {"max_entries": 2}})
+    store.put("c1", _entry(100, "capteurs"), expire_before=0)
+    store.put("s1", _entry(101, "stats"), expire_before=0)
+    store.put("c2", _entry(102, "capteurs"), expire_before=0)
+    assert store.put("c3", _entry(103, "capteurs"), expire_before=0) == ["capteurs"]
+    assert store.get("c1") is None
+    assert store.get("s1") is not None
+    assert store.usage()["capteurs"]["entries"] == 2
+
+
+def test_store_global_limit_evicts_least_recently_used(make_store):
+    store = make_store(30, {})
+    store.put("a", _entry(100, "stats"), expire_before=0)
+    store.put("b", _entry(101, "stats"), expire_before=0)
+    store.put("c", _entry(102, "stats"), expire_before=0)
+    assert store.put("d", _entry(103, "stats"), expire_before=0) == ["stats"]
+    assert store.get("a") is None
+    assert store.get("d") is not None
+
+
+def test_store_put_purges_expired_entries(make_store):
+    store = make_store(1000, {})
+    store.put("vieux", _entry(100, "stats"), expire_before=0)
+    store.put("recent", _entry(200, "capteurs"), expire_before=0)
+    # expirées, pas évincées : non renvoyées
+    assert store.put("nouveau", _entry(300, "stats"), expire_before=150) == []
+    assert store.get("vieux") is None
+    assert store.get("recent") is not None
+    assert store.usage()["stats"]["entries"] == 1
+
+
+def test_store_delete_tags(make_store):
+    store = make_store(1000, {})
+    store.put("a", _entry(100, "stats", tags=("presence",)), expire_before=0)
+    store.put("b", _entry(100, "stats", tags=("capteurs", "rapport")), expire_before=0)
+    assert store.delete_tags(["rapport"]) == ["stats"]
+    assert store.get("a") is not None
+    assert store.get("b") is None
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_stats_cache_returns_same_types_on_miss_and_hit(tmp_path, backend):
+    if backend == "memory":
+        store = main.MemoryCacheStore(1 << 20, {})
+    else:
+        store = main.SQLiteCacheStore(str(tmp_path / "cache.sqlite"), 1 << 20, {})
+    cache = main.StatsCache(60, 60, str(tmp_path), store)
+
+    def compute():
+        return {"data": [{"annee": 2024, "nb": Decimal("12"), "moyenne": Decimal("19.52"), "jour": date(2024, 1, 5)}]}
+
+    expected = {"data": [{"annee": 2024, "nb": 12, "moyenne": 19.52, "jour": "2024-01-05"}]}
+    miss = cache.get("stats_test", compute, tags=("capteurs",))
+    hit = cache.get("stats_test", compute, tags=("capteurs",))
+    assert miss == hit == expected
+    assert isinstance(hit["data"][0]["nb"], int)
+    assert isinstance(hit["data"][0]["moyenne"], float)
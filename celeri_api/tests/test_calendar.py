@@ -0,0 +1,96 @@
+from datetime import date
+
+import main
+
+
+def test_reservation_index_merges_overlapping_and_adjacent_intervals():
+    index = main.ReservationIndex([
+        (date(2024, 3, 10), date(2024, 3, 12)),
+        (date(2024, 3, 1), date(2024, 3, 5)),
+        (date(2024, 3, 4), date(2024, 3, 7)),
+        (date(2024, 3, 12), date(2024, 3, 14)),
+        (date(2024, 4, 1), date(2024, 4, 1)),  # vide : ignoré
+    ])
+    assert index.intervals() == [
+        (date(2024, 3, 1), date(2024, 3, 7)),
+        (date(2024, 3, 10), date(2024, 3, 14)),
+    ]
+
+
+def test_reservation_index_end_is_exclusive():
+    index = main.ReservationIndex([(date(2024, 3, 1), date(2024, 3, 3))])
+    assert not index.is_reserved(date(2024, 2, 29))
+    assert index.is_reserved(date(2024, 3, 1))
+    assert index.is_reserved(date(2024, 3, 2))
+    assert not index.is_reserved(date(2024, 3, 3))
+
+
+def test_reserved_days_clips_to_bounds():
+    index = main.ReservationIndex([
+        (date(2024, 2, 27), date(2024, 3, 2)),
+        (date(2024, 3, 5), date(2024, 3, 7)),
+        (date(2024, 3, 20), date(2024, 3, 22)),
+    ])
+    assert index.reserved_days(date(2024, 3, 1), date(2024, 3, 5)) == [
+        date(2024, 3, 1),
+        date(2024, 3, 5),
+    ]
+    assert index.reserved_days(date(2024, 3, 8), date(2024, 3, 19)) == []
+
+
+def test_reservation_index_from_events_keeps_reserved_only():
+    index = main.ReservationIndex.from_events([
+        {"summary": "Reserved", "start": date(2024, 6, 1), "end": date(2024, 6, 3)},
+        {"summary": "Airbnb (Not available)", "start": date(2024, 6, 10), "end": date(2024, 6, 12)},
+    ])
+    assert index.intervals() == [(date(2024, 6, 1), date(2024, 6, 3))]
+
+
+class _Response:
+    status_code = 200
+    headers = {"ETag": '"v1"'}
+    text = "BEGIN:VCALENDAR\nEND:VCALENDAR\n"
+
+    def raise_for_status(self):
+        pass
+
+
+def test_failed_fetch_is_not_retried_before_max_age(monkeypatch):
+    url = "https://calendrier.invalid/panne.ics"
+    monkeypatch.setattr(main, "_calendar_cache", {})
+    monkeypatch.setattr(main, "_calendar_failures", {})
+    calls = []
+
+    def get(*args, **kwargs):
+        calls.append(args[0])
+        if len(calls) > 1:
+            raise main.requests.ConnectionError("Airbnb indisponible")
+        return _Response()
+
+    monkeypatch.setattr(main.requests, "get", get)
+    assert main.fetch_calendar(url) == (_Response.text, True)
+    main._calendar_cache[url]["fetched_at"] -= 3600
+
+    # panne : la dernière version connue est servie, sans nouvel essai pendant max_age
+    assert main.fetch_calendar(url, max_age=300) == (_Response.text, False)
+    assert main.fetch_calendar(url, max_age=300) == (_Response.text, False)
+    assert len(calls) == 2
+    # la synchro (max_age=0) réessaie toujours
+    main.fetch_calendar(url)
+    assert len(calls) == 3
+
+
+def test_failed_fetch_without_cache_returns_none(monkeypatch):
+    url = "https://calendrier.invalid/jamais.ics"
+    monkeypatch.setattr(main, "_calendar_cache", {})
+    monkeypatch.setattr(main, "_calendar_failures", {})
+    calls = []
+
+    def get(*args, **kwargs):
+        calls.append(args[0])
+        raise main.requests.ConnectionError("Airbnb indisponible")
+
+    monkeypatch.setattr(main.requests, "get", get)
+    assert main.fetch_calendar(url, max_age=300) == (None, False)
+    assert main.fetch_calendar(url, max_age=300) == (None, False)
+    assert len(calls) == 1
@@ -0,0 +1,83 @@
+import json
+import os
+from datetime import date
+
+import main
+
+
+def _lecture(jour, capteur, heure, valeur):
+    return main.CapteurHeureUpdate(jour=jour, capteur=capteur, heure=heure, valeur=valeur)
+
+
+def test_capteur_buffer_flush_writes_last_value_and_removes_journal(tmp_path, monkeypatch):
+    buffer = main.CapteurBuffer(str(tmp_path), 30, 1000)
+    written = []
+    monkeypatch.setattr(buffer, "_write", written.append)
+
+    buffer.add([_lecture(date(2024, 1, 1), "salon", 7, 19.0), _lecture(date(2024, 1, 1), "salon", 7, 19.5)])
+    assert len(os.listdir(tmp_path)) == 1
+    assert buffer.flush() == 2
+    assert written == [{(date(2024, 1, 1), "salon"): {7: 19.5}}]
+    assert os.listdir(tmp_path) == []
+
+
+def test_capteur_buffer_keeps_journal_when_write_fails(tmp_path, monkeypatch):
+    buffer = main.CapteurBuffer(str(tmp_path), 30, 1000)
+
+    def fail(rows):
+        raise RuntimeError("base indisponible")
+
+    monkeypatch.setattr(buffer, "_write", fail)
+    buffer.add([_lecture(date(2024, 1, 1), "salon", 7, 19.0)])
+    assert buffer.flush() == 0
+    assert len(os.listdir(tmp_path)) == 1
+
+    written = []
+    monkeypatch.setattr(buffer, "_write", written.append)
+    assert buffer.flush() == 1
+    assert written == [{(date(2024, 1, 1), "salon"): {7: 19.0}}]
+    assert os.listdir(tmp_path) == []
+
+
+def test_capteur_buffer_replays_journals_of_dead_process(tmp_path, monkeypatch):
+    # journal d'un ancien process de même pid (redémarrage) et d'un pid disparu, ligne tronquée comprise
+    lignes = [
+        {"jour": "2024-01-01", "capteur": "salon", "heure": 7, "valeur": 19.0},
+        {"jour": "2024-01-01", "capteur": "salon", "heure": 7, "valeur": 19.5},
+    ]
+    ancien = tmp_path / f"capteurs_journal_{os.getpid()}-0123456789ab.1.jsonl"
+    ancien.write_text("".join(json.dumps(ligne) + "\n" for ligne in lignes) + '{"jour": "2024-')
+    (tmp_path / "capteurs_journal_999999999.jsonl").write_text(
+        json.dumps({"jour": "2024-01-02", "capteur": "chambre", "heure": 8, "valeur": 18.0}) + "\n"
+    )
+    (tmp_path / "autre.jsonl").write_text("")
+
+    buffer = main.CapteurBuffer(str(tmp_path), 30, 1000)
+    written = []
+    monkeypatch.setattr(buffer, "_write", written.append)
+    buffer.add([_lecture(date(2024, 1, 3), "salon", 9, 21.0)])
+    buffer.replay_journals()
+
+    assert {(jour, capteur): heures for rows in written for (jour, capteur), heures in rows.items()} == {
+        (date(2024, 1, 1), "salon"): {7: 19.5},
+        (date(2024, 1, 2), "chambre"): {8: 18.0},
+    }
+    # le journal courant de ce process n'est pas rejoué
+    restants = sorted(os.listdir(tmp_path))
+    assert restants == ["autre.jsonl", os.path.basename(buffer._journal_path())]
+
+
+def test_capteur_buffer_replay_keeps_journal_when_write_fails(tmp_path, monkeypatch):
+    journal = tmp_path / "capteurs_journal_999999999-0123456789ab.jsonl"
+    journal.write_text(json.dumps({"jour": "2024-01-01", "capteur": "salon", "heure": 7, "valeur": 19.0}) + "\n")
+    buffer = main.CapteurBuffer(str(tmp_path), 30, 1000)
+
+    def fail(rows):
+        raise RuntimeError("base indisponible")
+
+    monkeypatch.setattr(buffer, "_write", fail)
+    try:
+        buffer.replay_journals()
+    except RuntimeError:
+        pass
+    assert journal.exists()
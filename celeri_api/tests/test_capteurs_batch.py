@@ -0,0 +1,74 @@
+from datetime import date
+
+import main
+from conftest import FakeCursor
+
+
+def test_upsert_capteur_rows_groups_by_hour_set_and_chunks():
+    rows = {
+        (date(2024, 1, 1), "salon"): {7: 19.5, 8: 20.0},
+        (date(2024, 1, 1), "chambre"): {8: 18.0, 7: 17.5},
+        (date(2024, 1, 2), "salon"): {7: 19.0, 8: 20.5},
+        (date(2024, 1, 1), "exterieur"): {12: 5.0},
+    }
+    cursor = FakeCursor()
+    statements = main.upsert_capteur_rows(cursor, rows, chunk_size=2)
+
+    # heures {7, 8} : 3 lignes en 2 paquets ; heures {12} : 1 paquet
+    assert statements == 3
+    sql = [operation for operation, _ in cursor.executed]
+    assert sum("(jour, capteur, h07, h08)" in s for s in sql) == 2
+    assert sum("(jour, capteur, h12)" in s for s in sql) == 1
+    assert all("ON DUPLICATE KEY UPDATE" in s for s in sql)
+
+    first = cursor.executed[0][1]
+    assert first == [date(2024, 1, 1), "salon", 19.5, 20.0, date(2024, 1, 1), "chambre", 17.5, 18.0]
+
+
+def test_upsert_capteur_rows_empty():
+    cursor = FakeCursor()
+    assert main.upsert_capteur_rows(cursor, {}) == 0
+    assert cursor.executed == []
+
+
+def _reset_unique_key(monkeypatch, state):
+    monkeypatch.setattr(main, "_capteurs_unique_key", state)
+    monkeypatch.setattr(main, "_capteurs_unique_key_checked", 0.0)
+
+
+def test_ensure_schema_creates_capteurs_unique_key(fake_db, monkeypatch):
+    _reset_unique_key(monkeypatch, None)
+    main.ensure_schema()
+    assert fake_db.statements("CREATE UNIQUE INDEX uq_capteurs_jour_capteur ON capteurs (jour, capteur)")
+    assert main._capteurs_unique_key is True
+
+
+def test_batch_never_creates_the_unique_key(client, fake_db, monkeypatch):
+    _reset_unique_key(monkeypatch, None)
+    lecture = {"capteur": "salon", "jour": "2024-01-01", "heure": 7, "valeur": 19.5}
+
+    response = client.post("/capteurs/batch", json={"lectures": [lecture]})
+    assert response.status_code == 503
+    assert fake_db.statements("information_schema.STATISTICS")
+    assert not fake_db.statements("CREATE")
+
+    fake_db.answer("information_schema.STATISTICS", [("uq_capteurs_jour_capteur", 0, "jour,capteur")])
+    assert client.post("/capteurs/batch", json={"lectures": [lecture]}).status_code == 200
+    assert fake_db.statements("INSERT INTO capteurs")
+    assert not fake_db.statements("CREATE")
+
+
+def test_failed_unique_key_is_not_rechecked_on_every_write(fake_db, monkeypatch):
+    _reset_unique_key(monkeypatch, None)
+    def duplicates(sql, params):
+        raise main.mysql.connector.Error("Duplicate entry '2024-01-01-salon'")
+
+    fake_db.answer("CREATE UNIQUE INDEX", duplicates)
+    main.ensure_schema()
+    assert main._capteurs_unique_key is False
+
+    fake_db.executed.clear()
+    cursor = FakeCursor(fake_db)
+    assert main.capteurs_unique_key(cursor) is False
+    assert main.capteurs_unique_key(cursor) is False
+    assert fake_db.executed == []
@@ -0,0 +1,48 @@
+from datetime import date
+from decimal import Decimal
+
+import mysql.connector
+
+import main
+
+
+def _row(jour, valeur):
+    return (jour, *([Decimal(valeur)] + [None] * 23))
+
+
+def test_series_streams_rows_and_releases_connection(client, fake_db):
+    fake_db.answer("FROM capteurs", [_row(date(2024, 3, 5), "19.5"), _row(date(2024, 3, 6), "20.0")])
+    response = client.get("/capteurs/salon/series", params={"from": "2024-03-05", "to": "2024-03-06"})
+    assert response.status_code == 200
+    assert response.text.splitlines() == [
+        '{"t": "2024-03-05T00:00:00+01:00", "valeur": 19.5}',
+        '{"t": "2024-03-06T00:00:00+01:00", "valeur": 20.0}',
+    ]
+    stats = main.get_pool().stats()
+    assert (stats["checked_out"], stats["idle"]) == (0, 1)
+
+
+def test_series_returns_503_on_pool_timeout(client):
+    pool = main.get_pool()
+    held = [pool.acquire(), pool.acquire()]
+    try:
+        response = client.get("/capteurs/salon/series", params={"from": "2024-03-05", "to": "2024-03-06"})
+        assert response.status_code == 503
+    finally:
+        for conn in held:
+            pool.release(conn)
+
+
+def test_series_returns_500_on_query_error(client, fake_db):
+    fake_db.fail = mysql.connector.errors.ProgrammingError("Table 'capteurs' doesn't exist")
+    response = client.get("/capteurs/salon/series", params={"from": "2024-03-05", "to": "2024-03-06"})
+    assert response.status_code == 500
+    stats = main.get_pool().stats()
+    assert (stats["checked_out"], stats["discarded"]) == (0, 1)
+
+
+def test_series_filename_is_sanitized():
+    disposition = main.series_disposition('sa"lon\r\nX: é', date(2024, 3, 5), date(2024, 3, 6), main.SeriesFormatEnum.csv)
+    assert "\r" not in disposition and "\n" not in disposition
+    assert disposition.startswith('inline; filename="sa_lon__X____2024-03-05_2024-03-06.csv";')
+    assert disposition.endswith("filename*=UTF-8''sa%22lon%0D%0AX%3A%20%C3%A9_2024-03-05_2024-03-06.csv")
@@ -0,0 +1,49 @@
+from datetime import date
+
+import main
+
+
+def _row(capteur, jour, valeurs):
+    heures = [None] * 24
+    for heure, valeur in valeurs.items():
+        heures[heure] = valeur
+    return (capteur, jour, *heures)
+
+
+def test_capteurs_statistiques_by_month():
+    rows = [
+        _row("salon", date(2024, 1, 1), {0: 10.0, 1: 20.0}),
+        _row("salon", date(2024, 1, 2), {0: 30.0}),
+        _row("salon", date(2024, 2, 1), {5: 15.0}),
+        _row("vide", date(2024, 1, 1), {}),
+    ]
+    result = main.capteurs_statistiques(rows, "mois", (0, 50, 100))
+
+    janvier, fevrier = result["salon"]
+    assert (janvier["annee"], janvier["mois"]) == (2024, 1)
+    assert janvier["moyenne"] == 20.0
+    assert (janvier["min"], janvier["max"]) == (10.0, 30.0)
+    assert (janvier["p0"], janvier["p50"], janvier["p100"]) == (10.0, 20.0, 30.0)
+    assert (janvier["nb_valeurs"], janvier["nb_jours"]) == (3, 2)
+    assert janvier["profil"][:3] == [20.0, 20.0, None]
+    assert (fevrier["mois"], fevrier["p50"], fevrier["nb_jours"]) == (2, 15.0, 1)
+
+    # aucune valeur : statistiques nulles, jours comptés
+    vide, = result["vide"]
+    assert vide["moyenne"] is None and vide["p50"] is None and vide["nb_valeurs"] == 0
+    assert vide["nb_jours"] == 1
+
+
+def test_capteurs_statistiques_by_year_and_empty():
+    rows = [
+        _row("salon", date(2023, 12, 31), {0: 1.0}),
+        _row("salon", date(2024, 1, 1), {0: 2.0}),
+        _row("salon", date(2024, 6, 1), {0: 4.0}),
+    ]
+    result = main.capteurs_statistiques(rows, "annee", (50,))
+    assert [(entry["annee"], entry["p50"], entry["nb_jours"]) for entry in result["salon"]] == [
+        (2023, 1.0, 1),
+        (2024, 3.0, 2),
+    ]
+    assert "mois" not in result["salon"][0]
+    assert main.capteurs_statistiques([], "mois") == {}
@@ -0,0 +1,60 @@
+from datetime import date
+
+import main
+
+
+def _selects(fake_db, table):
+    return [sql for sql, _ in fake_db.executed if sql.startswith("SELECT jour") and f"FROM {table}" in sql]
+
+
+def test_put_updates_the_worker_without_reload(client, fake_db):
+    fake_db.answer("FROM presence", [(date(2024, 1, 5), 0)])
+    assert client.get("/presence/2024-01-05").json() == {"jour": "2024-01-05", "presence": False}
+
+    fake_db.answer("SELECT COUNT(*)", [(1,)])
+    assert client.put("/presence/2024-01-05", json={"presence": True}).status_code == 200
+    assert fake_db.statements("UPDATE presence SET presence")
+    assert client.get("/presence/2024-01-05").json()["presence"] is True
+    assert len(_selects(fake_db, "presence")) == 1
+
+
+def test_failed_write_leaves_memory_unchanged(client, fake_db):
+    fake_db.answer("FROM presence", [(date(2024, 1, 5), 0)])
+    assert client.get("/presence/2024-01-05").json()["presence"] is False
+
+    def fail(sql, params):
+        raise RuntimeError("verrou")
+
+    fake_db.answer("SELECT COUNT(*)", [(1,)])
+    fake_db.answer("UPDATE presence", fail)
+    assert client.put("/presence/2024-01-05", json={"presence": True}).status_code == 500
+    assert ("ROLLBACK", None) in fake_db.executed
+    assert client.get("/presence/2024-01-05").json()["presence"] is False
+
+
+def test_write_from_another_worker_invalidates(client, fake_db, tmp_path):
+    fake_db.answer("FROM presence", [(date(2024, 1, 5), 0)])
+    assert client.get("/presence/2024-01-05").json()["presence"] is False
+
+    # autre worker : même répertoire de signaux, sa propre mémoire
+    autre = main.DayFlagStore(str(tmp_path), 0)
+    autre.write("presence", {date(2024, 1, 5): True})
+    fake_db.answer("FROM presence", [(date(2024, 1, 5), 1)])
+
+    assert client.get("/presence/2024-01-05").json()["presence"] is True
+    assert len(_selects(fake_db, "presence")) == 2
+    # les autres flags ne sont pas rechargés
+    client.get("/cheminee/2024-01-05")
+    client.get("/cheminee/2024-01-05")
+    assert len(_selects(fake_db, "cheminee")) == 1
+
+
+def test_stats_count_bitmaps_after_write(client, fake_db):
+    fake_db.answer("FROM teletravail", [(date(2024, 1, 2), 1), (date(2024, 1, 3), 1), (date(2024, 2, 1), 0)])
+    assert client.get("/stats/teletravail/mois").status_code == 200
+    fake_db.answer("SELECT COUNT(*)", [(1,)])
+    client.put("/teletravail/2024-02-01", json={"teletravail": True})
+
+    data = client.get("/stats/teletravail/mois").json()["data"]
+    assert [list(row.values()) for row in data] == [[2024, 1, 2], [2024, 2, 1]]
+    assert len(_selects(fake_db, "teletravail")) == 1
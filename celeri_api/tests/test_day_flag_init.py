@@ -0,0 +1,41 @@
+from datetime import date
+
+import main
+
+
+def test_init_writes_chunked_upserts_and_weekend_value(client, fake_db):
+    response = client.post("/presence/init", json={
+        "start": "2024-01-01", "end": "2024-01-10", "valeur": True, "weekend": False, "chunk_size": 4,
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["jours"] == 10
+    assert "lignes_affectees" in body and "lignes_ecrites" not in body
+
+    inserts = fake_db.statements("INSERT INTO presence")
+    assert len(inserts) == 3
+    assert all("ON DUPLICATE KEY UPDATE" in sql for sql, _ in inserts)
+    params = [value for _, chunk in inserts for value in chunk]
+    valeurs = dict(zip(params[::2], params[1::2]))
+    assert valeurs[date(2024, 1, 5)] is True
+    assert valeurs[date(2024, 1, 6)] is False  # samedi
+    assert fake_db.executed[-1] == ("COMMIT", None)
+
+
+def test_init_rejects_invalid_payloads(client, fake_db):
+    for payload in [
+        {"start": "2024-01-10", "end": "2024-01-01"},
+        {"start": 20240101, "end": "2024-01-02"},
+        {"start": "2024-1-1"},
+        {"start": "2000-01-01", "end": "2024-01-01"},
+        {"start": "2024-01-01", "end": "2024-01-02", "chunk_size": 0},
+    ]:
+        assert client.post("/presence/init", json=payload).status_code == 400, payload
+    assert fake_db.executed == []
+
+
+def test_init_clamps_chunk_size(client, fake_db, monkeypatch):
+    monkeypatch.setattr(main, "BULK_CHUNK_MAX", 100)
+    response = client.post("/presence/init", json={"start": "2024-01-01", "end": "2024-12-31", "chunk_size": 99999})
+    assert response.status_code == 200
+    assert [len(params) // 2 for _, params in fake_db.statements("INSERT INTO presence")] == [100, 100, 100, 66]
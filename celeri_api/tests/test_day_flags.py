@@ -0,0 +1,59 @@
+from datetime import date
+
+import main
+
+
+def test_day_bit_is_day_of_year():
+    assert main._day_bit(date(2024, 1, 1)) == 1
+    assert main._day_bit(date(2024, 2, 1)) == 1 << 31
+    # 31 décembre d'une année bissextile : bit 365
+    assert main._day_bit(date(2024, 12, 31)) == 1 << 365
+    assert main._day_bit(date(2023, 12, 31)) == 1 << 364
+
+
+def test_with_days_sets_known_and_values():
+    years = main._with_days({}, {date(2024, 3, 1): True, "2024-03-02": False, date(2025, 1, 1): True})
+    assert main.day_flag_value(years, date(2024, 3, 1)) is True
+    assert main.day_flag_value(years, date(2024, 3, 2)) is False
+    assert main.day_flag_value(years, date(2024, 3, 3)) is None
+    assert main.day_flag_value(years, date(2025, 1, 1)) is True
+    assert main.day_flag_value(years, date(2026, 1, 1)) is None
+
+
+def test_with_days_returns_a_copy_and_none_keeps_value():
+    years = main._with_days({}, {date(2024, 5, 1): True})
+    updated = main._with_days(years, {date(2024, 5, 1): None, date(2024, 5, 2): None, date(2024, 5, 3): False})
+    # None : jour connu, valeur inchangée (False pour un jour nouveau)
+    assert main.day_flag_value(updated, date(2024, 5, 1)) is True
+    assert main.day_flag_value(updated, date(2024, 5, 2)) is False
+    assert main.day_flag_value(updated, date(2024, 5, 3)) is False
+    assert main.day_flag_value(years, date(2024, 5, 2)) is None
+
+    cleared = main._with_days(updated, {date(2024, 5, 1): False})
+    assert main.day_flag_value(cleared, date(2024, 5, 1)) is False
+    assert main.day_flag_value(updated, date(2024, 5, 1)) is True
+
+
+def test_leap_year_last_day():
+    years = main._with_days({}, {date(2024, 12, 31): True, date(2024, 2, 29): True})
+    assert main.day_flag_value(years, date(2024, 12, 31)) is True
+    assert main.day_flag_value(years, date(2024, 2, 29)) is True
+    assert main.day_flag_counts(years) == {(2024, 2): 1, (2024, 12): 1}
+    assert main.day_flag_range(years, date(2024, 12, 30), date(2025, 1, 2)) == {date(2024, 12, 31): True}
+
+
+def test_day_flag_counts_per_month():
+    values = {date(2024, 1, d): True for d in range(1, 32)}
+    values.update({date(2024, 2, d): d % 2 == 0 for d in range(1, 30)})
+    values[date(2023, 12, 31)] = True
+    values[date(2024, 3, 1)] = False
+    years = main._with_days({}, values)
+    assert main.day_flag_counts(years) == {(2023, 12): 1, (2024, 1): 31, (2024, 2): 14}
+
+
+def test_day_flag_range_keeps_only_known_days():
+    years = main._with_days({}, {date(2024, 1, 1): True, date(2024, 1, 3): False, date(2024, 1, 10): True})
+    assert main.day_flag_range(years, date(2024, 1, 2), date(2024, 1, 10)) == {
+        date(2024, 1, 3): False,
+        date(2024, 1, 10): True,
+    }
@@ -0,0 +1,48 @@
+import io
+import json
+import logging
+
+import main
+
+
+def _writer(formatter):
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(formatter)
+    writer = main.LogWriter(handler)
+    log = logging.getLogger("celeri.tests.logging")
+    log.handlers = [writer.queue_handler]
+    log.propagate = False
+    log.setLevel(logging.DEBUG)
+    writer.start()
+    return writer, log, stream
+
+
+def test_json_log_keeps_exception_from_queue():
+    writer, log, stream = _writer(main.JsonLogFormatter())
+    try:
+        raise ValueError("valeur invalide")
+    except ValueError:
+        log.exception("❌ Erreur %s", "/capteurs/heure")
+    writer.stop()
+
+    entry = json.loads(stream.getvalue())
+    assert entry["message"] == "❌ Erreur /capteurs/heure"
+    assert entry["level"] == "ERROR"
+    assert "Traceback" in entry["exception"] and "ValueError: valeur invalide" in entry["exception"]
+
+
+def test_record_is_formatted_by_the_writer_thread():
+    formatted = []
+
+    class Formatter(logging.Formatter):
+        def format(self, record):
+            formatted.append((record.msg, record.args))
+            return super().format(record)
+
+    writer, log, stream = _writer(Formatter("%(message)s"))
+    log.info("🌡️ %s lecture(s)", 3)
+    writer.stop()
+
+    assert formatted == [("🌡️ %s lecture(s)", (3,))]
+    assert stream.getvalue() == "🌡️ 3 lecture(s)\n"
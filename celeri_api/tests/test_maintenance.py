@@ -0,0 +1,70 @@
+from datetime import date
+
+import pytest
+
+import main
+
+CUTOFF = date(2024, 1, 1)
+
+
+@pytest.fixture
+def purged(monkeypatch, tmp_path):
+    # capteurs conservés à partir de janvier 2024, décembre 2023 déjà agrégé et purgé
+    monkeypatch.setattr(main, "capteurs_cutoff", lambda: CUTOFF)
+    monkeypatch.setattr(main, "_rollup_ready", True)
+    monkeypatch.setattr(main, "_capteurs_unique_key", True)
+    monkeypatch.setattr(main, "_pause", lambda: None)
+    monkeypatch.setattr(main, "MAINTENANCE_STATE_PATH", str(tmp_path / "maintenance_state.json"))
+    main.write_json_atomic(main.MAINTENANCE_STATE_PATH, {"capteurs_aggregated": "2023-12-01"})
+
+
+def _stats_mois_writes(fake_db):
+    return fake_db.statements("DELETE FROM stats_mois WHERE") + fake_db.statements("INSERT INTO stats_mois (")
+
+
+def test_late_writes_into_purged_month_are_rejected(client, fake_db, purged):
+    response = client.post("/capteurs/heure", json={"capteur": "salon", "jour": "2023-06-10", "heure": 7, "valeur": 19.5})
+    assert response.status_code == 400
+    lectures = [
+        {"capteur": "salon", "jour": "2024-01-02", "heure": 7, "valeur": 19.5},
+        {"capteur": "salon", "jour": "2023-12-31", "heure": 7, "valeur": 19.0},
+    ]
+    response = client.post("/capteurs/batch", json={"lectures": lectures})
+    assert response.status_code == 400
+    assert "2023-12-31" in response.json()["detail"]
+    assert not fake_db.statements("capteurs")
+
+
+def test_buffered_rows_for_purged_month_are_dropped(fake_db, purged, tmp_path):
+    buffer = main.CapteurBuffer(str(tmp_path), 30, 500)
+    buffer._write({(date(2023, 12, 31), "salon"): {7: 19.0}, (date(2024, 1, 2), "salon"): {7: 19.5}})
+    (sql, params), = fake_db.statements("INSERT INTO capteurs")
+    assert params == [date(2024, 1, 2), "salon", 19.5]
+    (sql, params), = fake_db.statements("INSERT INTO stats_mois_dirty")
+    assert params == ["capteurs", "salon", 2024, 1]
+
+
+def test_maintenance_after_late_write_keeps_frozen_rollups(fake_db, purged):
+    # ligne tardive restée dans juin 2023 (écrite avant la purge du mois), puis maintenance
+    remaining = [date(2023, 6, 10)]
+    fake_db.answer("SELECT MIN(jour) FROM capteurs", lambda sql, params: [(remaining[0] if remaining else None,)])
+    fake_db.answer("SELECT MIN(jour), MAX(jour) FROM capteurs", [(date(2023, 6, 10), date(2024, 3, 5))])
+
+    def batch(sql, params):
+        return [(remaining.pop(), "salon")] if remaining else []
+
+    fake_db.answer("SELECT jour, capteur FROM capteurs", batch)
+    assert main.purge_capteurs(CUTOFF) == 1
+    assert fake_db.statements("DELETE FROM capteurs WHERE")
+    assert not _stats_mois_writes(fake_db)
+
+    # marque posée avant la purge : consommée sans recalcul
+    fake_db.answer("FROM stats_mois_dirty", [("capteurs", "salon", 2023, 6, 2)])
+    assert main.refresh_dirty_rollups() == 1
+    assert not fake_db.statements("GET_LOCK")
+    assert not _stats_mois_writes(fake_db)
+
+    # la reconstruction ne part que de l'horizon de rétention
+    main.rebuild_rollups(["capteurs"])
+    deletes = [params for _, params in fake_db.statements("DELETE FROM stats_mois WHERE")]
+    assert deletes == [("capteurs", 2024), ["capteurs", 2024, 1, 2025, 1]]
@@ -0,0 +1,50 @@
+import mysql.connector
+import pytest
+
+import main
+
+
+def test_pool_reuses_released_connection(fake_db):
+    pool = main.get_pool()
+    with main.db_connection() as conn:
+        conn.cursor().execute("SELECT 1")
+        assert pool.stats()["checked_out"] == 1
+    with main.db_connection():
+        pass
+    stats = pool.stats()
+    assert (stats["checked_out"], stats["idle"], stats["created"]) == (0, 1, 1)
+    assert fake_db.connections == 1
+
+
+def test_pool_discards_broken_connection(fake_db):
+    pool = main.get_pool()
+    fake_db.fail = mysql.connector.errors.OperationalError("MySQL server has gone away")
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        with main.db_connection() as conn:
+            conn.cursor().execute("SELECT 1")
+    stats = pool.stats()
+    assert (stats["checked_out"], stats["idle"], stats["discarded"]) == (0, 0, 1)
+
+
+def test_pool_timeout_when_exhausted(fake_db):
+    pool = main.get_pool()
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(main.PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+    for conn in held:
+        pool.release(conn)
+    pool.release(pool.acquire())
+
+
+def test_endpoint_returns_503_on_pool_timeout(client, monkeypatch):
+    monkeypatch.setattr(main, "fetch_calendars", lambda urls, max_age=0: {url: (None, False) for url in urls})
+    pool = main.get_pool()
+    held = [pool.acquire(), pool.acquire()]
+    try:
+        assert client.get("/presence/2024-01-05").status_code == 503
+        assert client.post("/presence/init", json={"start": "2024-01-01", "end": "2024-01-02"}).status_code == 503
+        assert client.post("/loue_sync_calendar").status_code == 503
+    finally:
+        for conn in held:
+            pool.release(conn)
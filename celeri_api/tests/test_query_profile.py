@@ -0,0 +1,25 @@
+import main
+
+
+def test_query_fingerprint_normalizes_values_and_whitespace():
+    assert main.query_fingerprint("SELECT  loue FROM airbnb_loue\n WHERE jour = %s") == \
+        "SELECT loue FROM airbnb_loue WHERE jour = ?"
+    assert main.query_fingerprint("SELECT * FROM capteurs WHERE capteur = 'salon' AND h07 > 19.5 LIMIT 10") == \
+        "SELECT * FROM capteurs WHERE capteur = ? AND h07 > ? LIMIT ?"
+    assert main.query_fingerprint("SELECT %(jour)s") == "SELECT ?"
+
+
+def test_query_fingerprint_collapses_lists():
+    one = main.query_fingerprint("SELECT * FROM capteurs WHERE capteur IN (%s, %s)")
+    many = main.query_fingerprint("SELECT * FROM capteurs WHERE capteur IN (%s, %s, %s, %s)")
+    assert one == many == "SELECT * FROM capteurs WHERE capteur IN (?+)"
+
+
+def test_query_fingerprint_collapses_multi_row_values():
+    two = main.query_fingerprint("INSERT INTO presence (jour, presence) VALUES (%s, %s), (%s, %s)")
+    three = main.query_fingerprint("INSERT INTO presence (jour, presence) VALUES (%s, %s), (%s, %s), (%s, %s)")
+    assert two == three == "INSERT INTO presence (jour, presence) VALUES (?+), ..."
+
+
+def test_query_fingerprint_keeps_identifiers_with_digits():
+    assert main.query_fingerprint("SELECT h00, h23 FROM capteurs") == "SELECT h00, h23 FROM capteurs"
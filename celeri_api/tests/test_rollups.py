@@ -0,0 +1,78 @@
+from datetime import date
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def rollups_ready(monkeypatch):
+    monkeypatch.setattr(main, "_rollup_ready", True)
+    monkeypatch.setattr(main, "_rollup_pending", set())
+    monkeypatch.setattr(main, "_capteurs_unique_key", True)
+
+
+def _position(fake_db, fragment):
+    return next(i for i, (sql, _) in enumerate(fake_db.executed) if fragment in sql)
+
+
+def test_write_marks_months_dirty_in_its_transaction(client, fake_db, rollups_ready):
+    lectures = [
+        {"capteur": "salon", "jour": "2024-01-31", "heure": 7, "valeur": 19.5},
+        {"capteur": "chambre", "jour": "2024-02-01", "heure": 7, "valeur": 18.0},
+    ]
+    assert client.post("/capteurs/batch", json={"lectures": lectures}).status_code == 200
+
+    (sql, params), = fake_db.statements("INSERT INTO stats_mois_dirty")
+    assert "ON DUPLICATE KEY UPDATE version = version + 1" in sql
+    assert params == [
+        "capteurs", "chambre", 2024, 1, "capteurs", "chambre", 2024, 2,
+        "capteurs", "salon", 2024, 1, "capteurs", "salon", 2024, 2,
+    ]
+    assert _position(fake_db, "INSERT INTO stats_mois_dirty") < _position(fake_db, "COMMIT")
+    # aucun recalcul ni verrou nommé pendant la requête
+    assert not fake_db.statements("GET_LOCK")
+    assert not fake_db.statements("stats_mois (")
+
+
+def test_failed_mark_rolls_back_the_write(client, fake_db, rollups_ready):
+    def fail(sql, params):
+        raise RuntimeError("Lock wait timeout exceeded")
+
+    fake_db.answer("INSERT INTO stats_mois_dirty", fail)
+    response = client.post("/capteurs/heure", json={"capteur": "salon", "jour": "2024-01-05", "heure": 7, "valeur": 19.5})
+    assert response.status_code == 500
+    assert ("ROLLBACK", None) in fake_db.executed
+    assert ("COMMIT", None) not in fake_db.executed
+
+
+def test_writes_before_tables_exist_are_kept_in_memory(fake_db, monkeypatch):
+    monkeypatch.setattr(main, "_rollup_ready", False)
+    monkeypatch.setattr(main, "_rollup_pending", set())
+    main.mark_rollups(main.InstrumentedCursor(fake_db.connect().cursor()), "rapport", [date(2024, 3, 2)])
+    assert main._rollup_pending == {("rapport", "", 2024, 3)}
+    assert fake_db.executed == []
+
+
+def test_refresh_consumes_only_unchanged_marks(fake_db, rollups_ready):
+    fake_db.answer("FROM stats_mois_dirty", [("capteurs", "salon", 2024, 1, 3), ("rapport", "", 2024, 1, 1)])
+    fake_db.answer("GET_LOCK", [(1,)])
+    fake_db.answer("FROM capteurs", [("salon", 2024, 1, 620.0, 31)])
+
+    assert main.refresh_dirty_rollups() == 2
+
+    upserts = fake_db.statements("INSERT INTO stats_mois (")
+    assert upserts[0][1] == ["capteurs", "salon", 2024, 1, 620.0, 31]
+    deletes = fake_db.statements("DELETE FROM stats_mois_dirty")
+    assert [params for _, params in deletes] == [("capteurs", "salon", 2024, 1, 3), ("rapport", "", 2024, 1, 1)]
+    assert all("version = %s" in sql for sql, _ in deletes)
+    # les capteurs sont recalculés par clés exactes, le rapport (métrique vide) en entier
+    capteurs_select = fake_db.statements("FROM capteurs")[0]
+    assert "capteur IN (%s)" in capteurs_select[0]
+
+
+def test_refresh_keeps_marks_when_lock_unavailable(fake_db, rollups_ready):
+    fake_db.answer("FROM stats_mois_dirty", [("rapport", "", 2024, 1, 1)])
+    fake_db.answer("GET_LOCK", [(0,)])
+    assert main.refresh_dirty_rollups() == 0
+    assert not fake_db.statements("DELETE FROM stats_mois_dirty")
@@ -0,0 +1,39 @@
+from datetime import date, timedelta
+
+
+def test_status_du_jour_reads_each_table_once_and_backfills(client, fake_db):
+    today = date.today()
+    hier, demain = today - timedelta(days=1), today + timedelta(days=1)
+    fake_db.answer("FROM presence", [(today, 1)])
+    fake_db.answer("FROM airbnb_loue", [(hier, 0), (today, 1)])
+
+    response = client.get("/api/status_du_jour")
+    assert response.status_code == 200
+    assert response.json() == {
+        "jour": today.isoformat(),
+        "presence": True,
+        "teletravail": False,
+        "cheminee": False,
+        "airbnb_hier": False,
+        "airbnb_aujourdhui": True,
+        "airbnb_demain": False,
+    }
+    selects = [sql for sql, _ in fake_db.executed if sql.startswith("SELECT")]
+    assert sorted(selects) == sorted(
+        f"SELECT jour, {column} FROM {table}"
+        for table, column in [("presence", "presence"), ("teletravail", "teletravail"),
+                              ("cheminee", "cheminee"), ("airbnb_loue", "loue")]
+    )
+    # jours absents ajoutés à False après la réponse, sans écraser une écriture concurrente
+    backfill = {sql.split()[3]: params for sql, params in fake_db.statements("INSERT IGNORE")}
+    assert backfill == {"teletravail": [today], "cheminee": [today], "airbnb_loue": [demain]}
+
+    # deuxième appel : tout est en mémoire, jours ajoutés compris
+    fake_db.executed.clear()
+    assert client.get("/api/status_du_jour").json()["presence"] is True
+    assert fake_db.executed == []
+
+
+def test_status_du_jour_database_error_is_500(client, fake_db):
+    fake_db.fail = RuntimeError("table absente")
+    assert client.get("/api/status_du_jour").status_code == 500